@@ -0,0 +1,296 @@
+# api_server.py
+# 本地 JSON HTTP 接口 (仅依赖标准库)：提供主数据、提前回款、账本和增长预测，供其他内部工具直接读取。
+# 读请求由多个线程并发处理，账本按 (店铺, 账本版本) 缓存在进程内共享；
+# 写请求全部经过 data_manager，并由一把进程内的锁串行执行。
+#
+#   python main.py serve --port 8765
+#   curl http://127.0.0.1:8765/api/ledger?start=2024-05-01
+#
+# GET    /api/stores
+# GET    /api/daily?start=&end=            GET    /api/early-payouts?start=&end=
+# GET    /api/ledger?start=&end=           GET    /api/latest           GET /api/prediction
+# POST   /api/daily                        POST   /api/early-payouts
+# DELETE /api/daily/<日期>                  DELETE /api/early-payouts/<payout_id>
+# 所有接口都接受 ?store=<店铺>，缺省为默认店铺。GET 响应带 ETag (由数据库的变更计数生成)，
+# 客户端带 If-None-Match 再次请求时，数据未变化则返回 304。
+
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import numpy as np
+import pandas as pd
+
+import data_manager
+import finance_calculator
+import growth_predictor
+import payout_schedule
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8765
+LEDGER_CACHE_SIZE = 8
+MAX_BODY_BYTES = 1 << 20
+
+# 写操作串行执行：同一进程内的并发写不会争抢 SQLite 的写锁，也不会交错刷新账本
+_write_lock = threading.Lock()
+# 共享的账本缓存：(店铺, 账本版本) -> {'ledger': DataFrame, 'prediction': dict}
+_ledger_cache = OrderedDict()
+_ledger_cache_lock = threading.Lock()
+
+
+class ApiError(Exception):
+    """带 HTTP 状态码的请求错误。"""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def _to_json_value(value):
+    """json.dumps 的 default：日期转为 YYYY-MM-DD，numpy 标量转为 Python 数值。"""
+    if isinstance(value, pd.Timestamp):
+        return value.strftime('%Y-%m-%d')
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError(f"无法序列化的类型: {type(value).__name__}")
+
+
+def _records(df: pd.DataFrame) -> list:
+    """DataFrame 转为记录列表；日期列格式化为字符串，缺失值为 null。"""
+    df = df.copy()
+    for column in df.columns:
+        if pd.api.types.is_datetime64_any_dtype(df[column]):
+            df[column] = df[column].dt.strftime('%Y-%m-%d')
+    return df.astype(object).where(df.notna(), None).to_dict('records')
+
+
+def _cached_ledger(store, version) -> dict:
+    """返回店铺账本的缓存条目；版本变化后首次读取时从物化账本加载。"""
+    key = (store, version)
+    with _ledger_cache_lock:
+        if key in _ledger_cache:
+            _ledger_cache.move_to_end(key)
+            return _ledger_cache[key]
+
+    # 加载不持有锁，其他店铺或已缓存版本的读请求不会被阻塞
+    entry = {'ledger': data_manager.load_computed_ledger(store=store), 'prediction': None}
+    with _ledger_cache_lock:
+        entry = _ledger_cache.setdefault(key, entry)
+        _ledger_cache.move_to_end(key)
+        while len(_ledger_cache) > LEDGER_CACHE_SIZE:
+            _ledger_cache.popitem(last=False)
+    return entry
+
+
+def _slice_dates(df: pd.DataFrame, column: str, start, end) -> pd.DataFrame:
+    if df.empty:
+        return df
+    mask = pd.Series(True, index=df.index)
+    if start is not None:
+        mask &= df[column] >= pd.Timestamp(start)
+    if end is not None:
+        mask &= df[column] <= pd.Timestamp(end)
+    return df[mask]
+
+
+class ApiHandler(BaseHTTPRequestHandler):
+    server_version = 'FinanceCompassAPI/1.0'
+    protocol_version = 'HTTP/1.1'
+
+    # --- 请求解析 ---
+
+    def _parse(self):
+        parts = urlsplit(self.path)
+        segments = [s for s in parts.path.split('/') if s]
+        if segments[:1] != ['api']:
+            raise ApiError(HTTPStatus.NOT_FOUND, f"未知路径: {parts.path}")
+        query = {key: values[-1] for key, values in parse_qs(parts.query).items()}
+        return segments[1:], query
+
+    def _store(self, query):
+        store = query.get('store') or None
+        if store is not None and store not in data_manager.list_stores():
+            raise ApiError(HTTPStatus.NOT_FOUND, f"店铺 {store} 不存在。")
+        data_manager.init_db(store)
+        return store
+
+    def _date_param(self, query, name):
+        value = query.get(name)
+        if value is None:
+            return None
+        try:
+            return pd.Timestamp(value).strftime('%Y-%m-%d')
+        except ValueError:
+            raise ApiError(HTTPStatus.BAD_REQUEST, f"参数 {name} 不是有效日期: {value}")
+
+    def _read_body(self) -> dict:
+        length = int(self.headers.get('Content-Length') or 0)
+        if length > MAX_BODY_BYTES:
+            raise ApiError(HTTPStatus.REQUEST_ENTITY_TOO_LARGE, "请求体过大。")
+        try:
+            body = json.loads(self.rfile.read(length) or b'{}')
+        except json.JSONDecodeError as e:
+            raise ApiError(HTTPStatus.BAD_REQUEST, f"请求体不是有效的 JSON: {e}")
+        if not isinstance(body, dict):
+            raise ApiError(HTTPStatus.BAD_REQUEST, "请求体必须是 JSON 对象。")
+        return body
+
+    # --- 响应 ---
+
+    def _send_json(self, status, payload, etag=None):
+        body = json.dumps(payload, ensure_ascii=False, default=_to_json_value).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        if etag is not None:
+            self.send_header('ETag', etag)
+            self.send_header('Cache-Control', 'no-cache')
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _not_modified(self, etag) -> bool:
+        """客户端缓存的 ETag 与当前版本一致时返回 304。"""
+        if etag not in [tag.strip() for tag in self.headers.get('If-None-Match', '').split(',')]:
+            return False
+        self.send_response(HTTPStatus.NOT_MODIFIED)
+        self.send_header('ETag', etag)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+        return True
+
+    def _handle(self, dispatch):
+        try:
+            dispatch()
+        except ApiError as e:
+            self._send_json(e.status, {'error': str(e)})
+        except (ValueError, TypeError, KeyError) as e:
+            self._send_json(HTTPStatus.BAD_REQUEST, {'error': str(e)})
+        except Exception as e:
+            self.log_error("处理请求失败: %s", e)
+            self._send_json(HTTPStatus.INTERNAL_SERVER_ERROR, {'error': str(e)})
+
+    # --- GET ---
+
+    def do_GET(self):
+        self._handle(self._get)
+
+    def _get(self):
+        segments, query = self._parse()
+        if segments == ['stores']:
+            self._send_json(HTTPStatus.OK, {'stores': data_manager.list_stores()})
+            return
+        if len(segments) != 1 or segments[0] not in ('daily', 'early-payouts', 'ledger', 'latest', 'prediction'):
+            raise ApiError(HTTPStatus.NOT_FOUND, f"未知路径: {self.path}")
+
+        resource = segments[0]
+        store = self._store(query)
+        start, end = self._date_param(query, 'start'), self._date_param(query, 'end')
+        versions = data_manager.get_data_versions(store)
+        tables = {'daily': [data_manager.DAILY_TABLE], 'early-payouts': [data_manager.EARLY_PAYOUT_TABLE]}.get(resource)
+        version = (tuple(versions[table] for table in tables) if tables is not None
+                   else data_manager.get_ledger_version(store))
+        # HTTP 头只能是 ASCII (店铺名可能是中文)，因此 ETag 取请求参数和版本号的哈希
+        etag_key = f"{resource}|{store or data_manager.DEFAULT_STORE}|{version}|{start}|{end}"
+        etag = f'"{hashlib.sha1(etag_key.encode("utf-8")).hexdigest()[:20]}"'
+        if self._not_modified(etag):
+            return
+
+        if resource == 'daily':
+            payload = {'rows': _records(data_manager.load_data_range(start, end, store=store))}
+        elif resource == 'early-payouts':
+            payload = {'rows': _records(data_manager.load_early_payouts_range(start, end, store=store))}
+        else:
+            entry = _cached_ledger(store, version)
+            df_ledger = entry['ledger']
+            if resource == 'ledger':
+                payload = {'rows': _records(_slice_dates(df_ledger, 'Date', start, end))}
+            elif resource == 'latest':
+                payload = {'latest': _records(df_ledger.tail(1))[0] if not df_ledger.empty else None}
+            else:
+                if entry['prediction'] is None:
+                    payout_delay_days = payout_schedule.max_delay(data_manager.get_payout_kernel(store))
+                    entry['prediction'] = growth_predictor.analyze_growth(df_ledger, payout_delay_days)
+                payload = {'prediction': entry['prediction']}
+        self._send_json(HTTPStatus.OK, payload, etag=etag)
+
+    # --- POST / DELETE (串行写入) ---
+
+    def do_POST(self):
+        self._handle(self._post)
+
+    def _post(self):
+        segments, query = self._parse()
+        body = self._read_body()  # 先读完请求体，出错时连接仍可复用
+        store = self._store(query)
+        if segments == ['daily']:
+            order_count, total_cost = int(body['order_count']), float(body['total_cost'])
+            total_profit, refunds = float(body['total_profit']), float(body.get('refunds', 0.0))
+            other_income = float(body.get('other_income', 0.0))
+            # 校验失败抛出的 ValueError 由 _handle 转为 400
+            data_manager.validate_daily_values(order_count, total_cost, total_profit, refunds, other_income)
+            with _write_lock:
+                data_manager.save_daily_data(
+                    self._required_date(body, 'date'), order_count, total_cost,
+                    total_profit, refunds, refunds * finance_calculator.AVERAGE_PROFIT_MARGIN,
+                    other_income, str(body.get('notes', '')), store=store)
+        elif segments == ['early-payouts']:
+            amount = float(body['amount'])
+            data_manager.validate_early_payout_amount(amount)
+            original_date = body.get('original_order_date')
+            with _write_lock:
+                data_manager.save_early_payout(self._required_date(body, 'payout_date'),
+                                               self._date_param(body, 'original_order_date') if original_date else None,
+                                               amount, store=store)
+        else:
+            raise ApiError(HTTPStatus.NOT_FOUND, f"未知路径: {self.path}")
+        self._send_json(HTTPStatus.CREATED, {'versions': data_manager.get_data_versions(store)})
+
+    def _required_date(self, body, name):
+        if not body.get(name):
+            raise ApiError(HTTPStatus.BAD_REQUEST, f"缺少字段: {name}")
+        return self._date_param(body, name)
+
+    def do_DELETE(self):
+        self._handle(self._delete)
+
+    def _delete(self):
+        segments, query = self._parse()
+        store = self._store(query)
+        if len(segments) == 2 and segments[0] == 'daily':
+            date_str = self._date_param({'date': segments[1]}, 'date')
+            with _write_lock:
+                if not data_manager.check_date_exists(date_str, store=store):
+                    raise ApiError(HTTPStatus.NOT_FOUND, f"日期 {date_str} 没有主数据。")
+                data_manager.delete_data_by_date(date_str, store=store)
+        elif len(segments) == 2 and segments[0] == 'early-payouts' and segments[1].isdigit():
+            with _write_lock:
+                if not data_manager.delete_early_payout_by_id(int(segments[1]), store=store):
+                    raise ApiError(HTTPStatus.NOT_FOUND, f"未找到ID为 {segments[1]} 的记录。")
+        else:
+            raise ApiError(HTTPStatus.NOT_FOUND, f"未知路径: {self.path}")
+        self._send_json(HTTPStatus.OK, {'versions': data_manager.get_data_versions(store)})
+
+
+def make_server(host=DEFAULT_HOST, port=DEFAULT_PORT) -> ThreadingHTTPServer:
+    """创建 (尚未启动的) 多线程 HTTP 服务；port 为 0 时由系统分配端口。"""
+    data_manager.init_db()
+    server = ThreadingHTTPServer((host, port), ApiHandler)
+    server.daemon_threads = True
+    return server
+
+
+def serve(host=DEFAULT_HOST, port=DEFAULT_PORT):
+    """启动服务并阻塞，直到 Ctrl+C。"""
+    server = make_server(host, port)
+    print(f"接口服务已启动: http://{server.server_address[0]}:{server.server_address[1]}/api/ (Ctrl+C 停止)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        print("接口服务已停止。")
@@ -2,13 +2,22 @@
 
 import streamlit as st
 import pandas as pd
-from datetime import datetime, date
+from datetime import datetime, date, timedelta
+from functools import partial, wraps
+import matplotlib
+matplotlib.use('Agg')  # 图表在后台线程中渲染，只能使用无界面的后端
 
 # 导入我们自己的模块
+import background
+import columnar_snapshot
 import data_manager
 import finance_calculator
 import growth_predictor
 import reporter
+import importer
+import payout_schedule
+import sensitivity_analyzer
+import profiler
 
 # --- 页面基础设置 ---
 st.set_page_config(
@@ -20,31 +29,237 @@ st.set_page_config(
 st.title("🧭 E-commerce 财务罗盘")
 st.caption("一个根据实际运营数据，提供财务分析与增长建议的智能助手。")
 
-# 初始化数据库
-data_manager.init_db()
-
-# --- 侧边栏导航 (最终版) ---
+# --- 侧边栏：店铺与导航 ---
 st.sidebar.title("导航")
+# 新建店铺后自动切换过去 (选择框创建之前才能修改它的值)
+if "pending_store" in st.session_state:
+    st.session_state["store"] = st.session_state.pop("pending_store")
+stores = data_manager.list_stores()
+store = st.sidebar.selectbox("当前店铺", stores, key="store")
+
+# 初始化数据库 (同一进程内每个店铺只会真正执行一次，之后的 rerun 直接返回)
+data_manager.init_db(store)
+
 page = st.sidebar.radio(
     "选择一个页面",
-    ["📊 仪表盘 & 报告", "✍️ 录入每日数据", "📈 管理提前回款", "🗑️ 删除每日数据"] # <-- 最终页面结构
+    ["📊 仪表盘 & 报告", "✍️ 录入每日数据", "📥 批量导入订单", "📈 管理提前回款", "🗑️ 删除每日数据", "🎛️ 敏感性分析"] # <-- 最终页面结构
 )
 
-# --- 全局数据加载 ---
-@st.cache_data
-def load_data():
-    """加载所有数据并缓存"""
-    df_history = data_manager.load_all_data()
-    df_early = data_manager.load_all_early_payouts()
-    return df_history, df_early
-
-df_history, df_early = load_data()
-
-# 计算财务数据
-if not df_history.empty or not df_early.empty:
-    df_calculated = finance_calculator.calculate_finances(df_history.copy(), df_early.copy())
+with st.sidebar.expander("🏬 店铺管理"):
+    new_store = st.text_input("新店铺名称")
+    new_store_cash = st.number_input("新店铺期初资金", min_value=0.0, value=finance_calculator.INITIAL_CASH,
+                                     step=100.0, format="%.2f")
+    if st.button("新建店铺"):
+        try:
+            data_manager.create_store(new_store, new_store_cash)
+        except ValueError as e:
+            st.error(str(e))
+        else:
+            st.session_state["pending_store"] = new_store.strip()
+            st.rerun()
+
+    current_cash = data_manager.get_store_initial_cash(store)
+    store_cash = st.number_input(f"{store} 的期初资金", min_value=0.0, value=float(current_cash), step=100.0, format="%.2f")
+    if st.button("保存期初资金", disabled=store_cash == current_cash):
+        data_manager.set_store_initial_cash(store_cash, store)
+        st.rerun()
+
+    if st.button("重算所有店铺账本"):
+        with st.spinner("正在并行计算各店铺账本..."):
+            row_counts = data_manager.refresh_store_ledgers(rebuild=True)
+        st.success(f"已重算 {len(row_counts)} 个店铺，共 {sum(row_counts.values())} 行账本。")
+
+with st.sidebar.expander("🚚 回款渠道"):
+    st.caption(f"每个渠道的销售占比和回款分布；不配置时所有订单在 {finance_calculator.PAYOUT_DELAY_DAYS} 天后全额回款。"
+               "参数格式：" + "；".join(f"{payout_schedule.KERNEL_KINDS[kind]} {hint}"
+                                    for kind, hint in payout_schedule.KERNEL_PARAM_HINTS.items()))
+    # 表格里显示分布类型的中文名称，保存时再换回类型键
+    kind_by_name = {name: kind for kind, name in payout_schedule.KERNEL_KINDS.items()}
+    df_channels = data_manager.get_payout_channels(store).rename(
+        columns={'channel': '渠道', 'share': '占比', 'kind': '分布', 'params': '参数'})
+    df_channels['分布'] = df_channels['分布'].map(payout_schedule.KERNEL_KINDS)
+    edited_channels = st.data_editor(
+        df_channels, num_rows="dynamic", use_container_width=True, hide_index=True, key=f"payout_channels_{store}",
+        column_config={
+            '占比': st.column_config.NumberColumn('占比', min_value=0.0, format="%.2f"),
+            '分布': st.column_config.SelectboxColumn('分布', options=list(kind_by_name),
+                                                   default=payout_schedule.KERNEL_KINDS['fixed']),
+        },
+    )
+    if st.button("保存回款渠道"):
+        rows = edited_channels.dropna(subset=['渠道']).fillna(
+            {'占比': 1.0, '分布': payout_schedule.KERNEL_KINDS['fixed'], '参数': ''})
+        rows['分布'] = rows['分布'].map(kind_by_name)
+        try:
+            data_manager.set_payout_channels(rows[['渠道', '占比', '分布', '参数']].itertuples(index=False, name=None), store)
+        except ValueError as e:
+            st.error(str(e))
+        else:
+            st.rerun()
+    kernel = data_manager.get_payout_kernel(store)
+    st.bar_chart(pd.Series(kernel, name='回款比例'), height=150)
+    st.caption(f"平均回款天数 {(kernel * range(len(kernel))).sum():.1f} 天，最晚 {payout_schedule.max_delay(kernel)} 天。")
+    if data_manager.get_business_calendar() is not None:
+        st.caption(f"已启用营业日历 ({data_manager.calendar_file()})：周末和节假日到期的回款顺延到下一个营业日。")
+    else:
+        st.caption(f"在 {data_manager.calendar_file()} 放置节假日文件后，周末和节假日到期的回款会顺延到下一个营业日。")
+
+# 性能面板：开启后统计本次 rerun 中各阶段的耗时、行数和缓存命中情况，页面渲染完后显示在侧边栏
+show_performance = st.sidebar.toggle("⏱️ 性能面板", key="show_performance")
+if show_performance:
+    profiler.enable()
+    performance_panel = st.sidebar.container()
 else:
-    df_calculated = pd.DataFrame()
+    profiler.disable()
+
+# --- 全局数据加载 ---
+# 所有缓存都以数据库的变更计数为键：写入后只有依赖被修改表的缓存会失效，
+# 与写入无关的 rerun (切换页面、调整控件) 全部命中缓存，不需要 st.cache_data.clear()。
+CACHE_ENTRIES = 8
+
+def _with_cache_stats(func, cache):
+    """用 Streamlit 的缓存装饰器 cache 包装 func，加上命中统计：每次调用记一次查询，函数体只在未命中时执行并记一次未命中。"""
+    @wraps(func)
+    def compute(*args):
+        profiler.cache_miss(func.__name__)
+        return func(*args)
+    compute = cache(max_entries=CACHE_ENTRIES)(compute)
+
+    @wraps(func)
+    def lookup(*args):
+        profiler.cache_lookup(func.__name__)
+        return compute(*args)
+    return lookup
+
+def cached(func):
+    """
+    st.cache_data 加上命中统计。cache_data 每次命中都会反序列化出一份新的副本，调用方可以随意修改结果。
+    """
+    return _with_cache_stats(func, st.cache_data)
+
+def cached_frame(func):
+    """
+    st.cache_resource 加上命中统计，用于可能直接来自列式快照的大表。
+    cache_data 在写入缓存和每次命中时都要序列化/复制整张表，内存映射的快照列也会被读出复制一遍；
+    cache_resource 让所有会话共享同一个 DataFrame，命中时不复制。结果必须当作只读 (快照列本身就是只读的内存映射)，
+    需要修改时先 copy()。
+    """
+    return _with_cache_stats(func, st.cache_resource)
+
+versions = data_manager.get_data_versions(store)
+# 账本 (以及由它得到的预测和图表) 依赖主数据、提前回款、店铺的期初资金、回款渠道和营业日历
+ledger_version = data_manager.get_ledger_version(store)
+business_days = data_manager.get_business_calendar()
+
+# 冷启动时，最近一份列式快照与数据库一致的表直接内存映射读取，不再逐行读取 SQLite。
+# 快照在后台导出 (NumPy 格式，读取不需要复制)：没有可用快照时立即导出，数据变化后最多每隔
+# REFRESH_INTERVAL_SECONDS 秒导出一次，录入本身仍然只做增量写入。
+snapshot_versions = columnar_snapshot.source_versions(versions, ledger_version)
+if columnar_snapshot.needs_refresh(snapshot_versions, store):
+    background.submit(('export_snapshot', store), ledger_version + tuple(versions.values()),
+                      columnar_snapshot.export_snapshot, store, 'npy')
+
+def load_from_snapshot(table, store, version, load_from_db):
+    """快照中的表与数据库一致时从快照读取，否则调用 load_from_db()。"""
+    df = columnar_snapshot.load_fresh_table(table, version, store)
+    if df is None:
+        return load_from_db()
+    profiler.count('快照加载')
+    return df
+
+@cached_frame
+def load_daily_data(store, version):
+    """加载店铺的主数据并缓存 (version: 主数据表的变更计数)"""
+    return load_from_snapshot(data_manager.DAILY_TABLE, store, version,
+                              partial(data_manager.load_all_data, store=store))
+
+@cached_frame
+def load_early_payouts(store, version):
+    """加载店铺的提前回款数据并缓存 (version: 提前回款表的变更计数)"""
+    return load_from_snapshot(data_manager.EARLY_PAYOUT_TABLE, store, version,
+                              partial(data_manager.load_all_early_payouts, store=store))
+
+# 仪表盘的显示范围：只读取窗口内的账本行，加载成本与历史长度无关
+DASHBOARD_WINDOWS = {"最近90天": 90, "最近一年": 365, "全部历史": None}
+
+@cached_frame
+def load_ledger_window(window_days, store, version):
+    """
+    按显示范围读取物化账本并缓存 (财务计算结果由 data_manager 在每次写入时增量维护)。
+    store 为 None 时读取全公司汇总账本 (各店铺账本按日期相加)，此时 version 是所有店铺账本版本的组合。
+    """
+    window_stores = [store] if store is not None else data_manager.list_stores()
+    start_date = None
+    if window_days is not None:
+        latest = [data_manager.load_latest_ledger_entry(store=s) for s in window_stores]
+        latest_dates = [entry['Date'] for entry in latest if entry is not None]
+        if not latest_dates:
+            return pd.DataFrame()
+        start_date = max(latest_dates) - timedelta(days=window_days - 1)
+    if store is None:
+        return data_manager.load_consolidated_ledger(start_date=start_date, stores=window_stores)
+    df = load_from_snapshot(data_manager.LEDGER_TABLE, store, version,
+                            partial(data_manager.load_computed_ledger, start_date=start_date, store=store))
+    if start_date is not None:
+        df = df[df['Date'] >= pd.Timestamp(start_date)].reset_index(drop=True)
+    return df
+
+@cached
+def load_growth_summary(payout_delay_days, store, version):
+    """
+    增长预测的长期统计 (稳定期天数和净现金流之和) 并缓存：直接由数据库聚合得到，不读取整个历史账本。
+    store 为 None 时为全公司汇总。
+    """
+    if store is None:
+        return data_manager.load_consolidated_stable_period_summary(payout_delay_days, data_manager.list_stores())
+    return data_manager.load_stable_period_summary(payout_delay_days, store)
+
+# 风险模拟和增单计划从显示范围内的稳定期日子估算；显示范围不足最晚回款天数加上这么多天时多读取一些，
+# 保证覆盖尚未回款的订单和节假日前顺延的回款
+FORECAST_MIN_DAYS = 60
+
+@cached
+def load_period_rollups(period, start_date, store, version):
+    """按周/月/季度读取账本的周期汇总并缓存 (只包含 start_date 所在及之后的周期)"""
+    return data_manager.load_period_rollups(period, start_date=start_date, store=store)
+
+@cached
+def load_ledger_as_of(store, as_of, version):
+    """某一天结束时的账本 (从操作日志的快照回放重建) 并缓存；version 变化时当天可能有了新的修改，需要重算"""
+    return data_manager.compute_ledger_as_of(as_of, store)
+
+# 仪表盘上较慢的计算 (预测、模拟、增单计划、图表渲染) 交给后台线程，结果在所有会话间共享。
+# 数据更新后先显示上一次的结果，这里记录哪些结果仍在刷新，页面末尾等它们完成后再自动刷新。
+refreshing_keys = []
+
+# 后台计算失败且没有上一次的结果时，预测类结果显示的内容
+CALCULATION_FAILED = {"status": "error", "message": "计算失败，数据变化后会自动重试。"}
+
+def compute_in_background(key, version, func, *args, failed=None):
+    """
+    取得后台计算的结果 (key 的第一项作为缓存统计中的名称)。
+    计算失败时显示错误并返回上一次成功的结果；没有时返回 failed。
+    """
+    value, refreshing, error = background.fetch(key, version, func, *args)
+    if refreshing:
+        refreshing_keys.append(key)
+    if error is not None:
+        if value is None:
+            st.error(f"后台计算失败：{error}")
+            return failed
+        st.warning(f"后台计算失败，下方显示的是上一次的结果：{error}")
+    return value
+
+@cached
+def prepare_sensitivity_inputs(store, version):
+    """敏感性分析中与参数无关的中间结果，数据不变时只计算一次"""
+    return sensitivity_analyzer.prepare_inputs(load_daily_data(store, versions[data_manager.DAILY_TABLE]),
+                                               load_early_payouts(store, versions[data_manager.EARLY_PAYOUT_TABLE]))
+
+@cached
+def load_order_summary(store, version):
+    """加载店铺的逐单统计视图并缓存 (version: 订单表的变更计数)"""
+    return data_manager.load_daily_order_summary(store=store)
 
 
 # ==============================================================================
@@ -52,6 +267,34 @@ else:
 # ==============================================================================
 if page == "📊 仪表盘 & 报告":
     st.header("📊 仪表盘 & 报告")
+    refresh_notice = st.empty()
+
+    window_label = st.radio("显示范围", list(DASHBOARD_WINDOWS), horizontal=True)
+    window_days = DASHBOARD_WINDOWS[window_label]
+
+    # 多个店铺时可以查看全公司汇总：直接相加各店铺已物化的账本，不重新计算
+    view_store, view_version = store, ledger_version
+    if len(stores) > 1 and st.radio("查看范围", [f"当前店铺 ({store})", "全公司汇总"], horizontal=True) == "全公司汇总":
+        store_versions = {s: data_manager.get_ledger_version(s) for s in stores}
+        view_store, view_version = None, tuple(store_versions.items())
+    df_calculated = load_ledger_window(window_days, view_store, view_version)
+    # 增长预测使用与账本相同的回款分布 (全公司汇总时为各店铺分布按应收款加权的混合)，
+    # 稳定期从账本首日起最晚回款天数之后开始
+    view_stores = [view_store] if view_store is not None else stores
+    payout_kernels = {s: data_manager.get_payout_kernel(s) for s in view_stores}
+    view_kernel = (payout_kernels[view_store] if view_store is not None
+                   else data_manager.get_consolidated_payout_kernel(stores))
+    payout_delay_days = payout_schedule.max_delay(view_kernel)
+    # 增长预测的长期统计由数据库聚合得到，不随显示范围变化；模拟和增单计划使用显示范围内的账本
+    growth_summary = load_growth_summary(payout_delay_days, view_store, view_version)
+    forecast_days = None if window_days is None else max(window_days, payout_delay_days + FORECAST_MIN_DAYS)
+    df_forecast = (df_calculated if forecast_days == window_days
+                   else load_ledger_window(forecast_days, view_store, view_version))
+    # 来源明确的提前回款已经计入余额，模拟和增单计划中不能再次到账
+    store_early_payouts = [load_early_payouts(s, data_manager.get_data_versions(s)[data_manager.EARLY_PAYOUT_TABLE])
+                           for s in view_stores]
+    view_early_payouts = pd.concat([df for df in store_early_payouts if not df.empty] or store_early_payouts[:1],
+                                   ignore_index=True)
 
     if df_calculated.empty:
         st.warning("尚无数据，请先在“录入每日数据”页面添加数据。")
@@ -68,8 +311,10 @@ if page == "📊 仪表盘 & 报告":
 
         # 增长预测
         st.subheader("🚀 增长预测")
+        st.caption("增长预测基于全部历史账本，不受显示范围影响；风险模拟和增单计划按显示范围内的稳定期估算。")
         with st.container(border=True):
-            prediction = growth_predictor.analyze_growth(df_calculated, finance_calculator.PAYOUT_DELAY_DAYS)
+            prediction = growth_predictor.predict_next_increment(growth_summary['stable_days'],
+                                                                 growth_summary['stable_net_cash_flow'], latest_data)
             if prediction["status"] == "ok":
                 st.success("状态：可预测")
                 col1, col2, col3 = st.columns(3)
@@ -79,20 +324,110 @@ if page == "📊 仪表盘 & 报告":
             else:
                 st.info(f"状态：{prediction['message']}")
 
+            if st.toggle("蒙特卡洛风险模拟", help=f"从稳定期的历史日子中抽样，模拟 {growth_predictor.SIMULATION_PATHS:,} 条未来 "
+                                                 f"{growth_predictor.SIMULATION_HORIZON_DAYS} 天的现金流路径"):
+                simulation = compute_in_background(('simulate_growth', view_store, forecast_days), view_version,
+                                                   partial(growth_predictor.simulate_growth, calendar=business_days,
+                                                           df_early_payouts=view_early_payouts,
+                                                           ledger_start=growth_summary['ledger_start']),
+                                                   df_forecast, view_kernel,
+                                                   failed=CALCULATION_FAILED)
+                if simulation["status"] == "ok":
+                    col1, col2, col3, col4 = st.columns(4)
+                    col1.metric("透支概率", f"{simulation['overdraft_probability']:.1%}")
+                    for col, (p, safe_date) in zip((col2, col3, col4), simulation['safe_increment_dates'].items()):
+                        col.metric(f"安全增单日期 P{p}", safe_date.strftime('%Y-%m-%d') if safe_date is not None else "模拟期内无法达到")
+                    st.caption(f"P10/P50/P90：分别有 10%/50%/90% 的模拟路径在该日期前攒够增单缓冲金且从未透支"
+                               f" (模拟期内能达到的路径占 {simulation['reach_probability']:.1%})。")
+                    st.line_chart(simulation['balance_percentiles'].set_index('Date'))
+                else:
+                    st.info(f"状态：{simulation['message']}")
+
+        # 增单计划
+        st.subheader("📅 增单计划")
+        with st.container(border=True):
+            col1, col2 = st.columns(2)
+            plan_months = col1.slider("计划月数", min_value=1, max_value=24, value=growth_predictor.PLAN_MONTHS)
+            plan_floor = col2.number_input("余额下限 (元)", value=0.0, step=100.0, format="%.2f")
+            plan = compute_in_background(('plan_order_ramp_up', view_store, forecast_days, plan_months, plan_floor),
+                                         view_version,
+                                         partial(growth_predictor.plan_order_ramp_up, calendar=business_days,
+                                                 df_early_payouts=view_early_payouts,
+                                                 ledger_start=growth_summary['ledger_start']),
+                                         df_forecast, view_kernel, plan_months, plan_floor,
+                                         failed=CALCULATION_FAILED)
+            if plan["status"] == "ok":
+                col1, col2, col3 = st.columns(3)
+                col1.metric("计划期末单量", f"{plan['final_order_count']} 单/天",
+                            delta=f"{plan['final_order_count'] - plan['start_order_count']} 单")
+                col2.metric("预测最低余额", f"¥{plan['min_projected_balance']:,.2f}")
+                col3.metric("单笔平均成本 / 利润", f"¥{plan['per_order_cost']:,.2f} / ¥{plan['per_order_profit']:,.2f}")
+                if plan['schedule'].empty:
+                    st.info(plan['message'])
+                else:
+                    df_schedule = plan['schedule'].rename(columns={'Date': '增单日期', 'Daily_Order_Count': '增单后单量'})
+                    df_schedule['增单日期'] = df_schedule['增单日期'].dt.strftime('%Y-%m-%d')
+                    with st.expander("查看增单日程"):
+                        st.dataframe(df_schedule, hide_index=True)
+                st.line_chart(plan['projection'].set_index('Date')['bank_balance'])
+            else:
+                st.info(f"状态：{plan['message']}")
+
+        # 全公司汇总时，分店铺列出最新状态和各自的增单预测
+        if view_store is None:
+            st.subheader("🏬 各店铺概况")
+            store_rows = []
+            for s, v in store_versions.items():
+                latest_store = data_manager.load_latest_ledger_entry(store=s)
+                if latest_store is None:
+                    continue
+                store_summary = load_growth_summary(payout_schedule.max_delay(payout_kernels[s]), s, v)
+                store_prediction = growth_predictor.predict_next_increment(
+                    store_summary['stable_days'], store_summary['stable_net_cash_flow'], latest_store)
+                store_rows.append({
+                    "店铺": s,
+                    "数据截止日期": latest_store['Date'].strftime('%Y-%m-%d'),
+                    "银行余额": latest_store['bank_balance'],
+                    "累计利润": latest_store['cumulative_profit'],
+                    "下一个增单日期": (store_prediction['predicted_date_for_increment'].strftime('%Y-%m-%d')
+                                      if store_prediction["status"] == "ok" else store_prediction["message"]),
+                })
+            st.dataframe(pd.DataFrame(store_rows), hide_index=True)
+
         # 可视化图表
         st.subheader("📈 财务趋势图")
-        figs = reporter.plot_financial_trends(df_calculated)
-        if figs:
-            for title, fig in figs:
+        charts = compute_in_background(('render_financial_trends_png', window_days, view_store), view_version,
+                                       reporter.render_financial_trends_png, df_calculated)
+        if charts:
+            for title, image in charts:
                 with st.expander(f"查看 **{title}**", expanded=True):
-                    st.pyplot(fig)
-        else:
+                    st.image(image, use_container_width=True)
+        elif charts is not None:
             st.info("数据不足，无法生成图表。")
 
-        # 详细历史数据
+        # 详细历史数据：按日显示账本，或按周/月/季度显示预先维护的周期汇总 (读取成本只与周期数有关)
         st.subheader("📜 详细历史数据")
-        with st.expander("点击展开/折叠详细数据表"):
-            st.dataframe(df_calculated)
+        period_options = {"按日": None} | {f"按{label}": period for period, label in data_manager.ROLLUP_PERIOD_LABELS.items()}
+        rollup_period = period_options[st.radio("汇总周期", list(period_options), horizontal=True)]
+        if rollup_period is None:
+            with st.expander("点击展开/折叠详细数据表"):
+                st.dataframe(df_calculated)
+        elif view_store is None:
+            st.info("周期汇总按店铺维护，请切换到“当前店铺”查看。")
+        else:
+            df_rollups = load_period_rollups(rollup_period, df_calculated['Date'].iloc[0], store, ledger_version)
+            label = data_manager.ROLLUP_PERIOD_LABELS[rollup_period]
+            st.bar_chart(df_rollups.set_index('period_start')[['daily_profit', 'daily_net_cash_flow']]
+                         .rename(columns={'daily_profit': f'每{label}净利润', 'daily_net_cash_flow': f'每{label}净现金流'}))
+            df_display = df_rollups.rename(columns=data_manager.ROLLUP_COLUMN_LABELS)
+            for col in ('周期开始', '截至'):
+                df_display[col] = df_display[col].dt.strftime('%Y-%m-%d')
+            st.dataframe(df_display.iloc[::-1], hide_index=True)
+
+        df_order_summary = load_order_summary(store, versions[data_manager.ORDERS_TABLE])
+        if view_store is not None and not df_order_summary.empty:
+            with st.expander("逐单统计 (仅包含精细录入的日期)"):
+                st.dataframe(df_order_summary)
 
 
 # ==============================================================================
@@ -112,16 +447,17 @@ elif page == "✍️ 录入每日数据":
         input_date = st.date_input("选择日期", value=date.today())
         
         if entry_mode == "精细录入 (逐单)":
-            order_count = st.number_input("当日订单数", min_value=0, step=1)
-            total_cost, total_profit = 0.0, 0.0
-            if order_count > 0:
-                for i in range(order_count):
-                    col1, col2 = st.columns(2)
-                    cost = col1.number_input(f"订单 {i+1} 成本", key=f"cost_{i}", min_value=0.0, format="%.2f")
-                    profit = col2.number_input(f"订单 {i+1} 利润", key=f"profit_{i}", min_value=0.0, format="%.2f")
-                    total_cost += cost
-                    total_profit += profit
+            # 一个可编辑表格录入全部订单 (可直接从表格软件粘贴多行)；表格在表单内，编辑时不会触发 rerun，
+            # 提交后一次性校验和汇总所有行
+            st.caption("每行一笔订单，可以直接从 Excel 等表格中复制多行粘贴进来；空行会被忽略。")
+            order_grid = st.data_editor(
+                pd.DataFrame({column: pd.Series(dtype=float) for column in importer.ORDER_GRID_COLUMNS}),
+                num_rows="dynamic", use_container_width=True, key="order_grid",
+                column_config={column: st.column_config.NumberColumn(column, format="%.2f")
+                               for column in importer.ORDER_GRID_COLUMNS},
+            )
         else:
+            orders = None # 快速录入没有逐单明细
             order_count = st.number_input("当日总订单数", min_value=0, step=1)
             total_cost = st.number_input("当日总成本", min_value=0.0, format="%.2f")
             total_profit = st.number_input("当日总利润", min_value=0.0, format="%.2f")
@@ -133,22 +469,75 @@ elif page == "✍️ 录入每日数据":
 
         submitted = st.form_submit_button("保存当日数据")
 
+    if submitted and entry_mode == "精细录入 (逐单)":
+        validated = importer.validate_orders(order_grid)
+        orders = validated['orders']
+        if validated['invalid_rows']:
+            st.error(f"第 {', '.join(map(str, validated['invalid_rows']))} 行的成本或利润无效 (成本不能为负)，请修改后重新保存。")
+            st.stop()
+
     if submitted:
         date_str = input_date.strftime('%Y-%m-%d')
         est_loss = refunds * finance_calculator.AVERAGE_PROFIT_MARGIN
         
-        if data_manager.check_date_exists(date_str):
+        if data_manager.check_date_exists(date_str, store=store):
             st.warning(f"日期 {date_str} 的数据已存在。保存将覆盖原有数据。")
         
-        data_manager.save_daily_data(date_str, order_count, total_cost, total_profit, refunds, est_loss, other_income, notes)
+        if orders is not None:
+            # 精细录入：保存逐单明细，当日汇总由数据库触发器维护
+            data_manager.save_orders(date_str, orders, refunds, est_loss, other_income, notes, store=store)
+        else:
+            data_manager.save_daily_data(date_str, order_count, total_cost, total_profit, refunds, est_loss, other_income, notes, store=store)
         st.success(f"日期 {date_str} 的数据已成功保存！页面将刷新以展示最新数据。")
         st.balloons()
-        st.cache_data.clear()
+        st.session_state.pop("order_grid", None)  # 清空逐单表格，准备录入下一天
         st.rerun()
 
 
 # ==============================================================================
-# 页面三：管理提前回款 (已恢复并增强)
+# 页面三：批量导入订单
+# ==============================================================================
+elif page == "📥 批量导入订单":
+    st.header("📥 批量导入订单")
+    st.caption("上传平台导出的订单文件 (CSV/Excel)，系统会按天汇总订单数、成本、利润和退款后写入每日数据。")
+
+    uploaded_file = st.file_uploader("选择订单导出文件", type=["csv", "xlsx", "xlsm"])
+    if uploaded_file is not None:
+        try:
+            columns = importer.read_header(uploaded_file)
+        except Exception as e:
+            st.error(f"无法读取文件表头: {e}")
+            st.stop()
+
+        detected = importer.detect_columns(columns)
+        labels = {'date': '订单日期列', 'cost': '成本列', 'profit': '利润列', 'refund': '退款金额列 (可选)'}
+        column_map = {}
+        cols = st.columns(len(labels))
+        for col, (field, label) in zip(cols, labels.items()):
+            options = ([None] if field == 'refund' else []) + columns
+            default = detected.get(field)
+            column_map[field] = col.selectbox(label, options=options,
+                                              index=options.index(default) if default in options else 0)
+
+        st.info("同一日期已存在的数据将被覆盖订单数/成本/利润/退款，其他入账和备注会保留。")
+        if st.button("开始导入", type="primary"):
+            try:
+                with st.spinner("正在导入..."):
+                    result = importer.import_orders(uploaded_file, column_map, store=store)
+            except (ValueError, KeyError, ImportError) as e:
+                st.error(f"导入失败: {e}")
+            else:
+                if result['days'] == 0:
+                    st.warning("文件中没有可导入的订单。")
+                else:
+                    st.success(f"导入完成：{result['start_date'].strftime('%Y-%m-%d')} 至 "
+                               f"{result['end_date'].strftime('%Y-%m-%d')}，共 {result['days']} 天、{result['orders']} 笔订单。")
+                    if result['skipped_rows']:
+                        st.warning(f"有 {result['skipped_rows']} 行因日期无法识别而被跳过。")
+
+
+# ==============================================================================
+# 页面四：管理提前回款 (已恢复并增强)
 # ==============================================================================
 elif page == "📈 管理提前回款":
     st.header("📈 管理提前回款记录")
@@ -170,15 +559,15 @@ elif page == "📈 管理提前回款":
     if submitted_payout:
         payout_date_str = payout_date.strftime('%Y-%m-%d')
         original_date_str = original_order_date.strftime('%Y-%m-%d') if original_order_date else None
-        data_manager.save_early_payout(payout_date_str, original_date_str, amount)
+        data_manager.save_early_payout(payout_date_str, original_date_str, amount, store=store)
         st.success("提前回款记录已保存！页面将刷新。")
-        st.cache_data.clear()
         st.rerun()
     
     st.divider()
 
     # --- 2. 查看和删除提前回款 ---
     st.subheader("现有记录")
+    df_early = load_early_payouts(store, versions[data_manager.EARLY_PAYOUT_TABLE])
     if df_early.empty:
         st.info("尚无提前回款记录。")
     else:
@@ -195,20 +584,20 @@ elif page == "📈 管理提前回款":
 
         if id_to_delete:
             if st.button(f"确认删除ID为【{id_to_delete}】的记录", type="primary"):
-                success = data_manager.delete_early_payout_by_id(id_to_delete)
+                success = data_manager.delete_early_payout_by_id(id_to_delete, store=store)
                 if success:
                     st.success(f"ID {id_to_delete} 的记录已成功删除！页面将刷新。")
-                    st.cache_data.clear()
                     st.rerun()
 
 
 # ==============================================================================
-# 页面四：删除每日数据 (全新独立页面)
+# 页面五：删除每日数据 (全新独立页面)
 # ==============================================================================
 elif page == "🗑️ 删除每日数据":
     st.header("🗑️ 删除每日数据")
-    st.warning("️警告：此操作不可逆，将永久删除选定日期的所有订单、成本、退款等主数据！")
+    st.warning("️警告：将删除选定日期的所有订单、成本、退款等主数据！误删可在下方“撤销与历史”中恢复。")
 
+    df_history = load_daily_data(store, versions[data_manager.DAILY_TABLE])
     if df_history.empty:
         st.info("没有可供删除的每日数据。")
     else:
@@ -222,7 +611,114 @@ elif page == "🗑️ 删除每日数据":
         
         if date_to_delete:
             if st.button(f"永久删除【{date_to_delete}】的所有数据", type="primary"):
-                data_manager.delete_data_by_date(date_to_delete)
+                data_manager.delete_data_by_date(date_to_delete, store=store)
                 st.success(f"日期 {date_to_delete} 的数据已成功删除！页面将刷新。")
-                st.cache_data.clear()
                 st.rerun()
+
+    st.divider()
+
+    # --- 撤销与历史：每次写入都记在操作日志中，可以整体撤销，也可以查看任意时刻的账本 ---
+    st.subheader("↩️ 撤销与历史")
+    last_operation = data_manager.get_last_undoable_operation(store)
+    if last_operation is None:
+        st.info("没有可以撤销的操作。")
+    elif st.button(f"撤销最近一次修改：{last_operation}"):
+        data_manager.undo_last_operation(store)
+        st.success(f"已撤销：{last_operation}")
+        st.rerun()
+
+    with st.expander("操作历史"):
+        df_operations = data_manager.list_operations(limit=50, store=store)
+        st.dataframe(df_operations.rename(columns={'op_id': '编号', 'recorded_at': '时间', 'description': '操作',
+                                                   'changed_rows': '修改行数', 'undone': '已撤销', 'is_undo': '撤销操作'}),
+                     hide_index=True, use_container_width=True)
+
+    with st.expander("查看历史时点的账本"):
+        as_of_date = st.date_input("截至哪一天结束时", value=date.today(), key="as_of_date")
+        df_as_of = load_ledger_as_of(store, as_of_date, ledger_version)
+        if df_as_of.empty:
+            st.info("该时刻还没有数据。")
+        else:
+            latest_as_of = df_as_of.iloc[-1]
+            col1, col2, col3 = st.columns(3)
+            col1.metric("当时的数据截止日期", latest_as_of['Date'].strftime('%Y-%m-%d'))
+            col2.metric("银行余额", f"¥{latest_as_of['bank_balance']:,.2f}")
+            col3.metric("累计利润", f"¥{latest_as_of['cumulative_profit']:,.2f}")
+            st.dataframe(df_as_of.iloc[::-1], hide_index=True)
+
+
+# ==============================================================================
+# 页面六：敏感性分析
+# ==============================================================================
+elif page == "🎛️ 敏感性分析":
+    st.header("🎛️ 敏感性分析")
+    st.caption("在参数网格上一次性批量计算账本和增长预测，只用于分析，不会修改任何数据或设置。")
+
+    sensitivity_inputs = prepare_sensitivity_inputs(store, (versions[data_manager.DAILY_TABLE], versions[data_manager.EARLY_PAYOUT_TABLE]))
+    if not sensitivity_inputs:
+        st.warning("尚无数据，请先录入每日数据。")
+    else:
+        parameters = sensitivity_analyzer.PARAMETERS
+        parameter_label = lambda name: parameters[name][0]
+
+        col1, col2, col3 = st.columns(3)
+        x_param = col1.selectbox("横轴参数", list(parameters), index=0, format_func=parameter_label)
+        y_param = col2.selectbox("纵轴参数", [p for p in parameters if p != x_param], index=0, format_func=parameter_label)
+        metric = col3.selectbox("指标", list(sensitivity_analyzer.METRICS), format_func=sensitivity_analyzer.METRICS.get)
+        points = st.slider("网格密度 (每个轴的取值个数)", min_value=10, max_value=100, value=sensitivity_analyzer.GRID_POINTS)
+
+        axes = {}
+        col1, col2 = st.columns(2)
+        for col, name in ((col1, x_param), (col2, y_param)):
+            low, high = sensitivity_analyzer.DEFAULT_RANGES[name]
+            is_integer = name == 'payout_delay_days'
+            col_low, col_high = col.columns(2)
+            low = col_low.number_input(f"{parameter_label(name)} 最小值", value=low, step=1 if is_integer else None)
+            high = col_high.number_input(f"{parameter_label(name)} 最大值", value=high, step=1 if is_integer else None)
+            axes[name] = sensitivity_analyzer.axis_values(name, low, max(low, high), points)
+
+        # 其余两个参数固定在当前值 (期初资金默认取当前店铺的设置)
+        fixed = {}
+        defaults = {name: default for name, (_, default) in parameters.items()}
+        defaults['initial_cash'] = data_manager.get_store_initial_cash(store)
+        fixed_params = [p for p in parameters if p not in (x_param, y_param)]
+        for col, name in zip(st.columns(len(fixed_params)), fixed_params):
+            fixed[name] = col.number_input(f"固定 {parameter_label(name)}", value=defaults[name])
+
+        grid = sensitivity_analyzer.sensitivity_grid(sensitivity_inputs, x_param, axes[x_param], y_param, axes[y_param], fixed)
+        image = reporter.render_heatmap_png(grid[metric], axes[x_param], axes[y_param],
+                                            parameter_label(x_param), parameter_label(y_param),
+                                            sensitivity_analyzer.METRICS[metric],
+                                            reverse_colors=metric == 'days_to_next_increment')
+        st.image(image, use_container_width=True)
+        if metric == 'days_to_next_increment':
+            st.caption("空白区域表示稳定期日均净现金流不为正，无法支持增单。")
+        elif metric == 'min_balance':
+            st.caption("黑色等值线为余额 0 的边界，其一侧的参数组合会出现透支。")
+
+
+# ==============================================================================
+# 性能面板 (放在最后，统计覆盖本次 rerun 的全部页面代码)
+# ==============================================================================
+if show_performance:
+    with performance_panel:
+        st.subheader("⏱️ 性能统计")
+        st.caption(f"本次 rerun 共 {profiler.elapsed() * 1000:.1f} ms；嵌套阶段的耗时互相包含。")
+        stage_rows = profiler.stage_rows()
+        if stage_rows:
+            st.dataframe(pd.DataFrame(stage_rows), hide_index=True, use_container_width=True)
+        cache_rows = profiler.cache_rows()
+        if cache_rows:
+            st.dataframe(pd.DataFrame(cache_rows), hide_index=True, use_container_width=True)
+        counter_rows = profiler.counter_rows()
+        if counter_rows:
+            st.dataframe(pd.DataFrame(counter_rows), hide_index=True, use_container_width=True)
+
+# 有结果仍在后台刷新时：页面已经用上一次的结果渲染完毕，等新结果算好后自动 rerun。
+# 等待期间不断更新提示，让 Streamlit 有机会响应用户的新操作 (新的交互会中断这次等待)。
+if refreshing_keys:
+    refresh_message = "🔄 数据已更新，正在后台重新计算，下方暂时显示上一次的结果…"
+    refresh_notice.info(refresh_message)
+    while not background.wait_for(refreshing_keys, timeout=0.25):
+        refresh_notice.info(refresh_message)
+    st.rerun()
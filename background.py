@@ -0,0 +1,122 @@
+# background.py
+# 后台计算：耗时的预测、模拟和图表渲染在进程内的线程池里执行，结果按 (键, 数据版本) 发布到共享缓存。
+# 数据版本变化后，调用方先拿到上一次成功的结果 (并得知正在刷新)，新结果算好后再替换，页面不会因此卡住。
+# 模块级状态在 Streamlit 的多次 rerun 和多个会话之间共享。
+
+import threading
+import traceback
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, TimeoutError, wait
+
+import profiler
+
+WORKERS = 2
+RESULT_CACHE_SIZE = 64
+# 已有旧结果时，先给新任务这么长的时间 (秒)；短任务能在此之内完成，就不必显示“正在刷新”
+FRESH_WAIT_SECONDS = 0.3
+
+_executor = ThreadPoolExecutor(max_workers=WORKERS, thread_name_prefix='compass-worker')
+_lock = threading.Lock()
+_results = OrderedDict()  # 键 -> (版本, 结果)：每个键最近一次成功完成的结果
+_running = {}             # 键 -> (版本, future)：每个键最近一次提交的任务
+_errors = {}              # 键 -> (版本, 异常)：每个键最近一次失败的任务，同一版本不再重复提交
+
+
+def _run(key, version, func, args):
+    """
+    在工作线程中执行任务；只有仍是该键最新请求的结果 (或该键还没有任何结果) 才会发布。
+    任务抛出的异常在这里捕获并记录：保留上一次成功的结果，返回 (None, 异常) 交给调用方显示。
+    :return: (结果, 异常)，成功时异常为 None
+    """
+    try:
+        value, error = func(*args), None
+    except Exception as e:
+        value, error = None, e
+        print(f"后台任务 {key} 失败: {e}")
+        traceback.print_exc()
+    with _lock:
+        running = _running.get(key)
+        is_latest = running is not None and running[0] == version
+        if error is not None:
+            if is_latest:
+                _errors[key] = (version, error)
+        elif is_latest or key not in _results:
+            _errors.pop(key, None)
+            _results[key] = (version, value)
+            _results.move_to_end(key)
+            while len(_results) > RESULT_CACHE_SIZE:
+                _results.popitem(last=False)
+        if is_latest:
+            del _running[key]
+    return value, error
+
+
+def _start(key, version, func, args):
+    """提交任务 (调用方持有 _lock)；该版本已完成、已失败或正在执行时返回已有的 future 或 None。"""
+    running = _running.get(key)
+    if running is not None and running[0] == version:
+        return running[1]
+    failed = _errors.get(key)
+    if failed is not None and failed[0] == version:
+        return None
+    profiler.cache_miss(key[0] if isinstance(key, tuple) else key)
+    future = _executor.submit(_run, key, version, func, args)
+    _running[key] = (version, future)
+    return future
+
+
+def fetch(key, version, func, *args, wait_seconds=FRESH_WAIT_SECONDS):
+    """
+    取得 func(*args) 在给定数据版本下的结果。
+    该版本的结果已在缓存中时直接返回；否则在后台提交计算 (同一键和版本只提交一次)：
+    有旧结果时最多等待 wait_seconds 秒，超时返回旧结果；没有旧结果时等待计算完成。
+    计算失败时返回上一次成功的结果 (没有则为 None) 和异常；同一版本不会反复重试，数据变化后才重新计算。
+    :param key: 结果的键 (除数据版本外决定结果的所有参数)，可哈希
+    :param version: 数据版本，变化时需要重新计算
+    :return: (结果, 是否仍在刷新, 异常或 None)
+    """
+    profiler.cache_lookup(key[0] if isinstance(key, tuple) else key)
+    with _lock:
+        cached = _results.get(key)
+        if cached is not None and cached[0] == version:
+            _results.move_to_end(key)
+            return cached[1], False, None
+        future = _start(key, version, func, args)
+        previous = cached[1] if cached is not None else None
+        if future is None:
+            return previous, False, _errors[key][1]
+
+    try:
+        value, error = future.result(timeout=wait_seconds if cached is not None else None)
+    except TimeoutError:
+        return previous, True, None
+    if error is not None:
+        return previous, False, error
+    return value, False, None
+
+
+def submit(key, version, func, *args):
+    """
+    提交一个不需要等待结果的后台任务 (例如写出快照)；该版本已完成、失败过或正在执行时不重复提交。
+    任务失败时在 _run 中输出错误信息。
+    """
+    with _lock:
+        cached = _results.get(key)
+        if cached is not None and cached[0] == version:
+            return
+        _start(key, version, func, args)
+
+
+def pending_futures(keys) -> list:
+    """返回给定键中仍在后台计算的任务。"""
+    with _lock:
+        return [_running[key][1] for key in keys if key in _running]
+
+
+def wait_for(keys, timeout=None) -> bool:
+    """等待给定键的后台任务完成；全部完成返回 True，超时返回 False。"""
+    futures = pending_futures(keys)
+    if not futures:
+        return True
+    _, not_done = wait(futures, timeout=timeout)
+    return not not_done
@@ -0,0 +1,2 @@
+# benchmarks 包：用合成的历史数据对整条处理流程 (加载 -> 计算 -> 预测 -> 绘图) 做性能基准测试。
+# 运行方式 (在项目根目录下): python -m benchmarks.run
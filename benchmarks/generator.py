@@ -0,0 +1,70 @@
+# benchmarks/generator.py
+
+import numpy as np
+import pandas as pd
+
+import finance_calculator
+import data_manager
+
+# 预设的历史长度 (天)：1个月、1年、5年、20年
+HISTORY_SIZES = {'1m': 30, '1y': 365, '5y': 1826, '20y': 7305}
+# 提前回款的密度：平均每天出现提前回款的概率
+PAYOUT_DENSITIES = {'sparse': 0.02, 'dense': 0.3}
+START_DATE = '2005-01-01'
+
+
+def generate_history(days: int, seed: int = 0, payout_density: str = 'sparse', start_date: str = START_DATE) -> tuple:
+    """
+    生成一段可复现的 (相同 seed 结果相同) 店铺历史，结构与 data_manager 的加载结果一致。
+    订单量随时间缓慢增长并带有周内波动，偶尔有停业日、退款和其他入账；
+    提前回款的来源订单大多已知，金额不超过该日订单应回款的一部分，收款日落在回款周期内。
+    :return: (主数据DataFrame, 提前回款DataFrame)
+    """
+    rng = np.random.default_rng(seed)
+    dates = pd.date_range(start_date, periods=days, freq='D')
+    # 约 3% 的日子停业 (没有主数据记录)
+    dates = dates[rng.random(days) > 0.03]
+    n = len(dates)
+
+    trend = 5 + 20 * np.arange(n) / max(n - 1, 1)
+    weekly = 1 + 0.2 * np.sin(2 * np.pi * dates.dayofweek.to_numpy() / 7)
+    order_count = rng.poisson(trend * weekly)
+    unit_cost = rng.lognormal(mean=np.log(25), sigma=0.25, size=n)
+    margin = np.clip(rng.normal(finance_calculator.AVERAGE_PROFIT_MARGIN, 0.05, n), 0.05, 0.6)
+    total_cost = np.round(order_count * unit_cost, 2)
+    total_profit = np.round(total_cost * margin, 2)
+    refunds = np.round(np.where(rng.random(n) < 0.08, rng.uniform(10, 150, n), 0.0), 2)
+    other_income = np.round(np.where(rng.random(n) < 0.03, rng.uniform(50, 500, n), 0.0), 2)
+
+    df_daily = pd.DataFrame({
+        'Date': dates,
+        'Daily_Order_Count': order_count,
+        'Total_Daily_Cost': total_cost,
+        'Total_Daily_Profit': total_profit,
+        'Refunds_Received_Today': refunds,
+        'Estimated_Profit_Loss_From_Refunds': np.round(refunds * finance_calculator.AVERAGE_PROFIT_MARGIN, 2),
+        'Other_Income_Today': other_income,
+        'Notes': '',
+    })
+
+    # 提前回款：来源订单日按密度抽样，收款日在来源日之后 1 ~ 回款周期-1 天
+    has_payout = (rng.random(n) < PAYOUT_DENSITIES[payout_density]) & (order_count > 0)
+    origin = dates[has_payout]
+    m = len(origin)
+    receivable = (total_cost + total_profit)[has_payout]
+    payout_dates = origin + pd.to_timedelta(rng.integers(1, finance_calculator.PAYOUT_DELAY_DAYS, m), unit='D')
+    # 约 15% 的提前回款来源未知
+    origin_dates = pd.Series(origin).where(rng.random(m) > 0.15)
+    df_early = pd.DataFrame({
+        'payout_id': np.arange(1, m + 1),
+        'Payout_Date': payout_dates,
+        'Original_Order_Date': pd.to_datetime(origin_dates.to_numpy()),
+        'Amount': np.round(receivable * rng.uniform(0.2, 0.8, m), 2),
+    })
+    return df_daily, df_early
+
+
+def write_history(df_daily: pd.DataFrame, df_early: pd.DataFrame, store=None):
+    """把生成的历史写入店铺数据库 (一次事务、在操作日志中记为一次操作)，并刷新物化账本。"""
+    data_manager.init_db(store)
+    data_manager.import_tables(df_daily, df_early, store=store)
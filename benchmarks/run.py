@@ -0,0 +1,207 @@
+# benchmarks/run.py
+# 用法 (在项目根目录下):
+#   python -m benchmarks.run                              # 全部规模 × 全部密度，结果写入 benchmarks/results/
+#   python -m benchmarks.run --sizes 1m 1y --repeat 5
+#   python -m benchmarks.run --compare benchmarks/results/旧结果.json
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+import matplotlib
+matplotlib.use('Agg')  # 基准测试不弹出窗口
+import matplotlib.pyplot as plt
+import numpy as np
+import pandas as pd
+
+import data_manager
+import finance_calculator
+import growth_predictor
+import reporter
+from benchmarks.generator import HISTORY_SIZES, PAYOUT_DENSITIES, generate_history, write_history
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results')
+DEFAULT_REPEAT = 3
+DEFAULT_SEED = 42
+STAGES = ['load_all_data', 'calculate_finances', 'calculate_finances_cents', 'analyze_growth', 'plot_financial_trends']
+
+
+def _stage_functions(inputs: dict) -> dict:
+    """各阶段的可调用对象；每个阶段的输入都提前准备好，计时只包含该阶段本身。"""
+    def load():
+        return data_manager.load_all_data(), data_manager.load_all_early_payouts()
+
+    def calculate():
+        return finance_calculator.calculate_finances(inputs['df_daily'], inputs['df_early'])
+
+    def calculate_cents():
+        return finance_calculator.calculate_finances_cents(inputs['df_daily_compact'], inputs['df_early_compact'])
+
+    def predict():
+        return growth_predictor.analyze_growth(inputs['df_calculated'], finance_calculator.PAYOUT_DELAY_DAYS)
+
+    def plot():
+        figs = reporter.plot_financial_trends(inputs['df_calculated'])
+        for _, fig in figs:
+            plt.close(fig)
+        return figs
+
+    return {'load_all_data': load, 'calculate_finances': calculate, 'calculate_finances_cents': calculate_cents,
+            'analyze_growth': predict, 'plot_financial_trends': plot}
+
+
+def _time_stage(func, repeat: int) -> dict:
+    """多次运行取耗时 (秒) 的最小值和中位数；最小值受系统噪声影响最小，适合跨提交比较。"""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return {'min_s': min(timings), 'median_s': statistics.median(timings)}
+
+
+def _peak_memory(func) -> int:
+    """单独运行一次并用 tracemalloc 记录峰值内存 (字节)；与计时分开，避免追踪开销影响耗时。"""
+    tracemalloc.start()
+    try:
+        func()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def _check_engines_agree(df_calculated: pd.DataFrame, df_cents: pd.DataFrame):
+    """计时之前先确认两种计算方式的结果一致，避免在错误的结果上报告加速。"""
+    df_yuan = finance_calculator.ledger_to_yuan(df_cents)
+    if list(df_calculated['Date']) != list(df_yuan['Date']):
+        raise AssertionError("浮点模式与整数分模式的账本日期不一致。")
+    # 生成的金额都精确到分，两者只差浮点累加误差
+    np.testing.assert_allclose(df_calculated[finance_calculator.COMPUTED_COLS].to_numpy(float),
+                               df_yuan[finance_calculator.COMPUTED_COLS].to_numpy(float), rtol=0, atol=1e-6,
+                               err_msg="浮点模式与整数分模式的计算结果不一致")
+
+
+def run_case(size: str, density: str, repeat: int, seed: int) -> dict:
+    """在临时数据库中生成一段历史，并分别测量每个阶段的耗时和峰值内存。"""
+    df_daily, df_early = generate_history(HISTORY_SIZES[size], seed=seed, payout_density=density)
+    original_db_file = data_manager.DB_FILE
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        data_manager.DB_FILE = os.path.join(tmp_dir, 'benchmark.db')
+        try:
+            write_history(df_daily, df_early)
+            inputs = {'df_daily': data_manager.load_all_data(), 'df_early': data_manager.load_all_early_payouts()}
+            inputs['df_calculated'] = finance_calculator.calculate_finances(inputs['df_daily'], inputs['df_early'])
+            inputs['df_daily_compact'] = data_manager.load_all_data(compact=True)
+            inputs['df_early_compact'] = data_manager.load_all_early_payouts(compact=True)
+            df_cents = finance_calculator.calculate_finances_cents(inputs['df_daily_compact'], inputs['df_early_compact'])
+            _check_engines_agree(inputs['df_calculated'], df_cents)
+            # 先运行一次绘图，排除字体加载等一次性初始化的影响
+            _stage_functions(inputs)['plot_financial_trends']()
+
+            stages = {}
+            for name, func in _stage_functions(inputs).items():
+                stages[name] = _time_stage(func, repeat)
+                stages[name]['peak_memory_bytes'] = _peak_memory(func)
+        finally:
+            data_manager.close_all_connections()
+            data_manager.DB_FILE = original_db_file
+
+    return {
+        'size': size,
+        'density': density,
+        'days': HISTORY_SIZES[size],
+        'daily_rows': len(df_daily),
+        'early_payout_rows': len(df_early),
+        'ledger_rows': len(inputs['df_calculated']),
+        # 账本表格本身的内存占用 (字节)：普通表示 (float64) 与整数分紧凑表示
+        'ledger_memory_bytes': {'float': int(inputs['df_calculated'].memory_usage(deep=True).sum()),
+                                'cents': int(df_cents.memory_usage(deep=True).sum())},
+        'stages': stages,
+    }
+
+
+def _git_commit():
+    """当前提交的哈希 (不在 git 仓库中时为 None)。"""
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmarks(sizes, densities, repeat: int = DEFAULT_REPEAT, seed: int = DEFAULT_SEED) -> dict:
+    """运行所有组合，返回可直接写成 JSON 的结果 (包含环境信息，方便跨提交比较)。"""
+    cases = []
+    for size in sizes:
+        for density in densities:
+            case = run_case(size, density, repeat, seed)
+            cases.append(case)
+            summary = ', '.join(f"{name} {stage['min_s'] * 1000:.1f}ms" for name, stage in case['stages'].items())
+            print(f"[{size}/{density}] {case['ledger_rows']} 天: {summary}")
+    return {
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'git_commit': _git_commit(),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'pandas': pd.__version__,
+        'platform': platform.platform(),
+        'repeat': repeat,
+        'seed': seed,
+        'cases': cases,
+    }
+
+
+def compare_results(baseline: dict, current: dict):
+    """逐个阶段打印当前结果相对基准结果的耗时比值 (>1 表示变慢)。"""
+    old_cases = {(case['size'], case['density']): case for case in baseline['cases']}
+    print(f"\n--- 与基准 {(baseline.get('git_commit') or '?')[:10]} 比较 (当前耗时 / 基准耗时) ---")
+    for case in current['cases']:
+        old = old_cases.get((case['size'], case['density']))
+        if old is None:
+            continue
+        ratios = []
+        for name, stage in case['stages'].items():
+            old_stage = old['stages'].get(name)
+            if old_stage and old_stage['min_s'] > 0:
+                ratios.append(f"{name} x{stage['min_s'] / old_stage['min_s']:.2f}")
+        print(f"[{case['size']}/{case['density']}] " + ', '.join(ratios))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='电商财务工具的性能基准测试')
+    parser.add_argument('--sizes', nargs='+', choices=list(HISTORY_SIZES), default=list(HISTORY_SIZES),
+                        help='历史长度 (默认全部)')
+    parser.add_argument('--densities', nargs='+', choices=list(PAYOUT_DENSITIES), default=list(PAYOUT_DENSITIES),
+                        help='提前回款密度 (默认全部)')
+    parser.add_argument('--repeat', type=int, default=DEFAULT_REPEAT, help='每个阶段的重复次数')
+    parser.add_argument('--seed', type=int, default=DEFAULT_SEED, help='数据生成的随机种子')
+    parser.add_argument('--output', help='结果 JSON 路径 (默认 benchmarks/results/<时间>_<提交>.json)')
+    parser.add_argument('--compare', help='用于比较的基准结果 JSON')
+    args = parser.parse_args(argv)
+
+    results = run_benchmarks(args.sizes, args.densities, args.repeat, args.seed)
+
+    output = args.output
+    if output is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        stamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        output = os.path.join(RESULTS_DIR, f"{stamp}_{(results['git_commit'] or 'nogit')[:10]}.json")
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(results, f, ensure_ascii=False, indent=2)
+    print(f"结果已保存到: {output}")
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            compare_results(json.load(f), results)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,246 @@
+# columnar_snapshot.py
+# 列式快照：把店铺的主数据、提前回款和物化账本整表导出为列式文件，供冷启动和离线分析使用。
+# 有 pyarrow 时默认写 Parquet (体积小，pandas / DuckDB / Polars 都能直接读取)；
+# 否则每列一个 .npy 文件，读取时用 np.load(mmap_mode='r') 内存映射，数据按需由操作系统分页载入，不经过复制。
+#
+# 快照目录结构 (数据库文件旁的 snapshots/<店铺>/<时间戳>/)：
+#   manifest.json                 格式、创建时间、数据库身份、导出时各表的变更计数、行数和列信息 (最后写入，存在即表示快照完整)
+#   daily_data.parquet ...        Parquet 格式：每张表一个文件
+#   daily_data/Date.npy ...       NumPy 格式：每张表一个目录、每列一个文件；文本列拆成 .codes.npy 和 .categories.npy
+
+import json
+import os
+import shutil
+import time
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+import data_manager
+
+SNAPSHOTS_DIR = 'snapshots'
+MANIFEST_FILE = 'manifest.json'
+KEEP_SNAPSHOTS = 3  # 每个店铺保留最近几份快照
+FORMATS = ('parquet', 'npy')
+TABLES = (data_manager.DAILY_TABLE, data_manager.EARLY_PAYOUT_TABLE, data_manager.LEDGER_TABLE)
+EXPORT_ATTEMPTS = 3  # 导出期间数据被修改时重新导出的次数
+NAME_FORMAT = '%Y%m%d-%H%M%S-%f'
+# app 在数据变化后重新导出快照的最短间隔 (秒)：导出需要读取全部历史，不能每次录入都做一遍
+REFRESH_INTERVAL_SECONDS = 600
+
+
+def default_format() -> str:
+    """安装了 pyarrow 时为 'parquet'，否则为 'npy'。"""
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        return 'npy'
+    return 'parquet'
+
+
+def snapshot_root(store=None) -> str:
+    """店铺快照所在的目录。"""
+    return os.path.join(os.path.dirname(data_manager.DB_FILE), SNAPSHOTS_DIR, store or data_manager.DEFAULT_STORE)
+
+
+def source_versions(versions, ledger_version) -> dict:
+    """
+    快照各表对应的数据版本：主数据和提前回款为各自的变更计数，账本为账本版本 (含营业日历)。
+    :param versions: data_manager.get_data_versions 的结果
+    :param ledger_version: data_manager.get_ledger_version 的结果
+    """
+    return {data_manager.DAILY_TABLE: versions[data_manager.DAILY_TABLE],
+            data_manager.EARLY_PAYOUT_TABLE: versions[data_manager.EARLY_PAYOUT_TABLE],
+            data_manager.LEDGER_TABLE: list(ledger_version)}
+
+
+def _current_versions(store):
+    # 先取账本版本：其中会同步营业日历，可能更新店铺设置的变更计数
+    ledger_version = data_manager.get_ledger_version(store)
+    return (source_versions(data_manager.get_data_versions(store), ledger_version),
+            data_manager.get_db_identity(store))
+
+
+def _load_tables(store):
+    return {data_manager.DAILY_TABLE: data_manager.load_all_data(store=store),
+            data_manager.EARLY_PAYOUT_TABLE: data_manager.load_all_early_payouts(store=store),
+            data_manager.LEDGER_TABLE: data_manager.load_computed_ledger(store=store)}
+
+
+# --- NumPy 格式 ---
+
+def _write_npy(df, directory):
+    """每列写一个 .npy；文本列 (object) 编码为整数代码加类别表，全程不使用 pickle。返回列信息。"""
+    os.makedirs(directory, exist_ok=True)
+    columns = []
+    for name, series in df.items():
+        path = os.path.join(directory, name)
+        if series.dtype == object:
+            codes, categories = pd.factorize(series)
+            np.save(f"{path}.codes.npy", codes.astype(np.int32))
+            np.save(f"{path}.categories.npy", np.asarray(categories, dtype=str))
+            columns.append({'name': name, 'kind': 'text'})
+        else:
+            np.save(f"{path}.npy", series.to_numpy())
+            columns.append({'name': name, 'kind': 'values'})
+    return columns
+
+
+def _load_array(path, rows):
+    # 空数组无法内存映射；np.asarray 去掉 memmap 子类，得到共享同一块映射内存的普通数组
+    return np.asarray(np.load(path, mmap_mode='r' if rows else None, allow_pickle=False))
+
+
+def _read_npy(directory, columns, rows) -> pd.DataFrame:
+    """
+    内存映射读取一张表。数值和日期列直接引用映射的数组 (只读)，修改前需要先 copy()；
+    文本列按代码还原为字符串，缺失值为 None，与从数据库读取的结果一致。
+    """
+    data = {}
+    for column in columns:
+        path = os.path.join(directory, column['name'])
+        if column['kind'] == 'text':
+            codes = _load_array(f"{path}.codes.npy", rows)
+            categories = np.load(f"{path}.categories.npy", allow_pickle=False).astype(object)
+            data[column['name']] = np.append(categories, None)[codes]  # 代码 -1 取到末尾的 None
+        else:
+            data[column['name']] = _load_array(f"{path}.npy", rows)
+    return pd.DataFrame(data, copy=False)
+
+
+# --- 导出 ---
+
+def _prune(root, keep):
+    """只保留最近 keep 份完整的快照；正在被读取而无法删除的 (Windows) 留到下次再删。"""
+    for name in sorted(os.listdir(root))[:-keep]:
+        shutil.rmtree(os.path.join(root, name), ignore_errors=True)
+
+
+def export_snapshot(store=None, fmt=None, directory=None, keep=KEEP_SNAPSHOTS) -> str:
+    """
+    把店铺的主数据、提前回款和物化账本导出为一份列式快照，返回快照目录。
+    导出期间数据被修改时重新导出，保证快照中的三张表对应同一时刻的数据。
+    :param fmt: 'parquet' 或 'npy'，默认有 pyarrow 时为 'parquet'
+    :param directory: 快照保存的位置，默认在 snapshots/<店铺>/ 下按时间命名 (只保留最近 keep 份)
+    """
+    fmt = fmt or default_format()
+    if fmt not in FORMATS:
+        raise ValueError(f"不支持的快照格式: {fmt} (可选: {', '.join(FORMATS)})")
+    if fmt == 'parquet' and default_format() != 'parquet':
+        raise ImportError("导出 Parquet 快照需要安装 pyarrow (pip install pyarrow)，或使用 npy 格式。")
+
+    for _ in range(EXPORT_ATTEMPTS):
+        versions, identity = _current_versions(store)
+        tables = _load_tables(store)
+        if _current_versions(store) == (versions, identity):
+            break
+    else:
+        raise RuntimeError("导出期间数据持续被修改，请稍后重试。")
+
+    root = snapshot_root(store) if directory is None else None
+    path = directory or os.path.join(root, datetime.now().strftime(NAME_FORMAT))
+    os.makedirs(path, exist_ok=directory is not None)
+    manifest = {'format': fmt, 'store': store or data_manager.DEFAULT_STORE,
+                'created_at': datetime.now().isoformat(timespec='seconds'),
+                'identity': identity, 'versions': versions, 'tables': {}}
+    for table, df in tables.items():
+        entry = {'rows': len(df)}
+        if fmt == 'parquet':
+            df.to_parquet(os.path.join(path, f"{table}.parquet"), engine='pyarrow', index=False)
+        else:
+            entry['columns'] = _write_npy(df, os.path.join(path, table))
+        manifest['tables'][table] = entry
+    # 清单最后写入：读取时没有清单的目录视为未完成的快照
+    with open(os.path.join(path, MANIFEST_FILE), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    if root is not None:
+        _prune(root, keep)
+    return path
+
+
+# --- 读取 ---
+
+def read_manifest(path) -> dict:
+    with open(os.path.join(path, MANIFEST_FILE), encoding='utf-8') as f:
+        return json.load(f)
+
+
+def latest_snapshot(store=None):
+    """店铺最近一份完整快照的目录，没有时返回 None。"""
+    root = snapshot_root(store)
+    if not os.path.isdir(root):
+        return None
+    for name in sorted(os.listdir(root), reverse=True):
+        if os.path.exists(os.path.join(root, name, MANIFEST_FILE)):
+            return os.path.join(root, name)
+    return None
+
+
+def needs_refresh(versions, store=None, interval=REFRESH_INTERVAL_SECONDS) -> bool:
+    """
+    app 是否应该在后台重新导出快照。没有可用的快照 (或快照来自另一个数据库) 时立即导出；
+    快照只是落后于数据库时，距上次导出超过 interval 秒才再导出，连续录入期间不会反复读取全部历史。
+    :param versions: 数据库当前的版本 (source_versions 的结果)
+    """
+    path = latest_snapshot(store)
+    if path is None:
+        return True
+    try:
+        manifest = read_manifest(path)
+    except (OSError, ValueError):
+        return True
+    identity = data_manager.get_db_identity(store)
+    if manifest.get('identity', {}).get('db_id') != identity['db_id']:
+        return True
+    if manifest['versions'] == versions and manifest['identity'] == identity:
+        return False
+    return time.time() - os.path.getmtime(os.path.join(path, MANIFEST_FILE)) >= interval
+
+
+def load_snapshot(path, tables=TABLES) -> dict:
+    """
+    读取快照中的表，返回 {表名: DataFrame}，各表的列和类型与 data_manager 从数据库读取的结果相同。
+    NumPy 格式的数值列是只读的内存映射，读取几乎不花时间；Parquet 格式以内存映射方式解码。
+    """
+    manifest = read_manifest(path)
+    loaded = {}
+    for table in tables:
+        entry = manifest['tables'][table]
+        if manifest['format'] == 'parquet':
+            loaded[table] = pd.read_parquet(os.path.join(path, f"{table}.parquet"), engine='pyarrow', memory_map=True)
+        else:
+            loaded[table] = _read_npy(os.path.join(path, table), entry['columns'], entry['rows'])
+    return loaded
+
+
+def load_fresh_table(table, version, store=None):
+    """
+    最近一份快照中的表与数据库的当前数据一致 (导出时的版本等于 version) 时直接从快照读取，否则返回 None。
+    app 冷启动时用它代替逐行读取 SQLite；数据已经变化时调用方回退到数据库。
+    """
+    path = latest_snapshot(store)
+    if path is None:
+        return None
+    try:
+        manifest = read_manifest(path)
+        # 变更计数在重建或恢复数据库后会重新计数，先确认快照来自同一个数据库、且之后没有新的操作
+        if manifest.get('identity') != data_manager.get_db_identity(store):
+            return None
+        recorded = manifest['versions'][table]
+        if (list(version) if isinstance(version, tuple) else version) != recorded:
+            return None
+        return load_snapshot(path, tables=(table,))[table]
+    except (OSError, ValueError, KeyError, ImportError) as e:
+        print(f"读取列式快照失败，改为从数据库读取: {e}")
+        return None
+
+
+def import_snapshot(path, store=None) -> dict:
+    """
+    把快照中的主数据和提前回款导入店铺 (店铺中不能已有这些数据)，账本随之重新计算。
+    导入记为一次操作，可以撤销。返回 {表名: 导入的行数}。
+    """
+    tables = load_snapshot(path, tables=(data_manager.DAILY_TABLE, data_manager.EARLY_PAYOUT_TABLE))
+    return data_manager.import_tables(tables[data_manager.DAILY_TABLE], tables[data_manager.EARLY_PAYOUT_TABLE],
+                                      store=store)
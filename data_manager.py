@@ -2,18 +2,235 @@
 
 import sqlite3
 import pandas as pd
+import math
 import os
+import re
+import queue
+import atexit
+import threading
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from datetime import timedelta
+
+import business_calendar
+import finance_calculator
+import journal
+import payout_schedule
+import profiler
 
 DB_FILE = 'finance_compass.db'
 DAILY_TABLE = 'daily_data'
 EARLY_PAYOUT_TABLE = 'early_payouts'
+LEDGER_TABLE = 'computed_ledger'
+ORDERS_TABLE = 'orders'
+ORDER_SUMMARY_VIEW = 'daily_order_summary'
+VERSION_TABLE = 'db_version'
+STORE_SETTINGS_TABLE = 'store_settings'
+PAYOUT_CHANNELS_TABLE = 'payout_channels'
+ROLLUP_TABLE = 'ledger_rollups'
+IDENTITY_TABLE = 'db_identity'
 
+# 带变更计数的表：任何一行的增删改都会让该表的版本号 +1
+VERSIONED_TABLES = [DAILY_TABLE, EARLY_PAYOUT_TABLE, ORDERS_TABLE, STORE_SETTINGS_TABLE, PAYOUT_CHANNELS_TABLE]
+# 物化账本由这些表决定：它们的变更计数合起来就是账本的版本
+LEDGER_SOURCE_TABLES = [DAILY_TABLE, EARLY_PAYOUT_TABLE, STORE_SETTINGS_TABLE, PAYOUT_CHANNELS_TABLE]
 
-def init_db():
-    """初始化数据库。"""
-    conn = sqlite3.connect(DB_FILE)
-    c = conn.cursor()
-    
+# --- 多店铺 ---
+# 每个店铺的数据放在独立的数据库文件中 (按店铺分区)：默认店铺使用 DB_FILE，
+# 其他店铺保存在 DB_FILE 同目录下的 STORES_DIR 文件夹里。各店铺的账本互不依赖，可以并行计算。
+DEFAULT_STORE = '默认店铺'
+STORES_DIR = 'stores'
+STORE_NAME_PATTERN = re.compile(r'^[\w\-]+$')
+
+# 营业日历：DB_FILE 同目录下的节假日文件 (格式见 business_calendar)，所有店铺共用；文件不存在时回款不按营业日顺延。
+# 账本记录了计算时所用日历的指纹，文件内容变化后下一次刷新会整本重算。
+HOLIDAY_FILE = 'holidays.txt'
+CALENDAR_SETTING = 'calendar_fingerprint'
+
+# 操作日志 (见 journal)：记录这些表 ({表名: 行键列}) 的每一次修改，用于撤销和查询历史时点的数据。
+# 顺序即撤销时的恢复顺序：主数据的订单汇总由订单表的触发器维护，所以主数据放在最后恢复。
+JOURNAL_TABLES = {ORDERS_TABLE: 'order_id', EARLY_PAYOUT_TABLE: 'payout_id', STORE_SETTINGS_TABLE: 'setting',
+                  PAYOUT_CHANNELS_TABLE: 'channel', DAILY_TABLE: 'Date'}
+# 快照和历史回放只需要决定账本的表
+JOURNAL_SNAPSHOT_TABLES = {table: JOURNAL_TABLES[table] for table in LEDGER_SOURCE_TABLES}
+# 营业日历的指纹由节假日文件派生，不记入日志
+JOURNAL_IGNORED_KEYS = {STORE_SETTINGS_TABLE: [CALENDAR_SETTING]}
+
+# 物化账本的列：主数据列 + finance_calculator 计算出的列
+LEDGER_COLUMNS = ['Date'] + finance_calculator.FILL_COLS + ['Notes'] + finance_calculator.COMPUTED_COLS
+
+# 账本的周期汇总：周期 -> 由日期得到周期第一天的 SQL 表达式 (周从周一开始)
+ROLLUP_PERIODS = {
+    'week': "date({date}, 'weekday 0', '-6 days')",
+    'month': "date({date}, 'start of month')",
+    'quarter': "date({date}, 'start of month', printf('-%d months', (CAST(strftime('%m', {date}) AS INTEGER) - 1) % 3))",
+}
+# 周期内逐日相加的列，以及取周期最后一天数值的列 (期末余额、期末累计利润)
+ROLLUP_SUM_COLS = ['Daily_Order_Count', 'Total_Daily_Cost', 'Total_Daily_Profit', 'Refunds_Received_Today',
+                   'Estimated_Profit_Loss_From_Refunds', 'Other_Income_Today',
+                   'daily_outflow', 'daily_actual_inflow', 'daily_net_cash_flow', 'daily_profit']
+ROLLUP_END_COLS = ['bank_balance', 'cumulative_profit']
+# 界面和报告中显示的名称
+ROLLUP_PERIOD_LABELS = {'week': '周', 'month': '月', 'quarter': '季度'}
+ROLLUP_COLUMN_LABELS = {
+    'period_start': '周期开始', 'last_date': '截至', 'days': '天数', 'Daily_Order_Count': '订单数',
+    'Total_Daily_Cost': '成本', 'Total_Daily_Profit': '毛利润', 'Refunds_Received_Today': '退款',
+    'Estimated_Profit_Loss_From_Refunds': '退款利润损失', 'Other_Income_Today': '其他入账',
+    'daily_outflow': '现金流出', 'daily_actual_inflow': '回款流入', 'daily_net_cash_flow': '净现金流',
+    'daily_profit': '净利润', 'bank_balance': '期末余额', 'cumulative_profit': '期末累计利润',
+}
+
+
+# --- 连接池与会话层 ---
+# Streamlit 的每次 rerun 都运行在不同的脚本线程里，这里按数据库文件维护一个线程安全的连接池，
+# 连接以 WAL 模式打开 (读写互不阻塞)，借出期间只被一个线程使用。
+POOL_SIZE = 4
+BUSY_TIMEOUT_SECONDS = 30
+
+
+class ConnectionPool:
+    """一个数据库文件对应的 SQLite 连接池。"""
+
+    def __init__(self, db_file, size=POOL_SIZE):
+        self.db_file = db_file
+        self.size = size
+        self._idle = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_file, timeout=BUSY_TIMEOUT_SECONDS, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        # INSERT OR REPLACE 覆盖已有行时也触发 DELETE 触发器，操作日志才能记下被覆盖的旧行
+        conn.execute("PRAGMA recursive_triggers=ON")
+        return conn
+
+    def acquire(self):
+        """借出一个连接：优先复用空闲连接，未达上限时新建，否则等待归还。"""
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if self._created < self.size:
+                self._created += 1
+                return self._connect()
+        return self._idle.get()
+
+    def release(self, conn):
+        self._idle.put(conn)
+
+    def close_all(self):
+        """关闭所有空闲连接 (进程退出或切换数据库时调用)。"""
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            conn.close()
+            with self._lock:
+                self._created -= 1
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+_schema_ready = set()
+_schema_lock = threading.Lock()
+
+def store_db_file(store=None):
+    """返回店铺对应的数据库文件路径 (store 为空时是默认店铺)。"""
+    if store is None or store == DEFAULT_STORE:
+        return DB_FILE
+    return os.path.join(os.path.dirname(DB_FILE), STORES_DIR, f"{store}.db")
+
+def _get_pool(db_file):
+    """返回数据库文件对应的连接池 (按需创建)。"""
+    with _pools_lock:
+        pool = _pools.get(db_file)
+        if pool is None:
+            pool = _pools[db_file] = ConnectionPool(db_file)
+        return pool
+
+@contextmanager
+def session(store=None):
+    """
+    从店铺数据库的连接池借出一个连接作为一次会话。
+    正常结束时提交，出现异常时回滚，最后把连接归还连接池。
+    """
+    pool = _get_pool(store_db_file(store))
+    profiler.count('数据库会话')
+    conn = pool.acquire()
+    try:
+        yield conn
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        pool.release(conn)
+
+@atexit.register
+def close_all_connections():
+    """关闭所有连接池中的连接。"""
+    with _pools_lock:
+        for pool in _pools.values():
+            pool.close_all()
+        _pools.clear()
+
+
+def get_data_versions(store=None):
+    """
+    返回各数据表的变更计数，例如 {'daily_data': 12, 'early_payouts': 3, 'orders': 40, ...}。
+    计数由触发器在每次写入时递增，读取只是一次很小的查询，适合每次页面刷新时调用。
+    """
+    with session(store) as conn:
+        return dict(conn.execute(f"SELECT table_name, version FROM {VERSION_TABLE}").fetchall())
+
+def get_ledger_version(store=None):
+    """
+    返回店铺物化账本的版本 (账本来源表的变更计数元组)，可直接作为缓存键。
+    节假日文件不在数据库里，因此先同步营业日历：文件变化后重算账本并更新店铺设置，版本随之变化。
+    """
+    sync_business_calendar(store)
+    versions = get_data_versions(store)
+    return tuple(versions[table] for table in LEDGER_SOURCE_TABLES)
+
+def get_db_identity(store=None):
+    """
+    返回店铺数据库的身份：建库时生成的 ID 和操作日志中最后一次操作 (编号, 时间)。
+    与变更计数一起使用：ID 区分重建的数据库，最后一次操作区分从备份恢复后又写入了不同数据的数据库。
+    """
+    with session(store) as conn:
+        c = conn.cursor()
+        c.execute(f"SELECT db_id FROM {IDENTITY_TABLE}")
+        return {'db_id': c.fetchone()[0], 'last_operation': journal.last_operation(c)}
+
+def _normalize_date(date_str):
+    """统一日期字符串为 YYYY-MM-DD，保证按字符串比较时与日期顺序一致。"""
+    if date_str is None:
+        return None
+    return pd.Timestamp(date_str).strftime('%Y-%m-%d')
+
+def init_db(store=None):
+    """初始化店铺的数据库。同一进程内每个店铺只会真正执行一次，后续调用直接返回。"""
+    db_file = store_db_file(store)
+    if db_file in _schema_ready:
+        return
+    with _schema_lock:
+        if db_file in _schema_ready:
+            return
+        with session(store) as conn:
+            _create_schema(conn.cursor())
+            journal.create_schema(conn.cursor(), JOURNAL_TABLES, LEDGER_SOURCE_TABLES, JOURNAL_IGNORED_KEYS)
+            # 旧数据库第一次升级时，或账本落后于原始数据时，补齐账本
+            refresh_computed_ledger(conn)
+        _schema_ready.add(db_file)
+    print("数据库初始化完成，所有表已准备就绪。")
+
+def _create_schema(c):
+    """创建所有表和索引。"""
     # 主数据表 (无变化)
     c.execute(f'''
         CREATE TABLE IF NOT EXISTS {DAILY_TABLE} (
@@ -32,57 +249,325 @@ def init_db():
             Amount REAL NOT NULL
         )
     ''')
-    print("数据库初始化完成，所有表已准备就绪。")
-    conn.commit()
-    conn.close()
+    c.execute(f"CREATE INDEX IF NOT EXISTS idx_{EARLY_PAYOUT_TABLE}_payout_date ON {EARLY_PAYOUT_TABLE} (Payout_Date)")
+    c.execute(f"CREATE INDEX IF NOT EXISTS idx_{EARLY_PAYOUT_TABLE}_original_date ON {EARLY_PAYOUT_TABLE} (Original_Order_Date)")
+
+    # 物化账本表：保存 calculate_finances 的计算结果，按日期索引
+    c.execute(f'''
+        CREATE TABLE IF NOT EXISTS {LEDGER_TABLE} (
+            Date TEXT PRIMARY KEY, Daily_Order_Count INTEGER, Total_Daily_Cost REAL,
+            Total_Daily_Profit REAL, Refunds_Received_Today REAL,
+            Estimated_Profit_Loss_From_Refunds REAL, Other_Income_Today REAL, Notes TEXT,
+            daily_outflow REAL, daily_actual_inflow REAL, daily_net_cash_flow REAL,
+            bank_balance REAL, daily_profit REAL, cumulative_profit REAL
+        )
+    ''')
+
+    # 周期汇总表：按周/月/季度汇总的物化账本。账本的行被写入或删除时，触发器删除该日期所在及之后的周期，
+    # refresh_computed_ledger 再从第一个缺少汇总的周期开始重新聚合，每次写入通常只重算当前所在的一个周期
+    sum_cols = ', '.join(f"{col} {'INTEGER' if col == 'Daily_Order_Count' else 'REAL'}" for col in ROLLUP_SUM_COLS)
+    end_cols = ', '.join(f"{col} REAL" for col in ROLLUP_END_COLS)
+    c.execute(f'''
+        CREATE TABLE IF NOT EXISTS {ROLLUP_TABLE} (
+            period TEXT NOT NULL, period_start TEXT NOT NULL, last_date TEXT NOT NULL, days INTEGER,
+            {sum_cols}, {end_cols},
+            PRIMARY KEY (period, period_start)
+        )
+    ''')
+    c.execute(f"CREATE INDEX IF NOT EXISTS idx_{ROLLUP_TABLE}_last_date ON {ROLLUP_TABLE} (last_date)")
+    for operation, changed_date in (('INSERT', 'NEW.Date'), ('UPDATE', 'MIN(OLD.Date, NEW.Date)'), ('DELETE', 'OLD.Date')):
+        c.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_{LEDGER_TABLE}_rollup_{operation.lower()} AFTER {operation} ON {LEDGER_TABLE}
+            BEGIN
+                DELETE FROM {ROLLUP_TABLE} WHERE last_date >= {changed_date};
+            END
+        ''')
+
+    # 逐单明细表：精细录入的每一笔订单
+    c.execute(f'''
+        CREATE TABLE IF NOT EXISTS {ORDERS_TABLE} (
+            order_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            Order_Date TEXT NOT NULL,
+            Cost REAL NOT NULL,
+            Profit REAL NOT NULL
+        )
+    ''')
+    c.execute(f"CREATE INDEX IF NOT EXISTS idx_{ORDERS_TABLE}_order_date ON {ORDERS_TABLE} (Order_Date)")
+
+    # 触发器：订单的增删改会增量地同步到主数据表的当日订单数/总成本/总利润，
+    # 仪表盘仍然只读取 daily_data，不需要每次从逐单数据重新汇总
+    c.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_{ORDERS_TABLE}_insert AFTER INSERT ON {ORDERS_TABLE}
+        BEGIN
+            INSERT OR IGNORE INTO {DAILY_TABLE} (Date, Daily_Order_Count, Total_Daily_Cost, Total_Daily_Profit,
+                                                 Refunds_Received_Today, Estimated_Profit_Loss_From_Refunds, Other_Income_Today)
+            VALUES (NEW.Order_Date, 0, 0, 0, 0, 0, 0);
+            UPDATE {DAILY_TABLE} SET Daily_Order_Count = Daily_Order_Count + 1,
+                                     Total_Daily_Cost = Total_Daily_Cost + NEW.Cost,
+                                     Total_Daily_Profit = Total_Daily_Profit + NEW.Profit
+            WHERE Date = NEW.Order_Date;
+        END
+    ''')
+    c.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_{ORDERS_TABLE}_delete AFTER DELETE ON {ORDERS_TABLE}
+        BEGIN
+            UPDATE {DAILY_TABLE} SET Daily_Order_Count = Daily_Order_Count - 1,
+                                     Total_Daily_Cost = Total_Daily_Cost - OLD.Cost,
+                                     Total_Daily_Profit = Total_Daily_Profit - OLD.Profit
+            WHERE Date = OLD.Order_Date;
+        END
+    ''')
+    c.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_{ORDERS_TABLE}_update AFTER UPDATE OF Order_Date, Cost, Profit ON {ORDERS_TABLE}
+        BEGIN
+            UPDATE {DAILY_TABLE} SET Daily_Order_Count = Daily_Order_Count - 1,
+                                     Total_Daily_Cost = Total_Daily_Cost - OLD.Cost,
+                                     Total_Daily_Profit = Total_Daily_Profit - OLD.Profit
+            WHERE Date = OLD.Order_Date;
+            INSERT OR IGNORE INTO {DAILY_TABLE} (Date, Daily_Order_Count, Total_Daily_Cost, Total_Daily_Profit,
+                                                 Refunds_Received_Today, Estimated_Profit_Loss_From_Refunds, Other_Income_Today)
+            VALUES (NEW.Order_Date, 0, 0, 0, 0, 0, 0);
+            UPDATE {DAILY_TABLE} SET Daily_Order_Count = Daily_Order_Count + 1,
+                                     Total_Daily_Cost = Total_Daily_Cost + NEW.Cost,
+                                     Total_Daily_Profit = Total_Daily_Profit + NEW.Profit
+            WHERE Date = NEW.Order_Date;
+        END
+    ''')
+
+    # 逐单分析用的按日汇总视图
+    c.execute(f'''
+        CREATE VIEW IF NOT EXISTS {ORDER_SUMMARY_VIEW} AS
+        SELECT Order_Date AS Date, COUNT(*) AS Order_Count,
+               SUM(Cost) AS Total_Cost, SUM(Profit) AS Total_Profit,
+               AVG(Cost) AS Avg_Order_Cost, AVG(Profit) AS Avg_Order_Profit,
+               MIN(Profit) AS Min_Order_Profit, MAX(Profit) AS Max_Order_Profit
+        FROM {ORDERS_TABLE}
+        GROUP BY Order_Date
+    ''')
+
+    # 店铺设置表：目前只有期初资金 (账本首日之前的银行余额)
+    c.execute(f'''
+        CREATE TABLE IF NOT EXISTS {STORE_SETTINGS_TABLE} (
+            setting TEXT PRIMARY KEY,
+            value REAL NOT NULL
+        )
+    ''')
+    c.execute(f"INSERT OR IGNORE INTO {STORE_SETTINGS_TABLE} (setting, value) VALUES ('initial_cash', ?)",
+              (finance_calculator.INITIAL_CASH,))
+
+    # 回款渠道：每个渠道的销售占比和回款分布 (类型 + 参数文本，见 payout_schedule)；没有记录时使用默认的固定回款周期
+    c.execute(f'''
+        CREATE TABLE IF NOT EXISTS {PAYOUT_CHANNELS_TABLE} (
+            channel TEXT PRIMARY KEY,
+            share REAL NOT NULL,
+            kind TEXT NOT NULL,
+            params TEXT NOT NULL
+        )
+    ''')
+
+    # 数据库标识：建库时生成一次的随机 ID。变更计数在重建数据库后会从头开始，
+    # 数据库外的缓存 (列式快照) 需要同时核对它，才能确认计数来自同一个数据库
+    c.execute(f"CREATE TABLE IF NOT EXISTS {IDENTITY_TABLE} (db_id TEXT NOT NULL)")
+    c.execute(f"INSERT INTO {IDENTITY_TABLE} (db_id) SELECT ? WHERE NOT EXISTS (SELECT 1 FROM {IDENTITY_TABLE})",
+              (uuid.uuid4().hex,))
+
+    # 变更计数表：由触发器维护，供界面缓存判断数据是否变化
+    c.execute(f'''
+        CREATE TABLE IF NOT EXISTS {VERSION_TABLE} (
+            table_name TEXT PRIMARY KEY,
+            version INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+    for table in VERSIONED_TABLES:
+        c.execute(f"INSERT OR IGNORE INTO {VERSION_TABLE} (table_name, version) VALUES (?, 0)", (table,))
+        for operation in ('INSERT', 'UPDATE', 'DELETE'):
+            c.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS trg_{table}_version_{operation.lower()} AFTER {operation} ON {table}
+                BEGIN
+                    UPDATE {VERSION_TABLE} SET version = version + 1 WHERE table_name = '{table}';
+                END
+            ''')
 
-def check_date_exists(date_str):
+def _begin_operation(c, description):
+    """在操作日志中登记一次写入操作 (必须是事务中的第一个写入)，之后的修改都可以作为一个整体撤销。"""
+    return journal.begin_operation(c, description, JOURNAL_SNAPSHOT_TABLES, JOURNAL_IGNORED_KEYS)
+
+def check_date_exists(date_str, store=None):
     """检查指定日期的数据是否已存在于主数据表中。"""
-    conn = sqlite3.connect(DB_FILE)
-    c = conn.cursor()
-    c.execute(f"SELECT COUNT(1) FROM {DAILY_TABLE} WHERE Date = ?", (date_str,))
-    exists = c.fetchone()[0] > 0
-    conn.close()
+    date_str = _normalize_date(date_str)
+    with session(store) as conn:
+        c = conn.cursor()
+        c.execute(f"SELECT COUNT(1) FROM {DAILY_TABLE} WHERE Date = ?", (date_str,))
+        exists = c.fetchone()[0] > 0
     return exists
 
+def validate_daily_values(order_count=0, total_cost=0.0, total_profit=0.0, refunds=0.0, other_income=0.0):
+    """
+    校验单日主数据的数值 (命令行和本地接口共用)：订单数、成本、利润、退款和其他入账都不能为负数。
+    逐单录入时利润允许为负 (亏本订单)，只需校验退款和其他入账。
+    :raises ValueError: 数值无效，消息可直接显示给用户。
+    """
+    if not all(math.isfinite(value) for value in (order_count, total_cost, total_profit, refunds, other_income)):
+        raise ValueError("数值必须是有限的数字。")
+    if order_count < 0:
+        raise ValueError("订单数不能为负数。")
+    if total_cost < 0 or total_profit < 0:
+        raise ValueError("成本和利润不能为负数。")
+    if refunds < 0 or other_income < 0:
+        raise ValueError("退款和其他入账不能为负数。")
+
+
+def validate_early_payout_amount(amount):
+    """校验提前回款金额 (命令行和本地接口共用)。:raises ValueError: 金额不是正的有限数。"""
+    if not math.isfinite(amount) or amount <= 0:
+        raise ValueError("金额必须大于 0。")
+
+
 # save_daily_data 函数参数和SQL语句需要更新
-def save_daily_data(date_str, order_count, total_cost, total_profit, refunds, estimated_profit_loss_from_refunds, other_income, notes):
-    """将单日数据保存或更新到主数据表中。"""
-    conn = sqlite3.connect(DB_FILE)
-    c = conn.cursor()
-    c.execute(f'''
-        INSERT OR REPLACE INTO {DAILY_TABLE} (Date, Daily_Order_Count, Total_Daily_Cost, Total_Daily_Profit, 
-                                            Refunds_Received_Today, Estimated_Profit_Loss_From_Refunds, Other_Income_Today, Notes)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-    ''', (date_str, order_count, total_cost, total_profit, refunds, estimated_profit_loss_from_refunds, other_income, notes))
-    conn.commit()
-    conn.close()
+def save_daily_data(date_str, order_count, total_cost, total_profit, refunds, estimated_profit_loss_from_refunds, other_income, notes,
+                    store=None):
+    """
+    将单日数据保存或更新到主数据表中 (快速录入)。
+    快速录入的汇总数是当日的权威数据，该日期原有的逐单明细会被清除。
+    """
+    date_str = _normalize_date(date_str)
+    with session(store) as conn:
+        c = conn.cursor()
+        _begin_operation(c, f"保存 {date_str} 的主数据")
+        c.execute(f"DELETE FROM {ORDERS_TABLE} WHERE Order_Date = ?", (date_str,))
+        c.execute(f'''
+            INSERT OR REPLACE INTO {DAILY_TABLE} (Date, Daily_Order_Count, Total_Daily_Cost, Total_Daily_Profit, 
+                                                Refunds_Received_Today, Estimated_Profit_Loss_From_Refunds, Other_Income_Today, Notes)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        ''', (date_str, order_count, total_cost, total_profit, refunds, estimated_profit_loss_from_refunds, other_income, notes))
+        _invalidate_ledger(c, date_str)
+        refresh_computed_ledger(conn)
     print(f"日期 {date_str} 的主数据已成功保存。")
 
+def save_orders(date_str, orders, refunds, estimated_profit_loss_from_refunds, other_income, notes, store=None):
+    """
+    保存精细录入的一天：逐单明细写入订单表，当日汇总由触发器自动累加到主数据表。
+    该日期原有的明细和汇总会被替换。
+    :param orders: (成本, 利润) 元组列表。
+    """
+    date_str = _normalize_date(date_str)
+    with session(store) as conn:
+        c = conn.cursor()
+        _begin_operation(c, f"逐单录入 {date_str} ({len(orders)} 笔)")
+        c.execute(f"DELETE FROM {ORDERS_TABLE} WHERE Order_Date = ?", (date_str,))
+        # 汇总列先置零，之后每插入一笔订单由触发器累加
+        c.execute(f'''
+            INSERT OR REPLACE INTO {DAILY_TABLE} (Date, Daily_Order_Count, Total_Daily_Cost, Total_Daily_Profit,
+                                                Refunds_Received_Today, Estimated_Profit_Loss_From_Refunds, Other_Income_Today, Notes)
+            VALUES (?, 0, 0, 0, ?, ?, ?, ?)
+        ''', (date_str, refunds, estimated_profit_loss_from_refunds, other_income, notes))
+        c.executemany(f"INSERT INTO {ORDERS_TABLE} (Order_Date, Cost, Profit) VALUES (?, ?, ?)",
+                      [(date_str, float(cost), float(profit)) for cost, profit in orders])
+        _invalidate_ledger(c, date_str)
+        refresh_computed_ledger(conn)
+    print(f"日期 {date_str} 的 {len(orders)} 笔订单明细及主数据已成功保存。")
+
+BULK_BATCH_SIZE = 1000
+
+@profiler.profiled()
+def save_daily_data_bulk(rows, batch_size=BULK_BATCH_SIZE, store=None):
+    """
+    批量保存多日主数据 (用于导入平台订单导出文件)。
+    全部行在一个事务里分批用 executemany 写入；已存在的日期只覆盖订单数/成本/利润/退款，
+    保留原有的其他入账和备注 (这些日期原有的逐单明细会被清除)。写完后只刷新一次账本。
+    整个导入在操作日志中记为一次操作：中途失败时全部回滚，撤销时整体撤销，不会与其他连接的写入交错。
+    :param rows: (日期, 订单数, 总成本, 总利润, 退款, 估算利润损失, 备注) 元组列表。
+    :return: 写入的天数。
+    """
+    rows = [(_normalize_date(r[0]),) + tuple(r[1:]) for r in rows]
+    if not rows:
+        return 0
+    with session(store) as conn:
+        c = conn.cursor()
+        _begin_operation(c, f"批量保存 {len(rows)} 天的主数据")
+        for start in range(0, len(rows), batch_size):
+            batch = rows[start:start + batch_size]
+            c.executemany(f"DELETE FROM {ORDERS_TABLE} WHERE Order_Date = ?", [(r[0],) for r in batch])
+            c.executemany(f'''
+                INSERT INTO {DAILY_TABLE} (Date, Daily_Order_Count, Total_Daily_Cost, Total_Daily_Profit,
+                                           Refunds_Received_Today, Estimated_Profit_Loss_From_Refunds, Other_Income_Today, Notes)
+                VALUES (?, ?, ?, ?, ?, ?, 0, ?)
+                ON CONFLICT(Date) DO UPDATE SET
+                    Daily_Order_Count = excluded.Daily_Order_Count,
+                    Total_Daily_Cost = excluded.Total_Daily_Cost,
+                    Total_Daily_Profit = excluded.Total_Daily_Profit,
+                    Refunds_Received_Today = excluded.Refunds_Received_Today,
+                    Estimated_Profit_Loss_From_Refunds = excluded.Estimated_Profit_Loss_From_Refunds
+            ''', batch)
+        _invalidate_ledger(c, min(r[0] for r in rows))
+        refresh_computed_ledger(conn)
+    print(f"已批量保存 {len(rows)} 天的主数据。")
+    return len(rows)
+
+def _table_rows(df, date_columns):
+    """把 DataFrame 转成可直接 executemany 的元组列表：日期列格式化为 YYYY-MM-DD，缺失值为 NULL。"""
+    df = df.copy()
+    for col in date_columns:
+        df[col] = df[col].dt.strftime('%Y-%m-%d')
+    return list(df.astype(object).where(df.notna(), None).itertuples(index=False, name=None))
+
+def import_tables(df_daily, df_early, store=None):
+    """
+    把另一份数据 (例如列式快照) 中的主数据和提前回款原样写入店铺，提前回款保留原来的 ID。
+    店铺中已有主数据或提前回款时拒绝导入 (抛出 ValueError)，避免两份数据混在一起。
+    整个导入在一个事务中完成，记为一次操作，可以撤销。返回 {表名: 导入的行数}。
+    """
+    with session(store) as conn:
+        c = conn.cursor()
+        # 先拿到写锁再检查：否则检查通过后、第一次写入前，其他连接写入的数据会和导入的数据混在一起
+        c.execute("BEGIN IMMEDIATE")
+        for table in (DAILY_TABLE, EARLY_PAYOUT_TABLE):
+            if c.execute(f"SELECT 1 FROM {table} LIMIT 1").fetchone():
+                raise ValueError(f"店铺中已有 {table} 数据，只能导入到没有数据的店铺。")
+        _begin_operation(c, f"导入 {len(df_daily)} 天的主数据和 {len(df_early)} 笔提前回款")
+        for table, df, date_columns in ((DAILY_TABLE, df_daily, ['Date']),
+                                        (EARLY_PAYOUT_TABLE, df_early, ['Payout_Date', 'Original_Order_Date'])):
+            if df.empty:
+                continue
+            columns = ', '.join(df.columns)
+            placeholders = ', '.join('?' * len(df.columns))
+            c.executemany(f"INSERT INTO {table} ({columns}) VALUES ({placeholders})", _table_rows(df, date_columns))
+        c.execute(f"DELETE FROM {LEDGER_TABLE}")
+        refresh_computed_ledger(conn)
+    print(f"已导入 {len(df_daily)} 天的主数据和 {len(df_early)} 笔提前回款。")
+    return {DAILY_TABLE: len(df_daily), EARLY_PAYOUT_TABLE: len(df_early)}
+
 # save_early_payout 参数和SQL语句需要更新
-def save_early_payout(payout_date, original_order_date, amount):
+def save_early_payout(payout_date, original_order_date, amount, store=None):
     """保存一条提前回款记录。original_order_date 可以为 None。"""
-    conn = sqlite3.connect(DB_FILE)
-    c = conn.cursor()
-    c.execute(f'''
-        INSERT INTO {EARLY_PAYOUT_TABLE} (Payout_Date, Original_Order_Date, Amount)
-        VALUES (?, ?, ?)
-    ''', (payout_date, original_order_date, amount))
-    conn.commit()
-    conn.close()
+    payout_date, original_order_date = _normalize_date(payout_date), _normalize_date(original_order_date)
+    with session(store) as conn:
+        c = conn.cursor()
+        _begin_operation(c, f"新增 {payout_date} 的提前回款 {amount:.2f} 元")
+        c.execute(f'''
+            INSERT INTO {EARLY_PAYOUT_TABLE} (Payout_Date, Original_Order_Date, Amount)
+            VALUES (?, ?, ?)
+        ''', (payout_date, original_order_date, amount))
+        _invalidate_ledger(c, finance_calculator.payout_change_date(payout_date, original_order_date,
+                                                                    _read_payout_kernel(c)))
+        refresh_computed_ledger(conn)
     if original_order_date:
         print(f"一笔来自 {original_order_date} 订单的提前回款 {amount:.2f} 元已记录在 {payout_date}。")
     else:
         print(f"一笔来源未知的提前回款 {amount:.2f} 元已记录在 {payout_date}。")
 
-def delete_early_payout_by_id(payout_id):
+def delete_early_payout_by_id(payout_id, store=None):
     """根据唯一的ID删除一条提前回款记录。"""
-    conn = sqlite3.connect(DB_FILE)
-    c = conn.cursor()
-    c.execute(f"DELETE FROM {EARLY_PAYOUT_TABLE} WHERE payout_id = ?", (payout_id,))
-    deleted_rows = c.rowcount
-    conn.commit()
-    conn.close()
+    with session(store) as conn:
+        c = conn.cursor()
+        _begin_operation(c, f"删除提前回款 #{payout_id}")
+        c.execute(f"SELECT Payout_Date, Original_Order_Date FROM {EARLY_PAYOUT_TABLE} WHERE payout_id = ?", (payout_id,))
+        payout = c.fetchone()
+        c.execute(f"DELETE FROM {EARLY_PAYOUT_TABLE} WHERE payout_id = ?", (payout_id,))
+        deleted_rows = c.rowcount
+        if payout:
+            _invalidate_ledger(c, finance_calculator.payout_change_date(*payout, kernel=_read_payout_kernel(c)))
+            refresh_computed_ledger(conn)
     if deleted_rows > 0:
         print(f"ID为 {payout_id} 的提前回款记录已删除。")
         return True
@@ -90,59 +575,648 @@ def delete_early_payout_by_id(payout_id):
         print(f"未找到ID为 {payout_id} 的记录。")
         return False
 
-def load_all_early_payouts():
-    """从提前回款表加载所有数据，并确保日期列被正确转换。"""
-    if not os.path.exists(DB_FILE): return pd.DataFrame()
-    conn = sqlite3.connect(DB_FILE)
+def delete_data_by_date(date_str, store=None):
+    """根据日期删除主数据表中的一条数据 (删除记入操作日志，可以用 undo_last_operation 撤销)。"""
+    date_str = _normalize_date(date_str)
+    with session(store) as conn:
+        c = conn.cursor()
+        _begin_operation(c, f"删除 {date_str} 的主数据")
+        c.execute(f"DELETE FROM {ORDERS_TABLE} WHERE Order_Date = ?", (date_str,))
+        c.execute(f"DELETE FROM {DAILY_TABLE} WHERE Date = ?", (date_str,))
+        _invalidate_ledger(c, date_str)
+        refresh_computed_ledger(conn)
+    print(f"日期 {date_str} 的主数据已删除。")
+
+def load_all_data(store=None, compact=False):
+    """从主数据表加载所有历史数据到DataFrame。compact=True 时为紧凑表示 (见 _read_daily_range)。"""
+    return load_data_range(store=store, compact=compact)
+
+def load_all_early_payouts(store=None, compact=False):
+    """从提前回款表加载所有数据到DataFrame。compact=True 时金额以分为单位 (int64)。"""
+    return load_early_payouts_range(store=store, compact=compact)
+
+
+# --- 按日期范围加载 ---
+# 所有范围查询都走日期列上的索引；省略的一端表示不限。
+MIN_DATE_STR = '0001-01-01'
+MAX_DATE_STR = '9999-12-31'
+
+def _date_bounds(start_date, end_date):
+    start = _normalize_date(start_date) if start_date is not None else MIN_DATE_STR
+    end = _normalize_date(end_date) if end_date is not None else MAX_DATE_STR
+    return start, end
+
+def _cents(column):
+    """SQL 表达式：把以元存储的 REAL 列在 SQLite 里直接四舍五入为整数分 (缺失按 0)。"""
+    return f"CAST(ROUND(COALESCE({column}, 0) * {finance_calculator.CENTS_PER_YUAN}) AS INTEGER) AS {column}"
+
+def _read_daily_range(conn, start_date=None, end_date=None, compact=False):
+    """
+    compact=True 时读取紧凑表示 (finance_calculator 的整数分模式)：金额在 SQL 中转换为分 (int64)，
+    订单数为 int32，备注为 category，不产生中间的 float64 列。
+    """
+    start, end = _date_bounds(start_date, end_date)
+    if not compact:
+        return pd.read_sql_query(f'SELECT * FROM {DAILY_TABLE} WHERE Date BETWEEN ? AND ? ORDER BY Date', conn,
+                                 params=(start, end), parse_dates=['Date'])
+    money_cols = ', '.join(_cents(col) for col in finance_calculator.MONEY_FILL_COLS)
+    df = pd.read_sql_query(f'''SELECT Date, COALESCE(Daily_Order_Count, 0) AS Daily_Order_Count, {money_cols}, Notes
+                               FROM {DAILY_TABLE} WHERE Date BETWEEN ? AND ? ORDER BY Date''', conn,
+                           params=(start, end), parse_dates=['Date'],
+                           dtype={col: 'int64' for col in finance_calculator.MONEY_FILL_COLS})
+    df['Daily_Order_Count'] = df['Daily_Order_Count'].astype(finance_calculator.ORDER_COUNT_DTYPE)
+    df['Notes'] = df['Notes'].astype('category')
+    return df
+
+def _read_early_payouts_range(conn, start_date=None, end_date=None, compact=False):
+    # 窗口内收到的回款影响现金流入；来源订单日期在 [start - 最晚回款天数, end] 内的回款会抵扣窗口内的计划回款
+    start, end = _date_bounds(start_date, end_date)
+    origin_start = start
+    if start_date is not None:
+        lookback_days = finance_calculator.payout_lookback_days(start, _read_payout_kernel(conn.cursor()), get_business_calendar())
+        origin_start = (pd.Timestamp(start) - timedelta(days=lookback_days)).strftime('%Y-%m-%d')
+    columns = f"payout_id, Payout_Date, Original_Order_Date, {_cents('Amount')}" if compact else '*'
+    return pd.read_sql_query(
+        f'''SELECT {columns} FROM {EARLY_PAYOUT_TABLE}
+            WHERE Payout_Date BETWEEN ? AND ? OR Original_Order_Date BETWEEN ? AND ?
+            ORDER BY payout_id''', conn,
+        params=(start, end, origin_start, end), parse_dates=['Payout_Date', 'Original_Order_Date'],
+        dtype={'Amount': 'int64'} if compact else None)
+
+def _read_ledger_seed(conn, start_date):
+    c = conn.cursor()
+    raw_start, _ = _raw_date_bounds(c)
+    c.execute(f"SELECT bank_balance, cumulative_profit FROM {LEDGER_TABLE} WHERE Date < ? ORDER BY Date DESC LIMIT 1",
+              (_normalize_date(start_date),))
+    row = c.fetchone()
+    opening_balance, opening_cumulative_profit = row if row else (_read_initial_cash(c), 0.0)
+    return {
+        'opening_balance': opening_balance,
+        'opening_cumulative_profit': opening_cumulative_profit,
+        'ledger_start': pd.Timestamp(raw_start) if raw_start else None,
+    }
+
+def _read_calculation_window(conn, start_date, end_date=None):
+    kernel, calendar = _read_payout_kernel(conn.cursor()), get_business_calendar()
+    prior_start = pd.Timestamp(start_date) - timedelta(days=finance_calculator.payout_lookback_days(start_date, kernel, calendar))
+    df_daily = _read_daily_range(conn, prior_start, end_date)
+    df_early = _read_early_payouts_range(conn, start_date, end_date)
+    seed = _read_ledger_seed(conn, start_date)
+    seed.update(kernel=kernel, calendar=calendar)
+    return df_daily, df_early, seed
+
+@profiler.profiled()
+def load_data_range(start_date=None, end_date=None, store=None, compact=False):
+    """按日期范围 (WHERE Date BETWEEN ? AND ?) 加载主数据，按日期排序。"""
+    if not os.path.exists(store_db_file(store)): return pd.DataFrame()
     try:
-        df = pd.read_sql_query(f'SELECT * FROM {EARLY_PAYOUT_TABLE}', conn)
-        if not df.empty:
-            df['Payout_Date'] = pd.to_datetime(df['Payout_Date'])
-            # Original_Order_Date 可能包含None(NaT)，所以要小心处理
-            df['Original_Order_Date'] = pd.to_datetime(df['Original_Order_Date'], errors='coerce')
-        return df
+        with session(store) as conn:
+            return _read_daily_range(conn, start_date, end_date, compact)
+    except Exception as e:
+        print(f"加载主数据失败: {e}")
+        return pd.DataFrame()
+
+@profiler.profiled()
+def load_early_payouts_range(start_date=None, end_date=None, store=None, compact=False):
+    """加载计算 [start_date, end_date] 账本所需的提前回款：窗口内收到的，以及来源订单落在窗口回款期内的。"""
+    if not os.path.exists(store_db_file(store)): return pd.DataFrame()
+    try:
+        with session(store) as conn:
+            return _read_early_payouts_range(conn, start_date, end_date, compact)
     except Exception as e:
         print(f"加载提前回款数据失败: {e}")
         return pd.DataFrame()
-    finally:
-        conn.close()
 
+def load_ledger_seed(start_date, store=None):
+    """
+    读取从 start_date 开始计算账本所需的期初状态：
+    前一天结束时的银行余额与累计利润 (取自物化账本)，以及整个账本的首日。
+    """
+    with session(store) as conn:
+        return _read_ledger_seed(conn, start_date)
 
-def delete_data_by_date(date_str):
-    """根据日期删除主数据表中的一条数据。(无变化)"""
-    conn = sqlite3.connect(DB_FILE)
-    c = conn.cursor()
-    c.execute(f"DELETE FROM {DAILY_TABLE} WHERE Date = ?", (date_str,))
-    conn.commit()
-    conn.close()
-    print(f"日期 {date_str} 的主数据已删除。")
+@profiler.profiled()
+def load_calculation_window(start_date, end_date=None, store=None):
+    """
+    加载从账本中间某一天开始计算所需的全部输入。
+    :return: (主数据 (含 start_date 之前回款回看期内的成本和利润), 提前回款, 期初状态、回款分布和营业日历)
+    """
+    with session(store) as conn:
+        return _read_calculation_window(conn, start_date, end_date)
+
+@profiler.profiled()
+def compute_ledger_window(start_date, end_date=None, store=None):
+    """只计算 [start_date, end_date] 这一段账本，耗时与窗口长度有关，与历史长度无关。"""
+    df_daily, df_early, seed = load_calculation_window(start_date, end_date, store)
+    if seed['ledger_start'] is None:
+        return pd.DataFrame()
+    if end_date is None:
+        _, end_date = finance_calculator.ledger_date_range(df_daily, df_early)
+    start_date = max(pd.Timestamp(start_date), seed['ledger_start'])
+    return finance_calculator.calculate_finances_window(df_daily, df_early, start_date, end_date, **seed)
 
-def load_all_data():
-    """从主数据表加载所有历史数据到DataFrame。(无变化)"""
-    if not os.path.exists(DB_FILE): return pd.DataFrame()
-    conn = sqlite3.connect(DB_FILE)
+@profiler.profiled()
+def compute_exact_ledger(store=None):
+    """
+    以整数分模式从原始数据全量计算账本：金额精确到分，长历史下没有浮点累积误差，占用内存也更少。
+    返回的金额列以分为单位 (int64)，可用 finance_calculator.ledger_to_yuan 转回元。
+    """
+    if not os.path.exists(store_db_file(store)): return pd.DataFrame()
+    with session(store) as conn:
+        df_daily = _read_daily_range(conn, compact=True)
+        df_early = _read_early_payouts_range(conn, compact=True)
+        initial_cash = _read_initial_cash(conn.cursor())
+        kernel = _read_payout_kernel(conn.cursor())
+    return finance_calculator.calculate_finances_cents(df_daily, df_early, initial_cash=initial_cash, kernel=kernel,
+                                                       calendar=get_business_calendar())
+
+@profiler.profiled()
+def load_orders(date_str=None, store=None):
+    """加载逐单明细；指定日期时只加载该日 (走 Order_Date 索引)。"""
+    if not os.path.exists(store_db_file(store)): return pd.DataFrame()
+    try:
+        with session(store) as conn:
+            if date_str is None:
+                df = pd.read_sql_query(f'SELECT * FROM {ORDERS_TABLE} ORDER BY Order_Date, order_id', conn)
+            else:
+                df = pd.read_sql_query(f'SELECT * FROM {ORDERS_TABLE} WHERE Order_Date = ? ORDER BY order_id', conn,
+                                       params=(_normalize_date(date_str),))
+        df['Order_Date'] = pd.to_datetime(df['Order_Date'])
+        return df
+    except Exception as e:
+        print(f"加载订单明细失败: {e}")
+        return pd.DataFrame()
+
+@profiler.profiled()
+def load_daily_order_summary(store=None):
+    """加载按日汇总的逐单统计 (订单数、平均单笔成本/利润、单笔利润极值)。"""
+    if not os.path.exists(store_db_file(store)): return pd.DataFrame()
     try:
-        df = pd.read_sql_query(f'SELECT * FROM {DAILY_TABLE}', conn)
+        with session(store) as conn:
+            df = pd.read_sql_query(f'SELECT * FROM {ORDER_SUMMARY_VIEW} ORDER BY Date', conn)
         df['Date'] = pd.to_datetime(df['Date'])
-        df = df.sort_values(by='Date').reset_index(drop=True)
         return df
     except Exception as e:
-        print(f"加载主数据失败: {e}")
+        print(f"加载订单统计失败: {e}")
         return pd.DataFrame()
-    finally:
-        conn.close()
 
-def load_all_early_payouts():
-    """从提前回款表加载所有数据到DataFrame。(无变化)"""
-    if not os.path.exists(DB_FILE): return pd.DataFrame()
-    conn = sqlite3.connect(DB_FILE)
+
+# --- 物化账本 (computed_ledger) ---
+# 账本只会被"截断"：任何写入都会在同一个事务里删除受影响日期及之后的行，
+# 随后 refresh_computed_ledger 从账本末尾接着往后算。截断之前的行不受这次修改影响，
+# 因此即使刷新中途失败，下一次刷新也能从正确的位置继续。
+
+def _invalidate_ledger(c, from_date):
+    """删除账本中 from_date 及之后的行 (与写入操作在同一事务中执行)。"""
+    from_date = pd.Timestamp(from_date).strftime('%Y-%m-%d')
+    c.execute(f"DELETE FROM {LEDGER_TABLE} WHERE Date >= ?", (from_date,))
+
+def _raw_date_bounds(c):
+    """返回原始数据 (主数据 + 提前回款收款日) 的最早和最晚日期，均走索引。"""
+    c.execute(f"SELECT MIN(Date), MAX(Date) FROM {DAILY_TABLE}")
+    bounds = [d for d in c.fetchone() if d]
+    c.execute(f"SELECT MIN(Payout_Date), MAX(Payout_Date) FROM {EARLY_PAYOUT_TABLE}")
+    bounds += [d for d in c.fetchone() if d]
+    if not bounds:
+        return None, None
+    return min(bounds), max(bounds)
+
+def _write_ledger_rows(c, df_calculated):
+    """把计算结果写入账本表。"""
+    df_rows = df_calculated.reindex(columns=LEDGER_COLUMNS)
+    df_rows['Date'] = df_rows['Date'].dt.strftime('%Y-%m-%d')
+    df_rows = df_rows.astype(object).where(df_rows.notna(), None)
+    placeholders = ', '.join(['?'] * len(LEDGER_COLUMNS))
+    c.executemany(f"INSERT OR REPLACE INTO {LEDGER_TABLE} ({', '.join(LEDGER_COLUMNS)}) VALUES ({placeholders})",
+                  df_rows.itertuples(index=False, name=None))
+
+def _read_initial_cash(c):
+    """读取店铺的期初资金。"""
+    c.execute(f"SELECT value FROM {STORE_SETTINGS_TABLE} WHERE setting = 'initial_cash'")
+    row = c.fetchone()
+    return row[0] if row else finance_calculator.INITIAL_CASH
+
+def _channels_kernel(channels):
+    """把 (渠道, 占比, 类型, 参数) 列表混合成一个回款核；没有渠道时返回 None (使用默认回款周期)。"""
+    if not channels:
+        return None
+    return payout_schedule.combine_channels(
+        [(share, payout_schedule.parse_kernel(kind, params)) for _, share, kind, params in channels])
+
+def _read_payout_kernel(c):
+    """读取店铺的回款分布 (各渠道混合后的回款核)；没有配置渠道时返回 None。"""
+    c.execute(f"SELECT channel, share, kind, params FROM {PAYOUT_CHANNELS_TABLE} ORDER BY channel")
+    return _channels_kernel(c.fetchall())
+
+def calendar_file():
+    return os.path.join(os.path.dirname(DB_FILE), HOLIDAY_FILE)
+
+def get_business_calendar():
+    """当前的营业日历 (节假日文件只在首次使用或修改后编译一次)；没有节假日文件时返回 None。"""
+    return business_calendar.load_calendar(calendar_file())
+
+def _calendar_changed(c, calendar):
+    """账本是否是用其他营业日历算出来的 (节假日文件新增、修改或删除)。"""
+    c.execute(f"SELECT value FROM {STORE_SETTINGS_TABLE} WHERE setting = ?", (CALENDAR_SETTING,))
+    row = c.fetchone()
+    return (row[0] if row else 0.0) != (float(calendar.fingerprint) if calendar is not None else 0.0)
+
+def _sync_calendar(c, calendar):
+    """营业日历变化时清空账本，并记录当前日历的指纹。"""
+    if _calendar_changed(c, calendar):
+        c.execute(f"DELETE FROM {LEDGER_TABLE}")
+        fingerprint = float(calendar.fingerprint) if calendar is not None else 0.0
+        c.execute(f"INSERT OR REPLACE INTO {STORE_SETTINGS_TABLE} (setting, value) VALUES (?, ?)", (CALENDAR_SETTING, fingerprint))
+
+def sync_business_calendar(store=None):
+    """节假日文件变化后按新的营业日历重算店铺账本；日历未变化时只做一次设置查询。"""
+    if not os.path.exists(store_db_file(store)):
+        return
+    with session(store) as conn:
+        if _calendar_changed(conn.cursor(), get_business_calendar()):
+            refresh_computed_ledger(conn)
+
+@profiler.profiled()
+def refresh_computed_ledger(conn=None, store=None):
+    """
+    让物化账本追上原始数据。
+    账本首日与原始数据一致时，只从账本末尾的下一天开始增量计算；
+    否则 (首次建表、首日被删除或在首日之前插入了数据、营业日历变化) 全量重算。
+    :param conn: 写入操作所在的会话连接；传入时与写入在同一事务中完成，否则自行开启店铺的会话。
+    """
+    if conn is None:
+        with session(store) as conn:
+            # 直接调用未包装的函数，避免同一次刷新被计时两次
+            return refresh_computed_ledger.__wrapped__(conn)
+
+    c = conn.cursor()
+    calendar = get_business_calendar()
+    _sync_calendar(c, calendar)
+    raw_start, raw_end = _raw_date_bounds(c)
+    if raw_start is None:
+        c.execute(f"DELETE FROM {LEDGER_TABLE}")
+        return
+
+    # 删除最后一天的数据后，账本可能比原始数据更长
+    c.execute(f"DELETE FROM {LEDGER_TABLE} WHERE Date > ?", (raw_end,))
+    c.execute(f"SELECT MIN(Date), MAX(Date) FROM {LEDGER_TABLE}")
+    ledger_start, ledger_end = c.fetchone()
+
+    if ledger_start != raw_start:
+        c.execute(f"DELETE FROM {LEDGER_TABLE}")
+        df_daily, df_early = _read_daily_range(conn), _read_early_payouts_range(conn)
+        _write_ledger_rows(c, finance_calculator.calculate_finances(df_daily, df_early, initial_cash=_read_initial_cash(c),
+                                                                    kernel=_read_payout_kernel(c), calendar=calendar))
+    elif ledger_end != raw_end:
+        start_date = pd.Timestamp(ledger_end) + timedelta(days=1)
+        df_daily, df_early, seed = _read_calculation_window(conn, start_date)
+        df_tail = finance_calculator.calculate_finances_window(df_daily, df_early, start_date, raw_end, **seed)
+        _write_ledger_rows(c, df_tail)
+    _refresh_rollups(c)
+
+def _refresh_rollups(c):
+    """让周期汇总追上账本：每种周期从第一个缺少汇总的周期开始，用一条 GROUP BY 重新聚合到账本末尾。"""
+    c.execute(f"SELECT MAX(Date) FROM {LEDGER_TABLE}")
+    ledger_end = c.fetchone()[0]
+    if ledger_end is None:
+        return
+    columns = ', '.join(ROLLUP_SUM_COLS + ROLLUP_END_COLS)
+    sums = ', '.join(f"SUM({col})" for col in ROLLUP_SUM_COLS)
+    for period, start_expr in ROLLUP_PERIODS.items():
+        c.execute(f"SELECT MAX(last_date) FROM {ROLLUP_TABLE} WHERE period = ?", (period,))
+        covered = c.fetchone()[0]
+        if covered == ledger_end:
+            continue
+        start = MIN_DATE_STR
+        if covered is not None:
+            # 已汇总到 covered，从它下一天所在的周期开始 (该周期可能已有部分天数的汇总，整体重算)
+            next_day = "date(:covered, '+1 day')"
+            c.execute(f"SELECT {start_expr.format(date=next_day)}", {'covered': covered})
+            start = c.fetchone()[0]
+        # 只有一个 MAX() 聚合时，SQLite 的裸列取自 MAX(Date) 所在的行，即周期最后一天的余额和累计利润
+        c.execute(f'''
+            INSERT OR REPLACE INTO {ROLLUP_TABLE} (period, period_start, last_date, days, {columns})
+            SELECT ?, {start_expr.format(date='Date')} AS rollup_start, MAX(Date), COUNT(1), {sums}, {', '.join(ROLLUP_END_COLS)}
+            FROM {LEDGER_TABLE} WHERE Date >= ? GROUP BY rollup_start
+        ''', (period, start))
+
+@profiler.profiled()
+def load_computed_ledger(start_date=None, end_date=None, store=None):
+    """直接读取物化账本 (除节假日文件变化后的重算外不做任何计算)，可以只读取一个日期范围。"""
+    if not os.path.exists(store_db_file(store)): return pd.DataFrame()
     try:
-        df = pd.read_sql_query(f'SELECT * FROM {EARLY_PAYOUT_TABLE}', conn)
-        df['Payout_Date'] = pd.to_datetime(df['Payout_Date'])
-        df['Original_Order_Date'] = pd.to_datetime(df['Original_Order_Date'])
+        sync_business_calendar(store)
+        with session(store) as conn:
+            df = pd.read_sql_query(f'SELECT * FROM {LEDGER_TABLE} WHERE Date BETWEEN ? AND ? ORDER BY Date', conn,
+                                   params=_date_bounds(start_date, end_date))
+        df['Date'] = pd.to_datetime(df['Date'])
         return df
     except Exception as e:
-        print(f"加载提前回款数据失败: {e}")
+        print(f"加载账本数据失败: {e}")
         return pd.DataFrame()
+
+def load_period_rollups(period='month', start_date=None, end_date=None, store=None):
+    """
+    读取账本的周期汇总 (week / month / quarter)，每个周期一行，读取成本只与周期数有关。
+    金额列是周期内的合计，bank_balance / cumulative_profit 是周期最后一天的数值；可以只读取一个日期范围内的周期。
+    """
+    if period not in ROLLUP_PERIODS:
+        raise ValueError(f"不支持的汇总周期: {period} (可选: {', '.join(ROLLUP_PERIODS)})")
+    if not os.path.exists(store_db_file(store)): return pd.DataFrame()
+    start, end = _date_bounds(start_date, end_date)
+    sync_business_calendar(store)
+    with session(store) as conn:
+        return pd.read_sql_query(
+            f'''SELECT period_start, last_date, days, {', '.join(ROLLUP_SUM_COLS + ROLLUP_END_COLS)}
+                FROM {ROLLUP_TABLE} WHERE period = ? AND last_date >= ? AND period_start <= ? ORDER BY period_start''',
+            conn, params=(period, start, end), parse_dates=['period_start', 'last_date'])
+
+def load_latest_ledger_entry(store=None):
+    """读取账本最后一天的记录 (单条索引查询)，没有数据时返回 None。"""
+    if not os.path.exists(store_db_file(store)): return None
+    try:
+        with session(store) as conn:
+            df = pd.read_sql_query(f'SELECT * FROM {LEDGER_TABLE} ORDER BY Date DESC LIMIT 1', conn)
+        if df.empty:
+            return None
+        df['Date'] = pd.to_datetime(df['Date'])
+        return df.iloc[0]
+    except Exception as e:
+        print(f"加载账本数据失败: {e}")
+        return None
+
+def _stable_period_summary(stores, payout_delay_days):
+    """
+    若干店铺账本相加后的稳定期汇总：账本首日、稳定期天数和稳定期净现金流之和。
+    每个店铺只做走日期索引的两次聚合查询，读取成本与历史长度无关；汇总账本是连续的逐日记录，
+    稳定期从最早的账本首日起第 payout_delay_days 天开始，到最晚的账本末日为止。
+    """
+    bounds = {}
+    for store in stores:
+        if not os.path.exists(store_db_file(store)):
+            continue
+        sync_business_calendar(store)
+        with session(store) as conn:
+            c = conn.cursor()
+            c.execute(f"SELECT MIN(Date), MAX(Date) FROM {LEDGER_TABLE}")
+            first, last = c.fetchone()
+        if first is not None:
+            bounds[store] = (first, last)
+    if not bounds:
+        return {'ledger_start': None, 'stable_days': 0, 'stable_net_cash_flow': 0.0}
+
+    ledger_start = pd.Timestamp(min(first for first, _ in bounds.values()))
+    stable_start = ledger_start + timedelta(days=int(payout_delay_days))
+    stable_days = max((pd.Timestamp(max(last for _, last in bounds.values())) - stable_start).days + 1, 0)
+    stable_net_cash_flow = 0.0
+    for store in bounds:
+        with session(store) as conn:
+            c = conn.cursor()
+            c.execute(f"SELECT COALESCE(SUM(daily_net_cash_flow), 0) FROM {LEDGER_TABLE} WHERE Date >= ?",
+                      (stable_start.strftime('%Y-%m-%d'),))
+            stable_net_cash_flow += c.fetchone()[0]
+    return {'ledger_start': ledger_start, 'stable_days': stable_days, 'stable_net_cash_flow': stable_net_cash_flow}
+
+@profiler.profiled()
+def load_stable_period_summary(payout_delay_days, store=None):
+    """
+    增长预测需要的长期统计 (见 growth_predictor.predict_next_increment)，直接由物化账本聚合得到，不读取整个账本：
+    {'ledger_start': 账本首日 (没有数据时为 None), 'stable_days': 稳定期天数, 'stable_net_cash_flow': 稳定期净现金流之和}。
+    """
+    return _stable_period_summary([store], payout_delay_days)
+
+# --- 操作日志：撤销与历史时点查询 ---
+
+def list_operations(limit=20, store=None):
+    """最近的写入操作 (新的在前)：编号、时间、描述、修改的行数，以及是否已被撤销、是否为撤销操作。"""
+    if not os.path.exists(store_db_file(store)): return pd.DataFrame()
+    with session(store) as conn:
+        rows = journal.operations(conn.cursor(), limit)
+    df = pd.DataFrame(rows, columns=['op_id', 'recorded_at', 'description', 'changed_rows', 'undone', 'is_undo'])
+    return df.astype({'undone': bool, 'is_undo': bool})
+
+def get_last_undoable_operation(store=None):
+    """最近一次可以撤销的操作的描述；没有时返回 None。"""
+    if not os.path.exists(store_db_file(store)): return None
+    with session(store) as conn:
+        last = journal.last_undoable(conn.cursor())
+    return last[1] if last else None
+
+def undo_last_operation(store=None):
+    """
+    撤销最近一次写入操作 (例如误删的一天主数据)：把它修改过的行全部恢复，再从最早受影响的日期起刷新账本。
+    撤销本身也记入操作日志；连续调用会按时间倒序依次撤销更早的操作。
+    :return: 被撤销操作的描述；没有可撤销的操作时返回 None。
+    """
+    if not os.path.exists(store_db_file(store)): return None
+    with session(store) as conn:
+        c = conn.cursor()
+        last = journal.last_undoable(c)
+        if last is not None:
+            op_id, description = last
+            changes = journal.undo(c, op_id, f"撤销：{description}", JOURNAL_TABLES, JOURNAL_SNAPSHOT_TABLES,
+                                   JOURNAL_IGNORED_KEYS)
+            if changes[STORE_SETTINGS_TABLE] or changes[PAYOUT_CHANNELS_TABLE]:
+                c.execute(f"DELETE FROM {LEDGER_TABLE}")
+            else:
+                kernel = _read_payout_kernel(c)
+                changed_dates = [pd.Timestamp(date_str) for date_str in changes[DAILY_TABLE]]
+                changed_dates += [finance_calculator.payout_change_date(row['Payout_Date'], row['Original_Order_Date'], kernel)
+                                  for rows in changes[EARLY_PAYOUT_TABLE].values() for row in rows if row is not None]
+                if changed_dates:
+                    _invalidate_ledger(c, min(changed_dates))
+            refresh_computed_ledger(conn)
+    if last is None:
+        print("没有可以撤销的操作。")
+        return None
+    print(f"已撤销：{description}")
+    return description
+
+def _as_of_timestamp(as_of):
+    """历史查询的时间点 (journal.TIMESTAMP_FORMAT)；只给日期时表示当天结束时。"""
+    timestamp = pd.Timestamp(as_of)
+    if ':' not in str(as_of):
+        timestamp = timestamp.normalize() + pd.Timedelta(days=1, seconds=-1)
+    return timestamp.strftime(journal.TIMESTAMP_FORMAT)
+
+@contextmanager
+def _replayed_session(as_of, store=None):
+    """
+    把店铺在 as_of 时刻决定账本的各表从操作日志中重建到一个内存数据库里 (从最近的快照开始回放)，
+    得到的连接与店铺数据库结构相同，可以直接用 _read_* 函数读取。
+    """
+    with session(store) as conn:
+        c = conn.cursor()
+        state = journal.replay(c, journal.position_at(c, _as_of_timestamp(as_of)), JOURNAL_SNAPSHOT_TABLES)
+    memory = sqlite3.connect(':memory:')
+    try:
+        _create_schema(memory.cursor())
+        for table, rows in state.items():
+            if rows:
+                columns = list(rows[0])
+                memory.executemany(f"INSERT OR REPLACE INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})",
+                                   [tuple(row[column] for column in columns) for row in rows])
+        yield memory
+    finally:
+        memory.close()
+
+@profiler.profiled()
+def load_data_as_of(as_of, store=None):
+    """店铺在 as_of 时刻 (日期或日期时间) 的主数据，格式与 load_all_data 相同。"""
+    if not os.path.exists(store_db_file(store)): return pd.DataFrame()
+    with _replayed_session(as_of, store) as memory:
+        return _read_daily_range(memory)
+
+@profiler.profiled()
+def compute_ledger_as_of(as_of, store=None):
+    """
+    按店铺在 as_of 时刻的数据 (主数据、提前回款、期初资金和回款渠道) 计算当时的账本。
+    节假日文件不在日志中，使用当前的营业日历。
+    """
+    if not os.path.exists(store_db_file(store)): return pd.DataFrame()
+    with _replayed_session(as_of, store) as memory:
+        df_daily, df_early = _read_daily_range(memory), _read_early_payouts_range(memory)
+        initial_cash, kernel = _read_initial_cash(memory.cursor()), _read_payout_kernel(memory.cursor())
+    if df_daily.empty and df_early.empty:
+        return pd.DataFrame()
+    return finance_calculator.calculate_finances(df_daily, df_early, initial_cash=initial_cash, kernel=kernel,
+                                                 calendar=get_business_calendar())
+
+# --- 店铺管理与公司汇总 ---
+
+def list_stores():
+    """返回所有店铺 (默认店铺在最前，其余按名称排序)。"""
+    stores_dir = os.path.join(os.path.dirname(DB_FILE), STORES_DIR)
+    names = []
+    if os.path.isdir(stores_dir):
+        names = sorted(os.path.splitext(f)[0] for f in os.listdir(stores_dir) if f.endswith('.db'))
+    return [DEFAULT_STORE] + [name for name in names if name != DEFAULT_STORE]
+
+def create_store(store, initial_cash=finance_calculator.INITIAL_CASH):
+    """新建一个店铺 (独立的数据库文件) 并设置它的期初资金。"""
+    store = store.strip()
+    if not STORE_NAME_PATTERN.match(store):
+        raise ValueError("店铺名称只能包含中英文、数字、下划线和连字符。")
+    if store in list_stores():
+        raise ValueError(f"店铺 {store} 已存在。")
+    os.makedirs(os.path.dirname(store_db_file(store)), exist_ok=True)
+    init_db(store)
+    set_store_initial_cash(initial_cash, store)
+    print(f"店铺 {store} 已创建。")
+
+def get_store_initial_cash(store=None):
+    """读取店铺的期初资金。"""
+    with session(store) as conn:
+        return _read_initial_cash(conn.cursor())
+
+def set_store_initial_cash(initial_cash, store=None):
+    """修改店铺的期初资金。账本每一行的余额都会变化，因此整本重算。"""
+    with session(store) as conn:
+        c = conn.cursor()
+        _begin_operation(c, f"期初资金改为 {initial_cash:,.2f} 元")
+        c.execute(f"UPDATE {STORE_SETTINGS_TABLE} SET value = ? WHERE setting = 'initial_cash'", (float(initial_cash),))
+        c.execute(f"DELETE FROM {LEDGER_TABLE}")
+        refresh_computed_ledger(conn)
+    print(f"店铺 {store or DEFAULT_STORE} 的期初资金已设置为 {initial_cash:,.2f} 元。")
+
+def get_payout_channels(store=None):
+    """读取店铺的回款渠道配置 (渠道, 占比, 类型, 参数)。"""
+    with session(store) as conn:
+        return pd.read_sql_query(f"SELECT channel, share, kind, params FROM {PAYOUT_CHANNELS_TABLE} ORDER BY channel", conn)
+
+def get_payout_kernel(store=None):
+    """店铺当前使用的回款分布 (没有配置渠道时为默认的固定回款周期)。"""
+    with session(store) as conn:
+        return finance_calculator.payout_kernel(_read_payout_kernel(conn.cursor()))
+
+def set_payout_channels(channels, store=None):
+    """
+    替换店铺的回款渠道配置。回款分布影响账本的每一天，因此整本重算。
+    :param channels: (渠道, 占比, 类型, 参数) 列表，类型和参数格式见 payout_schedule；传入空列表恢复默认的固定回款周期。
+    :raises ValueError: 分布参数或占比无效时 (不会修改任何数据)。
+    """
+    channels = [(str(channel).strip(), float(share), kind, str(params).strip()) for channel, share, kind, params in channels]
+    if len({channel for channel, *_ in channels}) != len(channels):
+        raise ValueError("渠道名称不能重复。")
+    _channels_kernel(channels)
+    with session(store) as conn:
+        c = conn.cursor()
+        _begin_operation(c, f"回款渠道改为 {len(channels)} 个渠道" if channels else "恢复默认回款周期")
+        c.execute(f"DELETE FROM {PAYOUT_CHANNELS_TABLE}")
+        c.executemany(f"INSERT INTO {PAYOUT_CHANNELS_TABLE} (channel, share, kind, params) VALUES (?, ?, ?, ?)", channels)
+        c.execute(f"DELETE FROM {LEDGER_TABLE}")
+        refresh_computed_ledger(conn)
+    if channels:
+        print(f"店铺 {store or DEFAULT_STORE} 的回款渠道已更新为 {len(channels)} 个渠道。")
+    else:
+        print(f"店铺 {store or DEFAULT_STORE} 已恢复默认的固定回款周期 ({finance_calculator.PAYOUT_DELAY_DAYS} 天)。")
+
+def _refresh_store_file(db_file, rebuild=False):
+    """
+    刷新一个店铺数据库的账本 (进程池的任务函数，只依赖文件路径，在工作进程中自行打开连接)。
+    :return: 刷新后账本的行数。
+    """
+    conn = sqlite3.connect(db_file, timeout=BUSY_TIMEOUT_SECONDS)
+    try:
+        with conn:
+            if rebuild:
+                conn.execute(f"DELETE FROM {LEDGER_TABLE}")
+            refresh_computed_ledger(conn)
+        return conn.execute(f"SELECT COUNT(1) FROM {LEDGER_TABLE}").fetchone()[0]
     finally:
         conn.close()
+
+@profiler.profiled()
+def refresh_store_ledgers(stores=None, rebuild=False, max_workers=None):
+    """
+    刷新多个店铺的物化账本。各店铺的账本互不依赖，分布在进程池中并行计算。
+    :param rebuild: 为 True 时丢弃已有账本、全量重算。
+    :return: {店铺: 账本行数}
+    """
+    stores = list_stores() if stores is None else list(stores)
+    for store in stores:
+        init_db(store)
+    db_files = [store_db_file(store) for store in stores]
+    if len(db_files) <= 1 or max_workers == 1:
+        row_counts = [_refresh_store_file(db_file, rebuild) for db_file in db_files]
+    else:
+        with ProcessPoolExecutor(max_workers=max_workers or min(len(db_files), os.cpu_count() or 1)) as executor:
+            row_counts = list(executor.map(_refresh_store_file, db_files, [rebuild] * len(db_files)))
+    return dict(zip(stores, row_counts))
+
+@profiler.profiled()
+def get_consolidated_payout_kernel(stores=None):
+    """
+    全公司汇总账本使用的回款分布：各店铺的回款分布按应收款总额 (成本 + 利润) 加权混合。
+    汇总的计划回款是各店铺计划回款之和，各店铺应收款的占比稳定时与按混合分布卷积的结果一致。
+    """
+    stores = list_stores() if stores is None else list(stores)
+    channels = []
+    for store in stores:
+        with session(store) as conn:
+            c = conn.cursor()
+            c.execute(f"SELECT COALESCE(SUM(Total_Daily_Cost + Total_Daily_Profit), 0) FROM {DAILY_TABLE}")
+            receivable = c.fetchone()[0]
+            kernel = finance_calculator.payout_kernel(_read_payout_kernel(c))
+        channels.append((max(receivable, 0.0), kernel))
+    if sum(share for share, _ in channels) <= 0:
+        channels = [(1.0, kernel) for _, kernel in channels]
+    return payout_schedule.combine_channels(channels)
+
+@profiler.profiled()
+def load_consolidated_stable_period_summary(payout_delay_days, stores=None):
+    """公司汇总账本的稳定期汇总 (格式同 load_stable_period_summary)，由各店铺的聚合查询相加得到。"""
+    return _stable_period_summary(list_stores() if stores is None else list(stores), payout_delay_days)
+
+def load_consolidated_ledger(start_date=None, end_date=None, stores=None):
+    """
+    公司汇总账本：读取各店铺已物化的账本并按日期相加，不重新计算任何店铺。
+    某个店铺在范围内没有记录时，按它在范围开始前的余额 (或期初资金) 计入。
+    """
+    stores = list_stores() if stores is None else list(stores)
+    ledgers, openings = {}, {}
+    for store in stores:
+        ledgers[store] = load_computed_ledger(start_date, end_date, store=store)
+        seed = load_ledger_seed(start_date if start_date is not None else MIN_DATE_STR, store)
+        openings[store] = (seed['opening_balance'], seed['opening_cumulative_profit'])
+    return finance_calculator.consolidate_ledgers(ledgers, openings)
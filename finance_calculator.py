@@ -1,57 +1,275 @@
 # finance_calculator.py (已更新)
 
+import numpy as np
 import pandas as pd
 from datetime import timedelta
 
+import business_calendar
+import payout_schedule
+import profiler
+
 PAYOUT_DELAY_DAYS = 15
+# 默认的回款分布：全部金额在 PAYOUT_DELAY_DAYS 天后到账。店铺配置了回款渠道时改用渠道混合后的分布 (见 payout_schedule)
+DEFAULT_PAYOUT_KERNEL = payout_schedule.fixed_kernel(PAYOUT_DELAY_DAYS)
 INITIAL_CASH = 3000.0
-AVERAGE_PROFIT_MARGIN = 0.25 
+AVERAGE_PROFIT_MARGIN = 0.25
+
+# --- 计算引擎 ---
+# vectorized: 基于 shift / reindex / cumsum 的向量化引擎 (默认)
+# loop: 原始的逐日 .loc 循环，仅作为差分测试时的参考实现保留
+ENGINE_VECTORIZED = 'vectorized'
+ENGINE_LOOP = 'loop'
+
+FILL_COLS = ['Daily_Order_Count', 'Total_Daily_Cost', 'Total_Daily_Profit',
+             'Refunds_Received_Today', 'Estimated_Profit_Loss_From_Refunds',
+             'Other_Income_Today']
+COMPUTED_COLS = ['daily_outflow', 'daily_actual_inflow', 'daily_net_cash_flow', 'bank_balance', 'daily_profit', 'cumulative_profit']
+# 余额类的列 (逐日累加得到)，其余的计算列都是当日的流量
+BALANCE_COLS = ['bank_balance', 'cumulative_profit']
+
 
-def calculate_finances(df_daily: pd.DataFrame, df_early_payouts: pd.DataFrame) -> pd.DataFrame:
+def ledger_date_range(df_daily: pd.DataFrame, df_early_payouts: pd.DataFrame):
     """
-    根据主数据和提前回款数据，重新计算整个历史记录的财务指标。
-    核心升级：基于完整的日期范围进行计算，确保数据连续性。
+    返回账本应覆盖的日期范围 (最早日期, 最晚日期)。
+    范围由主数据日期和提前回款的收款日期共同决定；没有任何数据时返回 (None, None)。
     """
-    if df_daily.empty and df_early_payouts.empty:
-        return pd.DataFrame()
-
-    # --- 核心升级：创建完整的日期范围 ---
-    all_dates = []
+    bounds = []
     if not df_daily.empty:
-        all_dates.extend(df_daily['Date'].tolist())
+        bounds.extend([df_daily['Date'].min(), df_daily['Date'].max()])
     if not df_early_payouts.empty:
-        all_dates.extend(df_early_payouts['Payout_Date'].tolist())
-    
-    if not all_dates:
-        return pd.DataFrame()
+        bounds.extend([df_early_payouts['Payout_Date'].min(), df_early_payouts['Payout_Date'].max()])
+    if not bounds:
+        return None, None
+    return min(bounds), max(bounds)
 
-    min_date, max_date = min(all_dates), max(all_dates)
-    full_date_range = pd.date_range(start=min_date, end=max_date, freq='D')
+
+def _build_range_frame(df_daily: pd.DataFrame, start_date, end_date) -> pd.DataFrame:
+    """
+    创建覆盖 [start_date, end_date] 的逐日DataFrame，并把主数据合并进来。
+    两个计算引擎以及增量重算共用这一步，保证输入完全一致。
+    """
+    full_date_range = pd.date_range(start=start_date, end=end_date, freq='D')
     df_calculated = pd.DataFrame(full_date_range, columns=['Date'])
-    
+
     # 将原始数据合并到完整的日期范围上
     if not df_daily.empty:
-        df_calculated = pd.merge(df_calculated, df_daily, on='Date', how='left')
-    
+        in_range = df_daily[(df_daily['Date'] >= start_date) & (df_daily['Date'] <= end_date)]
+        df_calculated = pd.merge(df_calculated, in_range, on='Date', how='left')
+
     # 将所有NaN值填充为0，因为这些天没有订单或记录
-    fill_cols = ['Daily_Order_Count', 'Total_Daily_Cost', 'Total_Daily_Profit', 
-                 'Refunds_Received_Today', 'Estimated_Profit_Loss_From_Refunds', 
-                 'Other_Income_Today']
-    for col in fill_cols:
+    for col in FILL_COLS:
         if col not in df_calculated.columns:
             df_calculated[col] = 0
-    df_calculated[fill_cols] = df_calculated[fill_cols].fillna(0)
-    # ------------------------------------
-
-    # 后续计算逻辑与之前类似，但现在基于 df_calculated
-    df = df_calculated # 使用新创建的完整DataFrame
-    
-    # ... (从这里开始的计算逻辑与上一个版本完全相同)
-    for col in ['daily_outflow', 'daily_actual_inflow', 'daily_net_cash_flow', 'bank_balance', 'daily_profit', 'cumulative_profit']:
+    df_calculated[FILL_COLS] = df_calculated[FILL_COLS].fillna(0)
+    return df_calculated
+
+
+def _build_full_range_frame(df_daily: pd.DataFrame, df_early_payouts: pd.DataFrame) -> pd.DataFrame:
+    """创建覆盖完整日期范围的基础DataFrame。"""
+    min_date, max_date = ledger_date_range(df_daily, df_early_payouts)
+    if min_date is None:
+        return pd.DataFrame()
+    return _build_range_frame(df_daily, min_date, max_date)
+
+
+def payout_kernel(kernel=None):
+    """返回实际使用的回款核：缺省 (None) 时为默认的固定回款周期。"""
+    return DEFAULT_PAYOUT_KERNEL if kernel is None else np.asarray(kernel, dtype=float)
+
+
+def payout_lookback_days(start_date, kernel=None, calendar=None) -> int:
+    """
+    从 start_date 开始计算账本，需要往前读取多少天的主数据：最晚回款天数，
+    再加上 start_date 之前紧挨着的非营业天数 (这些天到期的回款顺延到窗口内结算)。
+    """
+    lookback = payout_schedule.max_delay(payout_kernel(kernel))
+    if calendar is not None:
+        lookback += calendar.lead_days(start_date)
+    return lookback
+
+
+@profiler.profiled()
+def calculate_finances(df_daily: pd.DataFrame, df_early_payouts: pd.DataFrame, engine: str = ENGINE_VECTORIZED,
+                       initial_cash: float = INITIAL_CASH, kernel=None, calendar=None) -> pd.DataFrame:
+    """
+    根据主数据和提前回款数据，重新计算整个历史记录的财务指标。
+    核心升级：基于完整的日期范围进行计算，确保数据连续性。
+    :param engine: 计算引擎，默认向量化引擎；传入 ENGINE_LOOP 使用逐日循环的参考实现。
+    :param initial_cash: 账本首日之前的银行余额 (每个店铺可以不同)。
+    :param kernel: 回款分布 (payout_schedule 的回款核)，缺省为 PAYOUT_DELAY_DAYS 天后全额回款。
+    :param calendar: 营业日历 (business_calendar.BusinessCalendar)；缺省时回款在到期当天到账，不考虑周末和节假日。
+    """
+    if df_daily.empty and df_early_payouts.empty:
+        return pd.DataFrame()
+
+    if engine == ENGINE_LOOP:
+        if (kernel is not None and not np.array_equal(payout_kernel(kernel), DEFAULT_PAYOUT_KERNEL)) or calendar is not None:
+            raise ValueError("逐日循环的参考实现只支持默认的固定回款周期 (不使用营业日历)。")
+        return _calculate_finances_loop(df_daily, df_early_payouts, initial_cash)
+    if engine != ENGINE_VECTORIZED:
+        raise ValueError(f"未知的计算引擎: {engine}")
+
+    min_date, max_date = ledger_date_range(df_daily, df_early_payouts)
+    return calculate_finances_window(df_daily, df_early_payouts, min_date, max_date,
+                                     opening_balance=initial_cash, opening_cumulative_profit=0.0,
+                                     ledger_start=min_date, kernel=kernel, calendar=calendar)
+
+
+def early_payout_series(df_early_payouts: pd.DataFrame, dates: pd.DatetimeIndex) -> tuple:
+    """
+    提前回款按日汇总：(按收款日汇总的现金流入, 按来源订单日汇总的应收款扣除额)，都对齐到 dates。
+    扣除额只考虑有明确原始日期的记录，且来源日期必须落在 dates 范围内。
+    """
+    received = pd.Series(0.0, index=dates)
+    deducted = pd.Series(0.0, index=dates)
+    if not df_early_payouts.empty:
+        received = df_early_payouts.groupby('Payout_Date')['Amount'].sum().reindex(dates, fill_value=0.0)
+        known_origin_payouts = df_early_payouts.dropna(subset=['Original_Order_Date'])
+        if not known_origin_payouts.empty:
+            deducted = known_origin_payouts.groupby('Original_Order_Date')['Amount'].sum().reindex(dates, fill_value=0.0)
+    return received, deducted
+
+
+def daily_aggregates(df_daily: pd.DataFrame, df_early_payouts: pd.DataFrame) -> pd.DataFrame:
+    """
+    账本完整日期范围上的逐日汇总 (主数据列 + 提前回款的收款额和扣除额)，
+    是所有与参数无关的中间结果，供需要反复换参数计算的场景复用。
+    """
+    df = _build_full_range_frame(df_daily, df_early_payouts)
+    if df.empty:
+        return df
+    received, deducted = early_payout_series(df_early_payouts, pd.DatetimeIndex(df['Date']))
+    df['Early_Payout_Received'] = received.to_numpy(dtype=float)
+    df['Early_Payout_Deducted'] = deducted.to_numpy(dtype=float)
+    return df
+
+
+@profiler.profiled()
+def calculate_finances_window(df_daily: pd.DataFrame, df_early_payouts: pd.DataFrame, start_date, end_date,
+                              opening_balance: float, opening_cumulative_profit: float, ledger_start=None,
+                              kernel=None, calendar=None) -> pd.DataFrame:
+    """
+    从账本中间的某一天开始计算 [start_date, end_date] 的财务指标 (向量化引擎)。
+    :param df_daily: 主数据，至少需要包含 start_date - payout_lookback_days() 之后的记录。
+    :param df_early_payouts: 提前回款数据，至少需要包含窗口内收款、或来源日期在窗口回款期内的记录。
+    :param opening_balance: start_date 前一天结束时的银行余额 (账本首日为 INITIAL_CASH)。
+    :param opening_cumulative_profit: start_date 前一天结束时的累计利润 (账本首日为 0)。
+    :param ledger_start: 整个账本的首日；早于该日期的订单不会产生回款。默认等于 start_date。
+    :param kernel: 回款分布，缺省为 PAYOUT_DELAY_DAYS 天后全额回款。
+    :param calendar: 营业日历；到期日不是营业日的回款顺延到下一个营业日。
+    :return: 只包含 [start_date, end_date] 这些行的DataFrame。
+    """
+    start_date, end_date = pd.Timestamp(start_date), pd.Timestamp(end_date)
+    ledger_start = start_date if ledger_start is None else pd.Timestamp(ledger_start)
+    kernel = payout_kernel(kernel)
+    if end_date < start_date:
+        return pd.DataFrame()
+
+    # 往前多取若干天，用来计算窗口内前几天的计划回款
+    origin_start = max(ledger_start, start_date - timedelta(days=payout_lookback_days(start_date, kernel, calendar)))
+    lead_days = (start_date - origin_start).days
+    df = _build_range_frame(df_daily, origin_start, end_date)
+
+    dates = pd.DatetimeIndex(df['Date'])
+    cost = df['Total_Daily_Cost'].to_numpy(dtype=float)
+    profit = df['Total_Daily_Profit'].to_numpy(dtype=float)
+
+    received, deducted = early_payout_series(df_early_payouts, dates)
+
+    # 计划回款 = 每日 (成本 + 利润 - 已提前收回的部分) 按回款分布分散到之后各天 (卷积)
+    net_receivable = cost + profit - deducted.to_numpy(dtype=float)
+    net_scheduled_inflow = payout_schedule.expected_inflows(net_receivable, kernel)
+    if calendar is not None:
+        # 到期日落在非营业日的回款顺延到下一个营业日 (通过预先编译的结算日索引，整段一次完成)
+        net_scheduled_inflow = business_calendar.settled_amounts(net_scheduled_inflow, origin_start, origin_start,
+                                                                 len(net_scheduled_inflow), calendar)
+
+    df = df.iloc[lead_days:].reset_index(drop=True)
+    cost, profit = cost[lead_days:], profit[lead_days:]
+    daily_actual_inflow = (net_scheduled_inflow[lead_days:] + received.to_numpy(dtype=float)[lead_days:]
+                           + df['Refunds_Received_Today'].to_numpy(dtype=float)
+                           + df['Other_Income_Today'].to_numpy(dtype=float))
+    daily_net_cash_flow = daily_actual_inflow - cost
+
+    # 余额的累加顺序与逐日循环保持一致：首日 = 期初余额 + 当日净现金流
+    balance_steps = daily_net_cash_flow.copy()
+    balance_steps[0] = opening_balance + balance_steps[0]
+    profit_steps = profit - df['Estimated_Profit_Loss_From_Refunds'].to_numpy(dtype=float)
+    profit_steps[0] = opening_cumulative_profit + profit_steps[0]
+
+    df['daily_outflow'] = cost
+    df['daily_actual_inflow'] = daily_actual_inflow
+    df['daily_net_cash_flow'] = daily_net_cash_flow
+    df['bank_balance'] = balance_steps.cumsum()
+    df['daily_profit'] = profit
+    df['cumulative_profit'] = profit_steps.cumsum()
+    return df
+
+
+def payout_change_date(payout_date, original_order_date=None, kernel=None):
+    """
+    一条提前回款被新增或删除后，账本中最早受影响的日期。
+    收款日当天的现金流入会变化；有来源日期时，来源日期 + 最早回款天数起的计划回款也会变化。
+    """
+    changed = pd.Timestamp(payout_date)
+    if original_order_date is not None and not pd.isna(original_order_date):
+        first_delay = payout_schedule.first_delay(payout_kernel(kernel))
+        changed = min(changed, pd.Timestamp(original_order_date) + timedelta(days=first_delay))
+    return changed
+
+
+@profiler.profiled()
+def recalculate_from(df_calculated: pd.DataFrame, df_daily: pd.DataFrame, df_early_payouts: pd.DataFrame, changed_date,
+                     initial_cash: float = INITIAL_CASH, kernel=None, calendar=None) -> pd.DataFrame:
+    """
+    增量重算：保留 changed_date 之前已经算好的行，只从 changed_date 开始往后重算。
+    期初余额和期初累计利润取自 changed_date 前一天的已有结果，
+    计划回款只需要读取 changed_date - payout_lookback_days() 之后的主数据。
+    :param df_calculated: 上一次的计算结果 (calculate_finances 的输出)。
+    :param changed_date: 本次修改涉及的最早日期 (录入/删除的日期，或 payout_change_date 的结果)。
+    :return: 与对新数据调用 calculate_finances 相同的完整结果。
+    """
+    min_date, max_date = ledger_date_range(df_daily, df_early_payouts)
+    if min_date is None:
+        return pd.DataFrame()
+    if df_calculated.empty:
+        return calculate_finances(df_daily, df_early_payouts, initial_cash=initial_cash, kernel=kernel, calendar=calendar)
+
+    changed_date = pd.Timestamp(changed_date)
+    old_start, old_end = df_calculated['Date'].iloc[0], df_calculated['Date'].iloc[-1]
+    # 账本首日发生变化 (或修改落在首日及以前) 时，所有行的期初状态都变了，只能全量重算
+    if min_date != old_start or changed_date <= old_start:
+        return calculate_finances(df_daily, df_early_payouts, initial_cash=initial_cash, kernel=kernel, calendar=calendar)
+
+    start_date = min(changed_date, old_end + timedelta(days=1))
+    df_prefix = df_calculated[(df_calculated['Date'] < start_date) & (df_calculated['Date'] <= max_date)]
+    if start_date > max_date:
+        return df_prefix.reset_index(drop=True)
+
+    seed = df_prefix.iloc[-1]
+    window_start = start_date - timedelta(days=payout_lookback_days(start_date, kernel, calendar))
+    df_daily_window = df_daily[df_daily['Date'] >= window_start] if not df_daily.empty else df_daily
+    df_tail = calculate_finances_window(df_daily_window, df_early_payouts, start_date, max_date,
+                                        opening_balance=seed['bank_balance'],
+                                        opening_cumulative_profit=seed['cumulative_profit'],
+                                        ledger_start=min_date, kernel=kernel, calendar=calendar)
+    return pd.concat([df_prefix, df_tail], ignore_index=True)
+
+
+def _calculate_finances_loop(df_daily: pd.DataFrame, df_early_payouts: pd.DataFrame, initial_cash: float = INITIAL_CASH) -> pd.DataFrame:
+    """
+    逐日循环的参考实现 (原始版本)。
+    速度较慢，只用于和向量化引擎做差分对比。
+    """
+    df = _build_full_range_frame(df_daily, df_early_payouts)
+    if df.empty:
+        return df
+
+    for col in COMPUTED_COLS:
         df[col] = 0.0
 
     df.set_index('Date', inplace=True)
-    
+
     early_payouts_received_on_date = pd.Series()
     early_payouts_deducted_from_date = pd.Series()
     if not df_early_payouts.empty:
@@ -63,7 +281,7 @@ def calculate_finances(df_daily: pd.DataFrame, df_early_payouts: pd.DataFrame) -
 
     for i in range(len(df)):
         current_date = df.index[i]
-        
+
         df.loc[current_date, 'daily_outflow'] = df.loc[current_date, 'Total_Daily_Cost']
 
         inflow_date = current_date - timedelta(days=PAYOUT_DELAY_DAYS)
@@ -76,20 +294,184 @@ def calculate_finances(df_daily: pd.DataFrame, df_early_payouts: pd.DataFrame) -
         today_early_payouts = early_payouts_received_on_date.get(current_date, 0)
         today_refunds = df.loc[current_date, 'Refunds_Received_Today']
         today_other_income = df.loc[current_date, 'Other_Income_Today']
-        
+
         daily_actual_inflow = net_scheduled_inflow + today_early_payouts + today_refunds + today_other_income
         df.loc[current_date, 'daily_actual_inflow'] = daily_actual_inflow
 
         df.loc[current_date, 'daily_net_cash_flow'] = daily_actual_inflow - df.loc[current_date, 'daily_outflow']
-        
-        previous_balance = INITIAL_CASH if i == 0 else df.loc[df.index[i-1], 'bank_balance']
+
+        previous_balance = initial_cash if i == 0 else df.loc[df.index[i-1], 'bank_balance']
         df.loc[current_date, 'bank_balance'] = previous_balance + df.loc[current_date, 'daily_net_cash_flow']
 
         df.loc[current_date, 'daily_profit'] = df.loc[current_date, 'Total_Daily_Profit']
-        
+
         previous_cumulative_profit = 0.0 if i == 0 else df.loc[df.index[i-1], 'cumulative_profit']
         daily_estimated_profit_loss = df.loc[current_date, 'Estimated_Profit_Loss_From_Refunds']
         df.loc[current_date, 'cumulative_profit'] = previous_cumulative_profit + df.loc[current_date, 'daily_profit'] - daily_estimated_profit_loss
 
     df.reset_index(inplace=True)
     return df
+
+
+@profiler.profiled()
+def consolidate_ledgers(ledgers: dict, openings: dict = None) -> pd.DataFrame:
+    """
+    把各店铺已经算好的账本按日期相加，得到公司汇总账本 (不重新计算任何店铺)。
+    流量列 (订单数、成本、现金流等) 在店铺没有数据的日期按 0 计；
+    余额类列在店铺账本开始之前取期初值，在账本结束之后沿用最后一天的值。
+    :param ledgers: {店铺: 账本DataFrame}，每个账本都是连续的逐日记录。
+    :param openings: {店铺: (期初余额, 期初累计利润)}，缺省为 (INITIAL_CASH, 0)。
+    :return: 覆盖所有店铺日期范围的汇总账本。
+    """
+    openings = openings or {}
+    frames = [df for df in ledgers.values() if not df.empty]
+    if not frames:
+        return pd.DataFrame()
+
+    dates = pd.date_range(min(df['Date'].iloc[0] for df in frames), max(df['Date'].iloc[-1] for df in frames), freq='D')
+    flow_cols = FILL_COLS + [col for col in COMPUTED_COLS if col not in BALANCE_COLS]
+    flows = np.zeros((len(dates), len(flow_cols)))
+    balances = np.zeros((len(dates), len(BALANCE_COLS)))
+
+    for store, df in ledgers.items():
+        opening = openings.get(store, (INITIAL_CASH, 0.0))
+        if df.empty:
+            balances += opening
+            continue
+        aligned = df.set_index('Date').reindex(dates)
+        flows += aligned[flow_cols].fillna(0.0).to_numpy(dtype=float)
+        store_balances = aligned[BALANCE_COLS].ffill().to_numpy(dtype=float)
+        balances += np.where(np.isnan(store_balances), opening, store_balances)
+
+    df_total = pd.DataFrame(flows, columns=flow_cols)
+    df_total[BALANCE_COLS] = balances
+    df_total.insert(0, 'Date', dates)
+    df_total['Daily_Order_Count'] = df_total['Daily_Order_Count'].round().astype(int)
+    return df_total[['Date'] + FILL_COLS + COMPUTED_COLS]
+
+
+# --- 整数分紧凑模式 ---
+# 金额以 int64 的“分”表示，订单数为 int32，备注为 category。所有加减和累加都是整数运算，
+# 长历史下的 bank_balance / cumulative_profit 精确到分、不会有浮点累积误差，表格占用的内存也更少。
+CENTS_PER_YUAN = 100
+MONEY_FILL_COLS = [col for col in FILL_COLS if col != 'Daily_Order_Count']
+ORDER_COUNT_DTYPE = 'int32'
+
+
+def to_cents(values) -> np.ndarray:
+    """把以元为单位的金额 (数组、Series 或标量) 四舍五入为 int64 的分；缺失值按 0 计。"""
+    values = np.nan_to_num(np.asarray(values, dtype=float))
+    return np.rint(values * CENTS_PER_YUAN).astype(np.int64)
+
+
+def from_cents(cents) -> np.ndarray:
+    """把 int64 的分转换回以元为单位的 float64 (结果是最接近该金额的浮点数)。"""
+    return np.asarray(cents, dtype=np.int64) / CENTS_PER_YUAN
+
+
+def compact_daily(df_daily: pd.DataFrame) -> pd.DataFrame:
+    """把 (以元为单位的) 主数据转换为紧凑表示：金额列为分 (int64)，订单数为 int32，备注为 category。"""
+    df = df_daily.copy()
+    for col in MONEY_FILL_COLS:
+        if col in df.columns:
+            df[col] = to_cents(df[col])
+    if 'Daily_Order_Count' in df.columns:
+        df['Daily_Order_Count'] = df['Daily_Order_Count'].fillna(0).astype(ORDER_COUNT_DTYPE)
+    if 'Notes' in df.columns:
+        df['Notes'] = df['Notes'].astype('category')
+    return df
+
+
+def compact_early_payouts(df_early_payouts: pd.DataFrame) -> pd.DataFrame:
+    """把提前回款的金额转换为分 (int64)。"""
+    df = df_early_payouts.copy()
+    if 'Amount' in df.columns:
+        df['Amount'] = to_cents(df['Amount'])
+    return df
+
+
+def _scatter(dates: pd.Series, values, start_date, length: int, dtype) -> np.ndarray:
+    """把按日期的值累加到从 start_date 开始、长度为 length 的逐日数组上 (范围外的日期忽略)。"""
+    result = np.zeros(length, dtype=dtype)
+    positions = (pd.to_datetime(dates) - start_date).dt.days.to_numpy()
+    in_range = (positions >= 0) & (positions < length)
+    np.add.at(result, positions[in_range].astype(np.int64), np.asarray(values)[in_range].astype(dtype))
+    return result
+
+
+@profiler.profiled()
+def calculate_finances_cents(df_daily: pd.DataFrame, df_early_payouts: pd.DataFrame,
+                             initial_cash: float = INITIAL_CASH, kernel=None, calendar=None) -> pd.DataFrame:
+    """
+    calculate_finances 的整数分版本。
+    :param df_daily: 紧凑表示的主数据 (compact_daily 的结果，或 data_manager 以 compact=True 读取的数据)。
+    :param df_early_payouts: 金额以分为单位的提前回款 (compact_early_payouts 的结果)。
+    :param kernel: 回款分布；固定天数时计划回款保持整数运算，分散回款时累计计划回款四舍五入到分 (总额守恒)。
+    :param calendar: 营业日历；顺延同样是整数运算。
+    :return: 列与 calculate_finances 相同，但所有金额列都是以分为单位的 int64 (用 ledger_to_yuan 转回元)。
+    主数据按日期直接写入逐日数组，不做 merge，也不产生中间的 float64 表格。
+    """
+    min_date, max_date = ledger_date_range(df_daily, df_early_payouts)
+    if min_date is None:
+        return pd.DataFrame()
+    dates = pd.date_range(min_date, max_date, freq='D')
+    n = len(dates)
+
+    columns = {'Date': dates}
+    columns['Daily_Order_Count'] = np.zeros(n, dtype=ORDER_COUNT_DTYPE)
+    for col in MONEY_FILL_COLS:
+        columns[col] = np.zeros(n, dtype=np.int64)
+    received = np.zeros(n, dtype=np.int64)
+    deducted = np.zeros(n, dtype=np.int64)
+    notes = None
+
+    if not df_daily.empty:
+        positions = (df_daily['Date'] - min_date).dt.days.to_numpy()
+        for col in ['Daily_Order_Count'] + MONEY_FILL_COLS:
+            if col in df_daily.columns:
+                columns[col][positions] = df_daily[col].to_numpy()
+        if 'Notes' in df_daily.columns:
+            notes_column = df_daily['Notes'].astype('category')
+            codes = np.full(n, -1, dtype=notes_column.cat.codes.dtype)
+            codes[positions] = notes_column.cat.codes.to_numpy()
+            notes = pd.Categorical.from_codes(codes, categories=notes_column.cat.categories)
+    if not df_early_payouts.empty:
+        received = _scatter(df_early_payouts['Payout_Date'], df_early_payouts['Amount'], min_date, n, np.int64)
+        known_origin_payouts = df_early_payouts.dropna(subset=['Original_Order_Date'])
+        deducted = _scatter(known_origin_payouts['Original_Order_Date'], known_origin_payouts['Amount'],
+                            min_date, n, np.int64)
+
+    cost, profit = columns['Total_Daily_Cost'], columns['Total_Daily_Profit']
+    net_scheduled_inflow = payout_schedule.expected_inflows(cost + profit - deducted, payout_kernel(kernel))
+    if net_scheduled_inflow.dtype != np.int64:
+        # 对累计回款四舍五入后再差分：每天的误差不会累积，应收款到期后分毫不差地全部回款
+        net_scheduled_inflow = np.diff(np.rint(np.cumsum(net_scheduled_inflow)).astype(np.int64), prepend=0)
+    if calendar is not None:
+        net_scheduled_inflow = business_calendar.settled_amounts(net_scheduled_inflow, min_date, min_date, n, calendar)
+    daily_actual_inflow = (net_scheduled_inflow + received
+                           + columns['Refunds_Received_Today'] + columns['Other_Income_Today'])
+    daily_net_cash_flow = daily_actual_inflow - cost
+
+    df = pd.DataFrame(columns)
+    if notes is not None:
+        df['Notes'] = notes
+    df['daily_outflow'] = cost
+    df['daily_actual_inflow'] = daily_actual_inflow
+    df['daily_net_cash_flow'] = daily_net_cash_flow
+    df['bank_balance'] = to_cents(initial_cash) + daily_net_cash_flow.cumsum()
+    df['daily_profit'] = profit
+    df['cumulative_profit'] = (profit - columns['Estimated_Profit_Loss_From_Refunds']).cumsum()
+    return df
+
+
+def ledger_to_yuan(df_calculated: pd.DataFrame) -> pd.DataFrame:
+    """把 calculate_finances_cents 的结果转换回以元为单位的普通账本 (金额 float64，订单数 int)，便于展示和绘图。"""
+    df = df_calculated.copy()
+    for col in MONEY_FILL_COLS + COMPUTED_COLS:
+        if col in df.columns:
+            df[col] = from_cents(df[col])
+    if 'Daily_Order_Count' in df.columns:
+        df['Daily_Order_Count'] = df['Daily_Order_Count'].astype(int)
+    if 'Notes' in df.columns:
+        df['Notes'] = df['Notes'].astype(object)
+    return df
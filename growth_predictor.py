@@ -1,12 +1,30 @@
 # growth_predictor.py
 
+import numpy as np
 import pandas as pd
 from datetime import timedelta
 
+import business_calendar
+import finance_calculator
+import payout_schedule
+import profiler
+
 # --- 增长策略相关的固定参数 ---
 # 增加1单需要的额外缓冲资金 (用来覆盖新单的15天空窗期垫付)
 INCREMENT_ORDER_BUFFER_PER_UNIT = 900.0
 
+# --- 蒙特卡洛风险模拟的参数 ---
+SIMULATION_PATHS = 10_000
+SIMULATION_HORIZON_DAYS = 180
+# 报告的分位数：P10 为乐观情形，P50 为中位数，P90 为保守情形
+SIMULATION_PERCENTILES = (10, 50, 90)
+
+# --- 增单计划的参数 ---
+PLAN_MONTHS = 6
+# 单次规划最多安排的增单次数 (每次 +1 单/天)
+PLAN_MAX_INCREMENTS = 50
+
+@profiler.profiled()
 def analyze_growth(df_calculated: pd.DataFrame, payout_delay_days: int) -> dict:
     """
     分析财务数据并预测下一个增长点。
@@ -14,25 +32,30 @@ def analyze_growth(df_calculated: pd.DataFrame, payout_delay_days: int) -> dict:
     :param payout_delay_days: 支付延迟天数，用于确定稳定期。
     :return: 一个包含预测结果的字典。
     """
-    
-    # 至少需要一个完整的支付周期 + 1天的数据才能进行有意义的预测
-    if len(df_calculated) <= payout_delay_days:
-        return {
-            "status": "calculating",
-            "message": "数据不足，至少需要运营超过一个回款周期才能进行预测..."
-        }
-
     # 1. 确定稳定期 (从第 payout_delay_days + 1 天开始)
     stable_period_df = df_calculated.iloc[payout_delay_days:]
-    
     if stable_period_df.empty:
+        return predict_next_increment(0, 0.0, None)
+    return predict_next_increment(len(stable_period_df), stable_period_df['daily_net_cash_flow'].sum(),
+                                  df_calculated.iloc[-1])
+
+
+def predict_next_increment(stable_days: int, stable_net_cash_flow: float, latest_data) -> dict:
+    """
+    由稳定期的天数和净现金流之和预测下一个增长点 (analyze_growth 的后半部分)。
+    两个汇总数可以直接由数据库聚合得到 (data_manager.load_stable_period_summary)，不必读取整个历史账本。
+    :param latest_data: 账本最后一天的记录 (Date、bank_balance、Daily_Order_Count)。
+    :return: 一个包含预测结果的字典。
+    """
+    # 至少需要一个完整的支付周期 + 1天的数据才能进行有意义的预测
+    if stable_days <= 0:
         return {
             "status": "calculating",
-            "message": "已度过第一个回款周期，正在积累稳定期数据..."
+            "message": "数据不足，至少需要运营超过一个回款周期才能进行预测..."
         }
 
     # 2. 计算稳定期的日均净现金流 (这是你每天能攒下的钱)
-    avg_daily_net_cash_flow = stable_period_df['daily_net_cash_flow'].mean()
+    avg_daily_net_cash_flow = stable_net_cash_flow / stable_days
 
     # 如果日均净现金流为负或零，说明在亏钱或持平，无法支持增单
     if avg_daily_net_cash_flow <= 0:
@@ -42,7 +65,6 @@ def analyze_growth(df_calculated: pd.DataFrame, payout_delay_days: int) -> dict:
         }
     
     # 获取最新数据
-    latest_data = df_calculated.iloc[-1]
     current_date = latest_data['Date']
     current_bank_balance = latest_data['bank_balance']
 
@@ -72,3 +94,299 @@ def analyze_growth(df_calculated: pd.DataFrame, payout_delay_days: int) -> dict:
         "predicted_date_for_increment": predicted_date,
         "target_order_count": target_order_count
     }
+
+
+@profiler.profiled()
+def analyze_growth_by_store(ledgers: dict, payout_delay_days) -> dict:
+    """
+    对每个店铺的账本分别做增长预测 (各店铺的现金流相互独立，增单节奏也应分别判断)。
+    :param ledgers: {店铺: 账本DataFrame}
+    :param payout_delay_days: 各店铺共用的回款天数，或 {店铺: 回款天数}
+    :return: {店铺: analyze_growth 的预测结果}
+    """
+    delays = payout_delay_days if isinstance(payout_delay_days, dict) else dict.fromkeys(ledgers, payout_delay_days)
+    return {store: analyze_growth(df_calculated, delays[store]) for store, df_calculated in ledgers.items()}
+
+
+def _recent_receivable(df_calculated: pd.DataFrame, days: int, df_early_payouts=None) -> np.ndarray:
+    """
+    账本最后 days 天尚未回款的应收款 (成本 + 利润 - 来源日期明确的提前回款)；账本不足 days 天时前面补 0。
+    提前回款在收款日已经计入了账本余额，与 calculate_finances 一样要从来源订单日的应收款中扣除，否则会重复计算。
+    """
+    recent = df_calculated.iloc[-days:] if days > 0 else df_calculated.iloc[:0]
+    receivable = (recent['Total_Daily_Cost'] + recent['Total_Daily_Profit']).to_numpy(dtype=float)
+    if df_early_payouts is not None and not recent.empty:
+        _, deducted = finance_calculator.early_payout_series(df_early_payouts, pd.DatetimeIndex(recent['Date']))
+        receivable = receivable - deducted.to_numpy(dtype=float)
+    return np.concatenate([np.zeros(days - len(receivable)), receivable])
+
+
+def _payout_kernel(kernel) -> np.ndarray:
+    """回款分布 (payout_schedule 的回款核)；整数表示固定天数后全额回款。"""
+    return payout_schedule.fixed_kernel(kernel) if np.isscalar(kernel) else np.asarray(kernel, dtype=float)
+
+
+def _stable_period(df_calculated: pd.DataFrame, payout_delay_days: int, ledger_start=None) -> pd.DataFrame:
+    """
+    账本中稳定期 (账本首日起第 payout_delay_days 天之后) 的行。
+    df_calculated 只是账本末尾的一段 (例如仪表盘的显示范围) 时，用 ledger_start 指定整个账本的首日。
+    """
+    if ledger_start is None or df_calculated.empty:
+        return df_calculated.iloc[payout_delay_days:]
+    return df_calculated[df_calculated['Date'] >= pd.Timestamp(ledger_start) + timedelta(days=payout_delay_days)]
+
+
+def _settled_inflows(pending_receivable, future_receivable, current_date, length: int, lead_days: int, kernel, calendar):
+    """
+    计算未来 length 天每天实际到账的回款 (沿最后一个轴，可以是多条路径组成的矩阵)，回款模型与账本相同。
+    应收款按订单日排列：先是账本最后 lead_days + 最晚回款天数 天的 pending_receivable，再接上未来订单的
+    future_receivable；与回款分布卷积得到从 current_date + 1 - lead_days 起每个到期日的回款
+    (账本中已经到期的部分不会重复计入)，再按营业日历 (若有) 顺延到营业日。
+    """
+    future_receivable = np.asarray(future_receivable, dtype=float)[..., :length]
+    pending = np.broadcast_to(pending_receivable, future_receivable.shape[:-1] + (len(pending_receivable),))
+    due = payout_schedule.expected_inflows(np.concatenate([pending, future_receivable], axis=-1),
+                                           kernel)[..., payout_schedule.max_delay(kernel):]
+    if calendar is None:
+        return due
+    first_day = current_date + timedelta(days=1)
+    return business_calendar.settled_amounts(due, first_day - timedelta(days=lead_days), first_day, length, calendar)
+
+
+@profiler.profiled()
+def simulate_growth(df_calculated: pd.DataFrame, kernel, n_paths: int = SIMULATION_PATHS,
+                    horizon_days: int = SIMULATION_HORIZON_DAYS, seed=None, calendar=None, df_early_payouts=None,
+                    ledger_start=None) -> dict:
+    """
+    蒙特卡洛风险模拟：从稳定期的历史日子中有放回地抽样 (成本、利润、退款、其他入账按天成组抽取)，
+    一次性生成 n_paths 条未来 horizon_days 天的现金流路径 (NumPy 矩阵运算，不逐条循环)。
+    每天的成本 + 利润按回款分布 kernel 分散到之后各天到账 (与账本相同的卷积)；最初几天的回款来自账本中尚未回款的真实订单。
+    抽样假设未来的日子与稳定期同分布，不外推订单量的增长趋势。
+    :param kernel: 回款分布 (data_manager.get_payout_kernel 的结果)；整数表示固定天数后全额回款。
+    :param calendar: 营业日历 (business_calendar.BusinessCalendar)；给定时回款顺延到营业日，与账本一致。
+    :param df_early_payouts: 提前回款数据；已经提前收回的应收款不会在模拟中再次到账。
+    :param ledger_start: 整个账本的首日；df_calculated 只是账本最近的一段时传入，此时只从这一段的稳定期中抽样
+                         (这一段至少要覆盖最晚回款天数加上节假日前的非营业天数，才能得到尚未回款的应收款)。
+    :return: 一个包含透支概率、余额分位数区间以及安全增单日期分位数的字典。
+    """
+    kernel = _payout_kernel(kernel)
+    payout_delay_days = payout_schedule.max_delay(kernel)
+    stable_period_df = _stable_period(df_calculated, payout_delay_days, ledger_start)
+    if stable_period_df.empty:
+        return {
+            "status": "calculating",
+            "message": "数据不足，至少需要运营超过一个回款周期才能进行模拟..."
+        }
+
+    hist_cost = stable_period_df['Total_Daily_Cost'].to_numpy(dtype=float)
+    hist_receivable = hist_cost + stable_period_df['Total_Daily_Profit'].to_numpy(dtype=float)
+    hist_other_inflow = (stable_period_df['Refunds_Received_Today'].to_numpy(dtype=float)
+                         + stable_period_df['Other_Income_Today'].to_numpy(dtype=float))
+
+    latest_data = df_calculated.iloc[-1]
+    current_date = latest_data['Date']
+    current_bank_balance = latest_data['bank_balance']
+    # 最后 payout_delay_days 天的订单还没有全部回款，剩下的部分会在模拟的前几天到账；
+    # 按营业日历结算时，之前几个非营业日到期、顺延到明天以后的回款也还没有到账
+    lead_days = calendar.lead_days(current_date + timedelta(days=1)) if calendar is not None else 0
+    pending_receivable = _recent_receivable(df_calculated, lead_days + payout_delay_days, df_early_payouts)
+
+    # 按天成组抽样：每条路径的每一天都是稳定期中随机的一天
+    rng = np.random.default_rng(seed)
+    sampled_days = rng.integers(0, len(stable_period_df), size=(n_paths, horizon_days))
+    cost = hist_cost[sampled_days]
+
+    # 回款矩阵：已有订单尚未到账的部分加上路径自身订单按回款分布到账的部分
+    inflow = _settled_inflows(pending_receivable, hist_receivable[sampled_days], current_date,
+                              horizon_days, lead_days, kernel, calendar)
+    inflow += hist_other_inflow[sampled_days]
+
+    accumulated = np.cumsum(inflow - cost, axis=1)
+    balances = current_bank_balance + accumulated
+
+    # 透支：路径上任意一天余额为负
+    overdraft_probability = float((balances.min(axis=1) < 0).mean())
+
+    # 安全增单日：累计攒下的现金首次达到增单缓冲金，且在此之前没有透支过
+    reached = (accumulated >= INCREMENT_ORDER_BUFFER_PER_UNIT) & (np.minimum.accumulate(balances, axis=1) >= 0)
+    reached_any = reached.any(axis=1)
+    days_to_safe = np.where(reached_any, reached.argmax(axis=1) + 1, np.inf)
+    day_quantiles = np.quantile(days_to_safe, [p / 100 for p in SIMULATION_PERCENTILES], method='inverted_cdf')
+    safe_dates = {p: (current_date + timedelta(days=int(d)) if np.isfinite(d) else None)
+                  for p, d in zip(SIMULATION_PERCENTILES, day_quantiles)}
+
+    balance_bands = pd.DataFrame(np.percentile(balances, SIMULATION_PERCENTILES, axis=0).T,
+                                 columns=[f"P{p}" for p in SIMULATION_PERCENTILES])
+    balance_bands.insert(0, 'Date', pd.date_range(current_date + timedelta(days=1), periods=horizon_days, freq='D'))
+
+    return {
+        "status": "ok",
+        "message": "已完成风险模拟",
+        "n_paths": n_paths,
+        "horizon_days": horizon_days,
+        "overdraft_probability": overdraft_probability,
+        "reach_probability": float(reached_any.mean()),
+        "safe_increment_dates": safe_dates,
+        "balance_percentiles": balance_bands,
+        "target_order_count": latest_data['Daily_Order_Count'] + 1,
+    }
+
+
+def _paid_order_days(kernel, length: int) -> np.ndarray:
+    """
+    从第 0 天起每天多做 1 单，截至第 j 天 (含) 到期的回款相当于多少天的订单 (j = 0..length-1)：
+    第 j 天到期的是之前各天订单中回款天数不超过 j 的部分，即回款分布的累积分布函数之和。
+    固定天数 D 时为 max(0, j - D + 1)。
+    """
+    cdf = np.ones(length)
+    head = np.cumsum(kernel)[:length]
+    cdf[:len(head)] = head
+    return np.cumsum(cdf)
+
+
+def _increment_kernel(per_order_cost: float, per_order_profit: float, kernel, length: int) -> np.ndarray:
+    """
+    从某天起每天多做 1 单，对之后第 j 天银行余额的累计影响 (j = 0 为增单当天)：
+    每天多垫付一单成本，多出的成本 + 利润按回款分布陆续到账；全部到账后每天净增一单利润。
+    """
+    j = np.arange(length)
+    return (per_order_cost + per_order_profit) * _paid_order_days(kernel, length) - per_order_cost * (j + 1)
+
+
+def _calendar_increment_impact(per_order_cost: float, per_order_profit: float, kernel,
+                               horizon_days: int, settle: np.ndarray) -> np.ndarray:
+    """
+    按营业日历结算时第 s 天增单对第 t 天余额的影响矩阵 (t < s 为 inf)。
+    回款顺延后影响不再是同一条曲线的平移：截至第 t 天已结算的到期日由日历索引 settle 决定，
+    已回款的订单天数 = 增单后到这个到期日为止按回款分布到期的部分。
+    """
+    total_days = len(settle)
+    t = np.arange(total_days)
+    s = np.arange(horizon_days)[:, None]
+    # 第 t 天 (含) 以前结算的最后一个到期日
+    last_settled_due = np.searchsorted(settle, t, side='right') - 1
+    due_offsets = last_settled_due[None, :] - s
+    paid_days = np.where(due_offsets >= 0, _paid_order_days(kernel, total_days)[np.clip(due_offsets, 0, None)], 0.0)
+    impact = -per_order_cost * (t[None, :] - s + 1) + (per_order_cost + per_order_profit) * paid_days
+    return np.where(t[None, :] >= s, impact, np.inf)
+
+
+@profiler.profiled()
+def plan_order_ramp_up(df_calculated: pd.DataFrame, kernel, months: int = PLAN_MONTHS,
+                       min_balance: float = 0.0, max_increments: int = PLAN_MAX_INCREMENTS, calendar=None,
+                       df_early_payouts=None, ledger_start=None) -> dict:
+    """
+    规划未来 months 个月内最快的增单节奏 (每次 +1 单/天)，并保证预测的银行余额始终不低于 min_balance。
+    现金流规则与 calculate_finances 一致：当天支付成本，成本 + 利润按回款分布 kernel 陆续收回；
+    单笔成本和利润取稳定期的平均值，账本最后几天尚未回款的订单会在计划的前几天到账。
+    每次增单对余额的影响是同一条曲线的平移，所以只需在现有预测上叠加这条曲线，
+    而不必为每个候选方案重新计算整个账本；每一步贪心地选择最早可行的增单日。
+    给定营业日历 calendar 时，回款顺延到营业日结算，影响矩阵改由日历索引一次性算出。
+    :param kernel: 回款分布 (data_manager.get_payout_kernel 的结果)；整数表示固定天数后全额回款。
+    :param df_early_payouts: 提前回款数据；已经提前收回的应收款不会在计划中再次到账。
+    :param ledger_start: 整个账本的首日；df_calculated 只是账本最近的一段时传入 (要求同 simulate_growth)。
+    :return: 一个包含增单日程和逐日预测 (订单数、银行余额) 的字典。
+    """
+    kernel = _payout_kernel(kernel)
+    payout_delay_days = payout_schedule.max_delay(kernel)
+    stable_period_df = _stable_period(df_calculated, payout_delay_days, ledger_start)
+    if stable_period_df.empty:
+        return {
+            "status": "calculating",
+            "message": "数据不足，至少需要运营超过一个回款周期才能制定增单计划..."
+        }
+
+    total_orders = stable_period_df['Daily_Order_Count'].sum()
+    if total_orders <= 0:
+        return {"status": "warning", "message": "稳定期内没有订单，无法估算单笔成本和利润。"}
+    per_order_cost = stable_period_df['Total_Daily_Cost'].sum() / total_orders
+    per_order_profit = stable_period_df['Total_Daily_Profit'].sum() / total_orders
+    if per_order_profit <= 0:
+        return {"status": "warning", "message": f"稳定期内单笔平均利润为 {per_order_profit:.2f} 元，增单只会消耗现金。"}
+    avg_other_inflow = (stable_period_df['Refunds_Received_Today'] + stable_period_df['Other_Income_Today']).mean()
+
+    latest_data = df_calculated.iloc[-1]
+    current_date = latest_data['Date']
+    start_orders = int(latest_data['Daily_Order_Count'])
+    horizon_days = (current_date + pd.DateOffset(months=months) - current_date).days
+    # 多观察一个回款周期，保证计划末尾增单的垫付低谷也在检查范围内
+    total_days = horizon_days + payout_delay_days
+
+    # 维持当前单量时的逐日余额预测
+    daily_receivable = start_orders * (per_order_cost + per_order_profit)
+    lead_days = calendar.lead_days(current_date + timedelta(days=1)) if calendar is not None else 0
+    inflow = _settled_inflows(_recent_receivable(df_calculated, lead_days + payout_delay_days, df_early_payouts),
+                              np.full(total_days, daily_receivable), current_date, total_days, lead_days,
+                              kernel, calendar) + avg_other_inflow
+    balance = latest_data['bank_balance'] + np.cumsum(inflow - start_orders * per_order_cost)
+
+    dates = pd.date_range(current_date + timedelta(days=1), periods=total_days, freq='D')
+    if balance.min() < min_balance:
+        breach_date = dates[int(np.argmax(balance < min_balance))]
+        return {
+            "status": "warning",
+            "message": f"按当前单量，预计余额将在 {breach_date.strftime('%Y-%m-%d')} 跌破下限 {min_balance:,.2f} 元，不建议增单。"
+        }
+
+    # impact[s, t]：第 s 天增单对第 t 天余额的影响 (t < s 时不受影响，记为 inf 以便取最小值时忽略)
+    if calendar is None:
+        increment = _increment_kernel(per_order_cost, per_order_profit, kernel, total_days)
+        offsets = np.arange(total_days)[None, :] - np.arange(horizon_days)[:, None]
+        impact = np.where(offsets >= 0, increment[np.clip(offsets, 0, None)], np.inf)
+    else:
+        settle = calendar.settlement_offsets(current_date + timedelta(days=1), total_days)
+        impact = _calendar_increment_impact(per_order_cost, per_order_profit, kernel, horizon_days, settle)
+
+    increment_days = []
+    earliest = 0
+    while len(increment_days) < max_increments and earliest < horizon_days:
+        # 所有候选增单日一次性评估：叠加影响后的最低余额
+        lowest = (balance[None, :] + impact[earliest:]).min(axis=1)
+        feasible = lowest >= min_balance
+        if not feasible.any():
+            break
+        day = earliest + int(np.argmax(feasible))
+        balance[day:] += impact[day, day:]
+        increment_days.append(day)
+        earliest = day
+
+    order_counts = start_orders + np.searchsorted(np.array(increment_days, dtype=int), np.arange(total_days), side='right')
+    projection = pd.DataFrame({'Date': dates, 'Daily_Order_Count': order_counts, 'bank_balance': balance}).iloc[:horizon_days]
+    schedule = pd.DataFrame({'Date': dates[increment_days], 'Daily_Order_Count': order_counts[increment_days]})
+
+    return {
+        "status": "ok",
+        "message": "已生成增单计划" if increment_days else "计划期内没有可以安全增单的日期",
+        "per_order_cost": per_order_cost,
+        "per_order_profit": per_order_profit,
+        "start_order_count": start_orders,
+        "final_order_count": start_orders + len(increment_days),
+        "min_projected_balance": float(balance.min()),
+        "schedule": schedule.drop_duplicates('Date', keep='last').reset_index(drop=True),
+        "projection": projection,
+    }
+
+
+def simulation_report_lines(simulation: dict) -> list:
+    """风险模拟结果的文字报告 (命令行菜单和 main.py report 共用)；模拟未完成时只有状态信息。"""
+    if simulation["status"] != "ok":
+        return [simulation["message"]]
+    lines = [f"风险模拟 ({simulation['n_paths']:,} 条路径 x {simulation['horizon_days']} 天):",
+             f"未来 {simulation['horizon_days']} 天内透支概率: {simulation['overdraft_probability']:.1%}"]
+    for p, safe_date in simulation['safe_increment_dates'].items():
+        lines.append(f"安全增单日期 P{p}: {safe_date.strftime('%Y-%m-%d') if safe_date is not None else '模拟期内无法达到'}")
+    return lines
+
+
+def plan_report_lines(plan: dict, months: int = PLAN_MONTHS, min_balance: float = 0.0, max_rows: int = 10) -> list:
+    """增单计划的文字报告 (命令行菜单和 main.py report 共用)，日程最多列出 max_rows 行。"""
+    lines = [f"增单计划 (未来 {months} 个月，余额不低于 {min_balance:,.0f} 元):"]
+    if plan["status"] != "ok":
+        return lines + [plan["message"]]
+    lines.append(f"单量: {plan['start_order_count']} -> {plan['final_order_count']} 单/天，"
+                 f"预测最低余额 {plan['min_projected_balance']:,.2f} 元")
+    for _, row in plan['schedule'].head(max_rows).iterrows():
+        lines.append(f"  {row['Date'].strftime('%Y-%m-%d')} 起增至 {row['Daily_Order_Count']} 单/天")
+    if len(plan['schedule']) > max_rows:
+        lines.append(f"  ... 共 {len(plan['schedule'])} 个增单日")
+    return lines
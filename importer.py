@@ -0,0 +1,214 @@
+# importer.py
+
+import io
+import os
+import pandas as pd
+
+import data_manager
+import finance_calculator
+import profiler
+
+# 每次从文件中读取的订单行数，内存占用只和这个值有关，与文件大小无关
+CHUNK_SIZE = 50_000
+
+# 平台导出文件中各字段可能使用的列名 (按优先级排列)
+COLUMN_CANDIDATES = {
+    'date': ['Date', 'Order_Date', 'order_date', '订单日期', '下单日期', '下单时间', '创建时间', '日期'],
+    'cost': ['Cost', 'cost', 'Order_Cost', '成本', '订单成本', '商品成本'],
+    'profit': ['Profit', 'profit', 'Order_Profit', '利润', '订单利润', '毛利'],
+    'refund': ['Refund', 'refund', 'Refund_Amount', '退款金额', '退款'],
+}
+REQUIRED_FIELDS = ['date', 'cost', 'profit']
+IMPORT_NOTE = '批量导入'
+# 精细录入时单日逐单明细表格的列 (成本、利润)
+ORDER_GRID_COLUMNS = ['成本', '利润']
+
+
+def _file_type(source, file_type=None):
+    """根据显式参数或文件名后缀判断文件类型 ('csv' 或 'excel')。"""
+    if file_type:
+        return file_type
+    name = source if isinstance(source, str) else getattr(source, 'name', '')
+    ext = os.path.splitext(name)[1].lower()
+    if ext in ('.xlsx', '.xlsm', '.xls'):
+        return 'excel'
+    return 'csv'
+
+
+def read_header(source, file_type=None) -> list:
+    """只读取表头，用于列名识别和界面上的列映射选择。"""
+    if _file_type(source, file_type) == 'excel':
+        columns = list(pd.read_excel(source, nrows=0).columns)
+    else:
+        columns = list(pd.read_csv(source, nrows=0).columns)
+    if hasattr(source, 'seek'):
+        source.seek(0)
+    return columns
+
+
+def detect_columns(columns) -> dict:
+    """
+    按 COLUMN_CANDIDATES 自动识别各字段对应的列名。
+    :return: {'date': 列名, 'cost': 列名, 'profit': 列名, 'refund': 列名或None}
+    """
+    column_map = {}
+    for field, candidates in COLUMN_CANDIDATES.items():
+        column_map[field] = next((c for c in candidates if c in columns), None)
+    return column_map
+
+
+def _read_excel_chunks(source, usecols, chunk_size):
+    """以只读流式模式逐块读取Excel (pandas.read_excel 不支持分块读取)。"""
+    try:
+        from openpyxl import load_workbook
+    except ImportError:
+        raise ImportError("读取Excel文件需要安装 openpyxl (pip install openpyxl)，或先将文件另存为CSV。")
+
+    workbook = load_workbook(source, read_only=True, data_only=True)
+    try:
+        rows = workbook.active.iter_rows(values_only=True)
+        header = list(next(rows, []))
+        indexes = [header.index(col) for col in usecols]
+        buffer = []
+        for row in rows:
+            buffer.append([row[i] for i in indexes])
+            if len(buffer) >= chunk_size:
+                yield pd.DataFrame(buffer, columns=usecols)
+                buffer = []
+        if buffer:
+            yield pd.DataFrame(buffer, columns=usecols)
+    finally:
+        workbook.close()
+
+
+def read_order_chunks(source, column_map: dict, chunk_size: int = CHUNK_SIZE, file_type=None):
+    """
+    分块读取订单导出文件，只读取需要的列。
+    :param source: 文件路径或文件对象 (例如 Streamlit 上传的文件)。
+    :return: 逐块产出 DataFrame 的生成器。
+    """
+    usecols = [column_map[f] for f in COLUMN_CANDIDATES if column_map.get(f)]
+    if _file_type(source, file_type) == 'excel':
+        yield from _read_excel_chunks(source, usecols, chunk_size)
+    else:
+        yield from pd.read_csv(source, usecols=usecols, chunksize=chunk_size)
+
+
+def aggregate_orders_by_day(chunks, column_map: dict) -> tuple:
+    """
+    把逐单数据按天汇总为 daily_data 的结构 (订单数、总成本、总利润、退款)。
+    每块先在块内汇总，再与之前的结果合并，所以内存只与天数有关。
+    :return: (按日期排序的每日汇总DataFrame, 因日期无法识别而跳过的行数)
+    """
+    date_col, cost_col, profit_col = column_map['date'], column_map['cost'], column_map['profit']
+    refund_col = column_map.get('refund')
+
+    daily = None
+    skipped_rows = 0
+    for chunk in chunks:
+        order_dates = pd.to_datetime(chunk[date_col], errors='coerce').dt.normalize()
+        valid = order_dates.notna()
+        skipped_rows += int((~valid).sum())
+
+        df_chunk = pd.DataFrame({
+            'Date': order_dates[valid],
+            'Daily_Order_Count': 1,
+            'Total_Daily_Cost': pd.to_numeric(chunk.loc[valid, cost_col], errors='coerce').fillna(0.0),
+            'Total_Daily_Profit': pd.to_numeric(chunk.loc[valid, profit_col], errors='coerce').fillna(0.0),
+            'Refunds_Received_Today': (pd.to_numeric(chunk.loc[valid, refund_col], errors='coerce').fillna(0.0)
+                                       if refund_col else 0.0),
+        })
+        chunk_daily = df_chunk.groupby('Date').sum()
+        daily = chunk_daily if daily is None else daily.add(chunk_daily, fill_value=0)
+
+    if daily is None or daily.empty:
+        return pd.DataFrame(), skipped_rows
+
+    daily = daily.sort_index().reset_index()
+    daily['Daily_Order_Count'] = daily['Daily_Order_Count'].astype(int)
+    daily['Estimated_Profit_Loss_From_Refunds'] = daily['Refunds_Received_Today'] * finance_calculator.AVERAGE_PROFIT_MARGIN
+    return daily, skipped_rows
+
+
+@profiler.profiled()
+def import_orders(source, column_map: dict = None, file_type=None, chunk_size: int = CHUNK_SIZE, store=None) -> dict:
+    """
+    批量导入平台订单导出文件 (CSV/Excel)：分块读取 -> 按天汇总 -> 分批写入 daily_data。
+    已存在的日期会覆盖订单数/成本/利润/退款，保留原有的其他入账和备注。
+    :param column_map: 字段到列名的映射，缺省时按表头自动识别。
+    :param store: 导入到哪个店铺，缺省为默认店铺。
+    :return: 导入结果摘要 (导入天数、订单数、日期范围、跳过行数)。
+    """
+    if column_map is None:
+        column_map = detect_columns(read_header(source, file_type))
+    missing = [f for f in REQUIRED_FIELDS if not column_map.get(f)]
+    if missing:
+        raise ValueError(f"无法识别以下字段对应的列: {', '.join(missing)}，请手动指定列映射。")
+
+    chunks = read_order_chunks(source, column_map, chunk_size=chunk_size, file_type=file_type)
+    daily, skipped_rows = aggregate_orders_by_day(chunks, column_map)
+    if daily.empty:
+        return {'days': 0, 'orders': 0, 'skipped_rows': skipped_rows, 'start_date': None, 'end_date': None}
+
+    rows = zip(daily['Date'].dt.strftime('%Y-%m-%d'), daily['Daily_Order_Count'].tolist(),
+               daily['Total_Daily_Cost'].tolist(), daily['Total_Daily_Profit'].tolist(),
+               daily['Refunds_Received_Today'].tolist(), daily['Estimated_Profit_Loss_From_Refunds'].tolist(),
+               [IMPORT_NOTE] * len(daily))
+    data_manager.save_daily_data_bulk(list(rows), store=store)
+
+    return {
+        'days': len(daily),
+        'orders': int(daily['Daily_Order_Count'].sum()),
+        'skipped_rows': skipped_rows,
+        'start_date': daily['Date'].iloc[0],
+        'end_date': daily['Date'].iloc[-1],
+    }
+
+
+# --- 单日逐单明细 (精细录入) ---
+
+def parse_order_text(text: str) -> pd.DataFrame:
+    """
+    解析粘贴的文本或 CSV 文件内容中的单日逐单明细：每行一笔订单，成本和利润用逗号、Tab、分号或空格分隔
+    (可以直接从表格软件复制)。第一行不是数字时视为表头，并按 COLUMN_CANDIDATES 识别成本和利润列。
+    :return: ORDER_GRID_COLUMNS 两列的 DataFrame (原样保留文本，由 validate_orders 统一校验)。
+    """
+    lines = [line.strip() for line in text.splitlines() if line.strip()]
+    if not lines:
+        return pd.DataFrame(columns=ORDER_GRID_COLUMNS)
+    df = pd.read_csv(io.StringIO('\n'.join(lines)), sep=r'[,\t; ]+', engine='python', header=None, dtype=str)
+
+    first_row = df.iloc[0]
+    if pd.to_numeric(first_row, errors='coerce').isna().all():
+        column_map = detect_columns(first_row.tolist())
+        positions = [first_row.tolist().index(column_map[f]) if column_map[f] else i
+                     for i, f in enumerate(['cost', 'profit'])]
+        df = df.iloc[1:, positions]
+    else:
+        df = df.iloc[:, :2]
+    df.columns = ORDER_GRID_COLUMNS[:df.shape[1]]
+    return df.reindex(columns=ORDER_GRID_COLUMNS).reset_index(drop=True)
+
+
+def validate_orders(df: pd.DataFrame) -> dict:
+    """
+    一次性 (向量化) 校验并汇总单日逐单明细：前两列依次为成本和利润，可以是数字或文本。
+    全空的行直接忽略；数字无法识别或成本为负的行记为无效 (利润允许为负，表示亏本订单)。
+    :return: {'orders': 有效订单的 (成本, 利润) 数组, 'count': 有效订单数, 'total_cost', 'total_profit',
+              'invalid_rows': 无效行的行号 (从 1 开始)}
+    """
+    grid = df.iloc[:, :2]
+    values = grid.apply(pd.to_numeric, errors='coerce')
+    blank = grid.isna() | grid.astype(str).apply(lambda column: column.str.strip() == '')
+    filled = ~blank.all(axis=1)
+    invalid = filled & (values.isna().any(axis=1) | (values.iloc[:, 0] < 0))
+    valid = filled & ~invalid
+
+    orders = values[valid].to_numpy(dtype=float)
+    return {
+        'orders': orders,
+        'count': len(orders),
+        'total_cost': float(orders[:, 0].sum()) if len(orders) else 0.0,
+        'total_profit': float(orders[:, 1].sum()) if len(orders) else 0.0,
+        'invalid_rows': (invalid.to_numpy().nonzero()[0] + 1).tolist(),
+    }
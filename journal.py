@@ -0,0 +1,235 @@
+# journal.py
+# 操作日志 (event sourcing)：被记录的表上的每一次增删改都由触发器追加一条事件 (表名、行键、修改前后的整行 JSON)，
+# 日志只追加、不修改。每次写入操作 (保存一天、删除一条回款……) 先登记一条“操作”，其间产生的事件都归属于它，
+# 因此可以整体撤销一次操作，撤销本身也是一次新的操作。
+# 每累计 SNAPSHOT_INTERVAL 条事件保存一次快照 (各表当时的全部行)，重建任意时刻的数据时从之前最近的快照开始回放，
+# 回放的事件数不超过快照间隔加一次操作的事件数，与日志总长度无关。
+# 这里只处理通用的日志逻辑，记录哪些表、行键是哪一列由调用方 (data_manager) 传入。
+
+import json
+from datetime import datetime
+
+OPERATIONS_TABLE = 'journal_operations'
+EVENTS_TABLE = 'journal_events'
+SNAPSHOTS_TABLE = 'journal_snapshots'
+SNAPSHOT_ROWS_TABLE = 'journal_snapshot_rows'
+
+SNAPSHOT_INTERVAL = 500
+TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+
+def _columns(c, table):
+    c.execute(f"PRAGMA table_info({table})")
+    return [row[1] for row in c.fetchall()]
+
+
+def _row_json(c, table, prefix=''):
+    """SQL 表达式：把一行转换为 JSON 对象 (prefix 为 NEW. 或 OLD.)。"""
+    return "json_object(" + ', '.join(f"'{column}', {prefix}{column}" for column in _columns(c, table)) + ")"
+
+
+def _ignored_condition(column, keys, prefix=''):
+    """不记录的行 (例如派生的设置项) 的排除条件。"""
+    if not keys:
+        return '1'
+    return f"{prefix}{column} NOT IN ({', '.join(repr(key) for key in keys)})"
+
+
+def create_schema(c, tables, snapshot_tables, ignored_keys=None):
+    """
+    创建日志表和各被记录表上的触发器；日志为空时保存一个基线快照 (已有数据库升级时的起点)。
+    :param tables: {表名: 行键列}，这些表的每一次增删改都会记入日志。
+    :param snapshot_tables: 快照和回放覆盖的表 (tables 的子集)。
+    :param ignored_keys: {表名: [行键]}，这些行的修改不记录 (由其他数据派生、撤销时不应恢复的行)。
+    """
+    ignored_keys = ignored_keys or {}
+    c.execute(f'''
+        CREATE TABLE IF NOT EXISTS {OPERATIONS_TABLE} (
+            op_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            recorded_at TEXT NOT NULL,
+            description TEXT NOT NULL,
+            start_event INTEGER NOT NULL, -- 操作开始前最后一条事件的序号
+            undo_of INTEGER,              -- 撤销操作：被撤销的操作
+            undone_by INTEGER             -- 已被哪个操作撤销
+        )
+    ''')
+    c.execute(f"CREATE INDEX IF NOT EXISTS idx_{OPERATIONS_TABLE}_recorded_at ON {OPERATIONS_TABLE} (recorded_at)")
+    c.execute(f'''
+        CREATE TABLE IF NOT EXISTS {EVENTS_TABLE} (
+            event_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            op_id INTEGER,
+            table_name TEXT NOT NULL,
+            row_key TEXT NOT NULL,
+            old_row TEXT, -- 修改前的整行 (JSON)，插入时为空
+            new_row TEXT  -- 修改后的整行 (JSON)，删除时为空
+        )
+    ''')
+    c.execute(f"CREATE INDEX IF NOT EXISTS idx_{EVENTS_TABLE}_op_id ON {EVENTS_TABLE} (op_id)")
+    c.execute(f'''
+        CREATE TABLE IF NOT EXISTS {SNAPSHOTS_TABLE} (
+            snapshot_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            event_id INTEGER NOT NULL, -- 快照包含到这条事件为止的所有修改
+            recorded_at TEXT NOT NULL
+        )
+    ''')
+    c.execute(f"CREATE INDEX IF NOT EXISTS idx_{SNAPSHOTS_TABLE}_event_id ON {SNAPSHOTS_TABLE} (event_id)")
+    c.execute(f'''
+        CREATE TABLE IF NOT EXISTS {SNAPSHOT_ROWS_TABLE} (
+            snapshot_id INTEGER NOT NULL,
+            table_name TEXT NOT NULL,
+            rows TEXT NOT NULL, -- 该表所有行的 JSON 数组
+            PRIMARY KEY (snapshot_id, table_name)
+        )
+    ''')
+
+    # 当前操作 = 最近登记的操作 (写入事务持有写锁，期间不会有其他操作插入)
+    current_op = f"(SELECT MAX(op_id) FROM {OPERATIONS_TABLE})"
+    for table, key in tables.items():
+        keys = ignored_keys.get(table)
+        images = {'INSERT': ('NEW', 'NULL', _row_json(c, table, 'NEW.')),
+                  'UPDATE': ('NEW', _row_json(c, table, 'OLD.'), _row_json(c, table, 'NEW.')),
+                  'DELETE': ('OLD', _row_json(c, table, 'OLD.'), 'NULL')}
+        for operation, (row, old_row, new_row) in images.items():
+            c.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS trg_{table}_journal_{operation.lower()} AFTER {operation} ON {table}
+                WHEN {_ignored_condition(key, keys, row + '.')}
+                BEGIN
+                    INSERT INTO {EVENTS_TABLE} (op_id, table_name, row_key, old_row, new_row)
+                    VALUES ({current_op}, '{table}', CAST({row}.{key} AS TEXT), {old_row}, {new_row});
+                END
+            ''')
+
+    c.execute(f"SELECT COUNT(1) FROM {SNAPSHOTS_TABLE}")
+    if c.fetchone()[0] == 0:
+        save_snapshot(c, {table: tables[table] for table in snapshot_tables}, ignored_keys)
+
+
+def last_event(c) -> int:
+    """日志中最后一条事件的序号 (没有事件时为 0)。"""
+    c.execute(f"SELECT COALESCE(MAX(event_id), 0) FROM {EVENTS_TABLE}")
+    return c.fetchone()[0]
+
+
+def last_operation(c):
+    """日志中最后一次操作的 (编号, 记录时间)，没有操作时返回 None。"""
+    c.execute(f"SELECT op_id, recorded_at FROM {OPERATIONS_TABLE} ORDER BY op_id DESC LIMIT 1")
+    row = c.fetchone()
+    return list(row) if row else None
+
+
+def save_snapshot(c, tables, ignored_keys=None):
+    """保存各表当前的全部行作为快照 (与写入在同一事务中，快照对应当时最后一条事件)。"""
+    ignored_keys = ignored_keys or {}
+    c.execute(f"INSERT INTO {SNAPSHOTS_TABLE} (event_id, recorded_at) VALUES (?, ?)",
+              (last_event(c), datetime.now().strftime(TIMESTAMP_FORMAT)))
+    snapshot_id = c.lastrowid
+    for table, key in tables.items():
+        c.execute(f'''
+            INSERT INTO {SNAPSHOT_ROWS_TABLE} (snapshot_id, table_name, rows)
+            SELECT ?, ?, json_group_array({_row_json(c, table)}) FROM {table}
+            WHERE {_ignored_condition(key, ignored_keys.get(table))}
+        ''', (snapshot_id, table))
+
+
+def begin_operation(c, description, snapshot_tables, ignored_keys=None, undo_of=None) -> int:
+    """
+    登记一次写入操作，之后 (同一事务中) 的修改都记在它名下；距上次快照的事件数达到 SNAPSHOT_INTERVAL 时先保存快照。
+    :param snapshot_tables: {表名: 行键列}，快照覆盖的表。
+    :return: 操作编号。
+    """
+    start_event = last_event(c)
+    c.execute(f"SELECT COALESCE(MAX(event_id), 0) FROM {SNAPSHOTS_TABLE}")
+    if start_event - c.fetchone()[0] >= SNAPSHOT_INTERVAL:
+        save_snapshot(c, snapshot_tables, ignored_keys)
+    c.execute(f'''
+        INSERT INTO {OPERATIONS_TABLE} (recorded_at, description, start_event, undo_of) VALUES (?, ?, ?, ?)
+    ''', (datetime.now().strftime(TIMESTAMP_FORMAT), description, start_event, undo_of))
+    return c.lastrowid
+
+
+def position_at(c, as_of: str) -> int:
+    """as_of 时刻 (TIMESTAMP_FORMAT) 日志的位置：在此之后登记的第一个操作开始前的最后一条事件。"""
+    c.execute(f"SELECT start_event FROM {OPERATIONS_TABLE} WHERE recorded_at > ? ORDER BY recorded_at, op_id LIMIT 1",
+              (as_of,))
+    row = c.fetchone()
+    return row[0] if row else last_event(c)
+
+
+def replay(c, position: int, tables) -> dict:
+    """
+    重建日志位置 position 时各表的内容：取不晚于 position 的最近快照，再依次应用之后到 position 为止的事件。
+    :param tables: {表名: 行键列}，需要重建的表 (必须包含在快照中)。
+    :return: {表名: [行 (dict)]}
+    """
+    c.execute(f"SELECT snapshot_id, event_id FROM {SNAPSHOTS_TABLE} WHERE event_id <= ? ORDER BY event_id DESC LIMIT 1",
+              (position,))
+    snapshot = c.fetchone()
+    state = {table: {} for table in tables}
+    snapshot_event = 0
+    if snapshot is not None:
+        snapshot_id, snapshot_event = snapshot
+        c.execute(f"SELECT table_name, rows FROM {SNAPSHOT_ROWS_TABLE} WHERE snapshot_id = ?", (snapshot_id,))
+        for table, rows in c.fetchall():
+            if table in state:
+                state[table] = {str(row[tables[table]]): row for row in json.loads(rows)}
+
+    placeholders = ', '.join('?' * len(tables))
+    c.execute(f'''
+        SELECT table_name, row_key, new_row FROM {EVENTS_TABLE}
+        WHERE event_id > ? AND event_id <= ? AND table_name IN ({placeholders})
+        ORDER BY event_id
+    ''', (snapshot_event, position, *tables))
+    for table, key, new_row in c.fetchall():
+        if new_row is None:
+            state[table].pop(key, None)
+        else:
+            state[table][key] = json.loads(new_row)
+    return {table: list(rows.values()) for table, rows in state.items()}
+
+
+def last_undoable(c):
+    """最近一次可以撤销的操作 (有修改、未被撤销、本身不是撤销)：(操作编号, 描述)，没有时返回 None。"""
+    c.execute(f'''
+        SELECT op_id, description FROM {OPERATIONS_TABLE} AS o
+        WHERE undone_by IS NULL AND undo_of IS NULL
+          AND EXISTS (SELECT 1 FROM {EVENTS_TABLE} AS e WHERE e.op_id = o.op_id)
+        ORDER BY op_id DESC LIMIT 1
+    ''')
+    return c.fetchone()
+
+
+def undo(c, op_id, description, tables, snapshot_tables, ignored_keys=None) -> dict:
+    """
+    撤销一次操作：把它修改过的每一行恢复为操作前的内容，并登记为一次新的操作。
+    :param tables: {表名: 行键列}，按恢复顺序排列；由触发器派生的表 (例如按订单汇总的主数据) 放在最后，
+                   这样先恢复的表触发的连带修改会被最后的整行恢复覆盖。
+    :return: {表名: {行键: (操作前的行, 撤销前的行)}}，行不存在时为 None。
+    """
+    c.execute(f"SELECT table_name, row_key, old_row, new_row FROM {EVENTS_TABLE} WHERE op_id = ? ORDER BY event_id",
+              (op_id,))
+    changes = {table: {} for table in tables}
+    for table, key, old_row, new_row in c.fetchall():
+        before = changes[table][key][0] if key in changes[table] else (json.loads(old_row) if old_row else None)
+        changes[table][key] = (before, json.loads(new_row) if new_row else None)
+
+    undo_op = begin_operation(c, description, snapshot_tables, ignored_keys, undo_of=op_id)
+    for table, key_column in tables.items():
+        for key, (before, _) in changes[table].items():
+            if before is None:
+                c.execute(f"DELETE FROM {table} WHERE {key_column} = ?", (key,))
+            else:
+                c.execute(f"INSERT OR REPLACE INTO {table} ({', '.join(before)}) VALUES ({', '.join('?' * len(before))})",
+                          tuple(before.values()))
+    c.execute(f"UPDATE {OPERATIONS_TABLE} SET undone_by = ? WHERE op_id = ?", (undo_op, op_id))
+    return changes
+
+
+def operations(c, limit=None):
+    """最近的操作 (新的在前)：(操作编号, 时间, 描述, 修改行数, 被撤销, 是否为撤销操作)。"""
+    c.execute(f'''
+        SELECT op_id, recorded_at, description,
+               (SELECT COUNT(1) FROM {EVENTS_TABLE} AS e WHERE e.op_id = o.op_id),
+               undone_by IS NOT NULL, undo_of IS NOT NULL
+        FROM {OPERATIONS_TABLE} AS o ORDER BY op_id DESC LIMIT ?
+    ''', (-1 if limit is None else limit,))
+    return c.fetchall()
@@ -1,291 +1,453 @@
-# main.py (已更新)
-
-import data_manager
-import finance_calculator
-import growth_predictor
-import reporter
+# main.py
+# 命令行入口。不带子命令时进入交互式菜单 (menu.py)；带子命令时无交互地执行一次操作并以状态码退出，
+# 适合定时任务和批量补录脚本。data_manager 在解析参数之后才导入，--help 和参数错误不会加载 pandas；
+# 录入同样需要 pandas (每次写入都会增量刷新物化账本)，matplotlib 只在 charts 子命令里导入。
+#
+#   python main.py add 2024-05-01 --orders 12 --cost 300 --profit 80
+#   python main.py add 2024-05-01 --order 25 6.5 --order 30 8 --refunds 20
+#   python main.py add 2024-05-01 --orders-file orders.csv           (每行 "成本,利润"；- 表示从标准输入读取)
+#   python main.py add-payout 2024-05-10 150 --origin 2024-05-01
+#   python main.py report --json
+#   python main.py charts --output-dir charts
+#   python main.py export --output ledger.csv --start 2024-01-01
+#   python main.py export --exact --format json
+#   python main.py export --as-of "2024-05-01 18:00"                 (按当时的数据重算账本)
+#   python main.py snapshot-export --format npy                     (列式快照，默认写到 snapshots/<店铺>/)
+#   python main.py snapshot-import snapshots/默认店铺/20240501-180000-000000 --store 新店
+#   python main.py rollup --period month --format csv
+#   python main.py history --limit 20
+#   python main.py undo
+#   python main.py serve --port 8765
+
+import argparse
+import json
+import os
+import sys
+from contextlib import redirect_stdout
 from datetime import datetime
-import pandas as pd
-
-def display_main_menu():
-    """显示主菜单 (已恢复清晰的录入选项)"""
-    print("\n" + "="*20 + " E-commerce 财务罗盘 " + "="*20)
-    print("核心操作:")
-    print("  1. 精细录入 (逐单输入)") # <--- 恢复
-    print("  2. 快速录入 (单日总数)") # <--- 恢复
-    print("  3. 管理提前回款记录")
-    print("---")
-    print("分析与报告:")
-    print("  4. 生成最新综合报告 (含增长预测)")
-    print("  5. 生成并保存财务图表")
-    print("---")
-    print("数据管理:")
-    print("  6. 删除一日主数据")
-    print("  7. 查看所有历史数据")
-    print("---")
-    print("  8. 退出程序")
-    print("="*58)
-    return input("请输入选项 (1-8): ")
-
-def handle_generate_charts():
-    """处理生成并保存图表的流程。"""
-    print("\n--- 5. 生成并保存财务图表 ---")
-    df_history = data_manager.load_all_data()
-    if df_history.empty:
-        print("\n数据库为空，无法生成图表。")
-        return
-        
-    df_early = data_manager.load_all_early_payouts()
-    df_calculated = finance_calculator.calculate_finances(df_history, df_early)
-    
-    # 调用 reporter 模块的函数来生成图表
-    reporter.plot_financial_trends(df_calculated)
-
-
-def get_date_input(prompt):
-    """一个通用的、带验证的日期输入函数。"""
-    while True:
-        date_str = input(prompt)
-        try:
-            datetime.strptime(date_str, '%Y-%m-%d')
-            return date_str
-        except ValueError:
-            print("日期格式错误，请输入YYYY-MM-DD 格式。")
-
-
-# --- 功能 1 & 2: 精细录入 & 快速录入 ---
-def get_common_inputs(is_quick_mode):
-    """
-    获取两种录入模式的通用输入部分。
-    增加对退款金额和对应利润损失的估算。
-    """
-    date_str = get_date_input("请输入日期 (格式YYYY-MM-DD): ")
-
-    if is_quick_mode:
-        print("\n--- 2. 快速录入 (单日总数) ---")
-        order_count = int(input("当日总订单数: "))
-        total_cost = float(input("当日总成本: "))
-        total_profit = float(input("当日总利润: "))
-    else:
-        print("\n--- 1. 精细录入 (逐单) ---")
-        order_count = int(input("当日订单数: "))
-        total_cost = 0.0
-        total_profit = 0.0
-        if order_count > 0:
-            print(f"请逐一输入 {order_count} 笔订单的成本和利润:")
-            for i in range(order_count):
-                print(f"--- 订单 {i+1} ---")
-                cost_str = input(f"  -> 成本: ")
-                profit_str = input(f"  -> 利润: ")
-                total_cost += float(cost_str)
-                total_profit += float(profit_str)
-    
-    # 通用部分
-    refunds = float(input("当日收到的退款金额 (默认为0): ") or 0)
-    
-    # 根据 "策略三" 计算估算的利润损失
-    # 退款金额 * 平均利润率
-    estimated_profit_loss_from_refunds = refunds * finance_calculator.AVERAGE_PROFIT_MARGIN
-
-
-    other_income = float(input("当日其他店铺入账金额 (默认为0): ") or 0) 
-    notes = input("备注 (可留空): ")
-    
-    # 确认
-    print("\n--- 请确认输入 ---")
-    print(f"日期: {date_str}, 总订单数: {order_count}")
-    print(f"总成本: {total_cost:.2f}, 总利润: {total_profit:.2f}")
-    print(f"退款额: {refunds:.2f} (估算利润损失: {estimated_profit_loss_from_refunds:.2f})") # 打印估算利润损失
-    print(f"其他入账: {other_income:.2f}")
-    print(f"备注: {notes}")
-    confirm = input("以上信息是否正确? (y/n, 正确则保存): ")
-    if confirm.lower() == 'y':
-        return date_str, order_count, total_cost, total_profit, refunds, estimated_profit_loss_from_refunds, other_income, notes, True
-    else:
-        print("已取消操作。")
-        return [None]*8 + [False]
-
-def handle_manage_early_payouts():
-    """提前回款管理的子菜单和逻辑分发"""
-    while True:
-        print("\n--- 管理提前回款 ---")
-        print("  a. 新增一条提前回款")
-        print("  b. 删除一条提前回款")
-        print("  c. 查看所有提前回款")
-        print("  d. 返回主菜单")
-        choice = input("请选择操作 (a-d): ").lower()
-        if choice == 'a': handle_add_early_payout()
-        elif choice == 'b': handle_delete_early_payout()
-        elif choice == 'c': handle_view_early_payouts()
-        elif choice == 'd': break
-        else: print("无效输入。")
-
-def handle_add_early_payout():
-    print("\n--- 新增提前回款 ---")
-    try:
-        payout_date = get_date_input("这笔钱是哪天收到的 (格式 YYYY-MM-DD): ")
-        original_date_str = input("这笔钱对应的是哪天订单的回款 (格式 YYYY-MM-DD，不知道请直接回车): ")
-        original_date = original_date_str if original_date_str else None
-        
-        if not original_date:
-            print("注意：未指定来源日期，此笔款项将只作为现金流入，但无法抵扣未来应收款，可能导致未来资金预测偏高。")
-
-        amount = float(input("提前收到的金额是多少: "))
-        
-        confirm_msg = f"确认在 {payout_date} 收到一笔来自 [{original_date or '未知来源'}] 的 {amount:.2f} 元回款吗? (y/n): "
-        if input(confirm_msg).lower() == 'y':
-            data_manager.save_early_payout(payout_date, original_date, amount)
-    except (ValueError, TypeError):
-        print("输入无效，金额必须是数字。")
-
-def handle_view_early_payouts():
-    print("\n--- 所有提前回款记录 ---")
-    df_early = data_manager.load_all_early_payouts()
-    if df_early.empty:
-        print("尚无提前回款记录。")
-    else:
-        df_display = df_early.copy()
-        df_display['Payout_Date'] = df_display['Payout_Date'].dt.strftime('%Y-%m-%d')
-        df_display['Original_Order_Date'] = df_display['Original_Order_Date'].dt.strftime('%Y-%m-%d').fillna('未知来源')
-        print(df_display.to_string(index=False))
 
-def handle_delete_early_payout():
-    handle_view_early_payouts()
-    df_early = data_manager.load_all_early_payouts()
-    if df_early.empty: return
+import profiler
+
+# 退出状态码 (argparse 的参数错误固定为 2)
+EXIT_OK = 0
+EXIT_ERROR = 1
+EXIT_NO_DATA = 3
 
+
+def _date(value):
+    """argparse 的日期类型：只接受 YYYY-MM-DD，原样返回字符串。"""
     try:
-        payout_id = int(input("\n请输入要删除记录的 payout_id: "))
-        if input(f"确认要删除ID为 {payout_id} 的记录吗？(y/n): ").lower() == 'y':
-            data_manager.delete_early_payout_by_id(payout_id)
+        datetime.strptime(value, '%Y-%m-%d')
     except ValueError:
-        print("输入无效，ID必须是数字。")
+        raise argparse.ArgumentTypeError(f"日期格式错误: {value} (应为 YYYY-MM-DD)")
+    return value
 
-def handle_add_data(is_quick_mode):
-    """统一处理两种录入模式的流程。"""
-    try:
-        # --- 获取用户输入 ---
-        date, count, cost, profit, refunds, estimated_profit_loss, other_income, notes, success = get_common_inputs(is_quick_mode)
-        if not success: 
-            return # 如果用户取消，直接返回
-
-        # --- 检查并确认覆盖 ---
-        if data_manager.check_date_exists(date):
-            overwrite = input(f"警告：日期 {date} 的数据已存在，是否要覆盖？ (y/n): ")
-            if overwrite.lower() != 'y':
-                print("操作已取消。")
-                return
-        
-        # --- 保存数据到数据库 ---
-        data_manager.save_daily_data(date, count, cost, profit, refunds, estimated_profit_loss, other_income, notes)
-
-    except (ValueError, TypeError):
-        # 这个 except 只捕获用户输入时的数字格式错误
-        print("\n[错误] 输入无效，订单数/成本/利润/退款等字段必须是数字。请重新操作。")
-    except Exception as e:
-        # 这个 except 捕获所有其他意外错误，特别是数据库错误
-        print(f"\n[严重错误] 程序在执行时遇到问题: {e}")
-        print("这很可能是由于数据库文件结构与当前代码不匹配导致的。")
-        print(">>> 解决方案：请务必退出程序，删除项目文件夹下的 'finance_compass.db' 文件，然后重新运行。")
+
+def _error(message):
+    print(f"错误: {message}", file=sys.stderr)
+    return EXIT_ERROR
+
+
+def _open_store(store):
+    """导入 data_manager 并初始化店铺数据库；店铺不存在时返回 None (避免拼错名称时新建空店铺)。"""
+    import data_manager
+    if store is not None and store not in data_manager.list_stores():
+        return None
+    # 初始化提示写到标准错误，标准输出只留给报告和导出的内容
+    with redirect_stdout(sys.stderr):
+        data_manager.init_db(store)
+    return data_manager
 
 
+def cmd_add(args):
+    """录入一天的数据：--order / --orders-file 逐单录入，或 --orders/--cost/--profit 快速录入。"""
+    if args.order and args.orders_file:
+        return _error("--order 与 --orders-file 不能同时使用。")
+    if (args.order or args.orders_file) and args.orders is not None:
+        return _error("逐单录入 (--order/--orders-file) 与 --orders 不能同时使用。")
+    if not (args.order or args.orders_file) and None in (args.orders, args.cost, args.profit):
+        return _error("快速录入需要同时提供 --orders、--cost 和 --profit (或改用 --order/--orders-file 逐单录入)。")
 
-# --- 其他功能函数 ---
-def handle_delete():
-    print("\n--- 4. 删除一日主数据 ---")
-    date_str = get_date_input("请输入要删除数据的日期 (格式YYYY-MM-DD): ")
-    if data_manager.check_date_exists(date_str):
-        confirm = input(f"确认要删除 {date_str} 的所有主数据吗？此操作不可逆！(y/n): ")
-        if confirm.lower() == 'y':
-            data_manager.delete_data_by_date(date_str)
+    import data_manager
+    try:
+        if args.order or args.orders_file:
+            data_manager.validate_daily_values(refunds=args.refunds, other_income=args.other_income)
+        else:
+            data_manager.validate_daily_values(args.orders, args.cost, args.profit, args.refunds, args.other_income)
+    except ValueError as e:
+        return _error(str(e))
+
+    import importer
+    import pandas as pd
+    orders = None
+    if args.order:
+        validated = importer.validate_orders(pd.DataFrame(args.order, columns=importer.ORDER_GRID_COLUMNS))
+        if validated['invalid_rows']:
+            return _error(f"第 {', '.join(map(str, validated['invalid_rows'][:20]))} 个 --order 的成本或利润无效。")
+        orders = validated['orders']
+    if args.orders_file:
+        try:
+            if args.orders_file == '-':
+                text = sys.stdin.read()
+            else:
+                with open(args.orders_file, encoding='utf-8-sig') as f:
+                    text = f.read()
+        except OSError as e:
+            return _error(f"无法读取订单文件: {e}")
+        validated = importer.validate_orders(importer.parse_order_text(text))
+        if validated['invalid_rows']:
+            return _error(f"订单文件第 {', '.join(map(str, validated['invalid_rows'][:20]))} 行的成本或利润无效。")
+        orders = validated['orders']
+
+    data_manager = _open_store(args.store)
+    if data_manager is None:
+        return _error(f"店铺 {args.store} 不存在。")
+    if not args.overwrite and data_manager.check_date_exists(args.date, store=args.store):
+        return _error(f"日期 {args.date} 的数据已存在，如需覆盖请加 --overwrite。")
+
+    import finance_calculator
+    estimated_profit_loss = args.refunds * finance_calculator.AVERAGE_PROFIT_MARGIN
+    if orders is not None:
+        data_manager.save_orders(args.date, orders, args.refunds, estimated_profit_loss,
+                                 args.other_income, args.notes, store=args.store)
     else:
-        print("该日期不存在，无法删除。")
-
-
-def handle_view_all():
-    print("\n--- 历史财务状况一览表 ---")
-    df_raw = data_manager.load_all_data()
-    if df_raw.empty:
-        print("数据库中尚无主数据。")
-        return
-
-    df_early = data_manager.load_all_early_payouts()
-    df_calculated = finance_calculator.calculate_finances(df_raw, df_early)
-
-    # 显示列调整，加入 Estimated_Profit_Loss_From_Refunds
-    display_cols = ['Date', 'Daily_Order_Count', 'Total_Daily_Cost', 'Total_Daily_Profit', 
-                    'Refunds_Received_Today', 'Estimated_Profit_Loss_From_Refunds', # 显示利润损失
-                    'Other_Income_Today', 'daily_actual_inflow', 'daily_net_cash_flow', 'bank_balance', 'cumulative_profit'] # 显示累计利润
-    
-    df_display = df_calculated[display_cols].copy()
-    df_display['Date'] = df_display['Date'].dt.strftime('%Y-%m-%d')
-    currency_cols = [col for col in display_cols if col not in ['Date', 'Daily_Order_Count']]
-    for col in currency_cols:
-        df_display[col] = df_display[col].apply(lambda x: f"{x:,.2f}")
-    
-    pd.set_option('display.max_rows', None); pd.set_option('display.max_columns', None); pd.set_option('display.width', 1000)
-    print(df_display.to_string(index=False))
-
-
-def display_latest_report():
-    print("\n--- 最新综合报告 (含增长预测) ---")
-    df_history = data_manager.load_all_data()
-    df_early = data_manager.load_all_early_payouts()
-    if df_history.empty and df_early.empty:
-        print("\n数据库为空，无报告可生成。")
-        return
-        
-    df_calculated = finance_calculator.calculate_finances(df_history, df_early)
-    if df_calculated.empty: return
-        
-    latest_data = df_calculated.iloc[-1]
-    
-    print("\n" + "="*20 + " 财务状况 " + "="*20)
-    print(f"数据截止日期: {latest_data['Date'].strftime('%Y-%m-%d')}")
-    print(f"当前银行总余额: {latest_data['bank_balance']:,.2f} 元")
-    print(f"当前累计总利润: {latest_data['cumulative_profit']:,.2f} 元")
-    
-    # --- 集成增长预测 ---
-    print("\n" + "="*20 + " 增长预测 " + "="*20)
-    # 调用预测模块
-    prediction = growth_predictor.analyze_growth(df_calculated, finance_calculator.PAYOUT_DELAY_DAYS)
+        data_manager.save_daily_data(args.date, args.orders, args.cost, args.profit, args.refunds, estimated_profit_loss,
+                                     args.other_income, args.notes, store=args.store)
+    return EXIT_OK
+
 
+def cmd_add_payout(args):
+    """记录一笔提前回款。"""
+    import data_manager
+    try:
+        data_manager.validate_early_payout_amount(args.amount)
+    except ValueError as e:
+        return _error(str(e))
+    data_manager = _open_store(args.store)
+    if data_manager is None:
+        return _error(f"店铺 {args.store} 不存在。")
+    data_manager.save_early_payout(args.date, args.origin, args.amount, store=args.store)
+    return EXIT_OK
+
+
+def cmd_report(args):
+    """输出最新的财务状况和增长预测 (--json 时输出一个 JSON 对象)。"""
+    data_manager = _open_store(args.store)
+    if data_manager is None:
+        return _error(f"店铺 {args.store} 不存在。")
+    df_calculated = data_manager.load_computed_ledger(store=args.store)
+    if df_calculated.empty:
+        print("数据库为空，无报告可生成。", file=sys.stderr)
+        return EXIT_NO_DATA
+
+    import growth_predictor
+    import payout_schedule
+    latest = df_calculated.iloc[-1]
+    kernel = data_manager.get_payout_kernel(args.store)
+    prediction = growth_predictor.analyze_growth(df_calculated, payout_schedule.max_delay(kernel))
+    # 风险模拟和增单计划与交互式菜单的报告相同：使用店铺的回款分布和营业日历，已提前收回的应收款不会再次到账
+    calendar = data_manager.get_business_calendar()
+    df_early = data_manager.load_all_early_payouts(store=args.store)
+    simulation = growth_predictor.simulate_growth(df_calculated, kernel, calendar=calendar, df_early_payouts=df_early)
+    plan = growth_predictor.plan_order_ramp_up(df_calculated, kernel, calendar=calendar, df_early_payouts=df_early)
+
+    if args.json:
+        predicted_date = prediction.get('predicted_date_for_increment')
+        report = {
+            'date': latest['Date'].strftime('%Y-%m-%d'),
+            'bank_balance': float(latest['bank_balance']),
+            'cumulative_profit': float(latest['cumulative_profit']),
+            'daily_order_count': int(latest['Daily_Order_Count']),
+            'daily_net_cash_flow': float(latest['daily_net_cash_flow']),
+            'prediction': {
+                'status': prediction['status'],
+                'message': prediction.get('message'),
+                'avg_daily_net_cash_flow': prediction.get('avg_daily_net_cash_flow'),
+                'target_order_count': prediction.get('target_order_count'),
+                'days_to_next_increment': prediction.get('days_to_next_increment'),
+                'predicted_date_for_increment': predicted_date.strftime('%Y-%m-%d') if predicted_date is not None else None,
+            },
+            'simulation': _simulation_json(simulation),
+            'plan': _plan_json(plan),
+        }
+        print(json.dumps(report, ensure_ascii=False, indent=2, default=lambda value: value.item()))
+        return EXIT_OK
+
+    print(f"数据截止日期: {latest['Date'].strftime('%Y-%m-%d')}")
+    print(f"当前银行总余额: {latest['bank_balance']:,.2f} 元")
+    print(f"当前累计总利润: {latest['cumulative_profit']:,.2f} 元")
     if prediction["status"] == "ok":
         print(f"当前模式稳定后，日均净现金流: {prediction['avg_daily_net_cash_flow']:+.2f} 元")
         print(f"下一个增单目标: {prediction['target_order_count']} 单/天")
-        print(f"预计还需积累天数: {prediction['days_to_next_increment']:.1f} 天")
         print(f"预计可在【{prediction['predicted_date_for_increment'].strftime('%Y-%m-%d')}】安全增单")
     else:
-        # 打印 "calculating" 或 "warning" 状态信息
         print(prediction["message"])
-        
-    print("\n" + "="*20 + " 截止日详情 " + "="*19)
-    print(f"订单: {latest_data['Daily_Order_Count']} 单, 总成本: {latest_data['Total_Daily_Cost']:.2f}, 总利润: {latest_data['Total_Daily_Profit']:.2f}")
-    print(f"退款: {latest_data['Refunds_Received_Today']:.2f} (利润损失估算: {latest_data['Estimated_Profit_Loss_From_Refunds']:.2f})")
-    print(f"其他入账: {latest_data['Other_Income_Today']:.2f}")
-    print(f"当日净现金流: {latest_data['daily_net_cash_flow']:+.2f}")
-    print("="*58)
-
-
-def main():
-    """主函数 (已恢复清晰的选项分发)"""
-    data_manager.init_db()
-    
-    while True:
-        choice = display_main_menu()
-        if choice == '1': handle_add_data(is_quick_mode=False) # <--- 明确调用精细模式
-        elif choice == '2': handle_add_data(is_quick_mode=True)  # <--- 明确调用快速模式
-        elif choice == '3': handle_manage_early_payouts()
-        elif choice == '4': display_latest_report()
-        elif choice == '5': handle_generate_charts()
-        elif choice == '6': handle_delete()
-        elif choice == '7': handle_view_all()
-        elif choice == '8':
-            print("感谢使用，程序退出。")
-            break
-        else:
-            print("无效输入。")
+    if simulation["status"] == "ok":
+        print("\n" + "\n".join(growth_predictor.simulation_report_lines(simulation)))
+    print("\n" + "\n".join(growth_predictor.plan_report_lines(plan)))
+    return EXIT_OK
+
+
+def _simulation_json(simulation):
+    """风险模拟结果中可以写进 JSON 报告的部分 (不含逐日余额分位数)。"""
+    report = {'status': simulation['status'], 'message': simulation.get('message')}
+    if simulation['status'] == 'ok':
+        report.update({key: simulation[key] for key in ('n_paths', 'horizon_days', 'overdraft_probability', 'reach_probability')})
+        report['safe_increment_dates'] = {f"P{p}": safe_date.strftime('%Y-%m-%d') if safe_date is not None else None
+                                          for p, safe_date in simulation['safe_increment_dates'].items()}
+    return report
+
+
+def _plan_json(plan):
+    """增单计划中可以写进 JSON 报告的部分 (不含逐日预测)。"""
+    report = {'status': plan['status'], 'message': plan.get('message')}
+    if plan['status'] == 'ok':
+        report.update({key: plan[key] for key in ('start_order_count', 'final_order_count', 'min_projected_balance',
+                                                  'per_order_cost', 'per_order_profit')})
+        report['schedule'] = [{'date': row['Date'].strftime('%Y-%m-%d'), 'daily_order_count': row['Daily_Order_Count']}
+                              for _, row in plan['schedule'].iterrows()]
+    return report
+
+
+def cmd_rollup(args):
+    """按周/月/季度输出账本汇总 (读取增量维护的周期汇总表)。"""
+    data_manager = _open_store(args.store)
+    if data_manager is None:
+        return _error(f"店铺 {args.store} 不存在。")
+    df_rollups = data_manager.load_period_rollups(args.period, start_date=args.start, end_date=args.end, store=args.store)
+    if df_rollups.empty:
+        print("所选范围内没有账本数据。", file=sys.stderr)
+        return EXIT_NO_DATA
+
+    for col in ('period_start', 'last_date'):
+        df_rollups[col] = df_rollups[col].dt.strftime('%Y-%m-%d')
+    if args.format == 'json':
+        df_rollups.to_json(sys.stdout, orient='records', force_ascii=False, indent=2)
+        print()
+    elif args.format == 'csv':
+        df_rollups.to_csv(sys.stdout, index=False)
+    else:
+        print(df_rollups.rename(columns=data_manager.ROLLUP_COLUMN_LABELS)
+              .to_string(index=False, float_format=lambda x: f"{x:,.2f}"))
+    return EXIT_OK
+
+
+def cmd_charts(args):
+    """渲染并保存财务趋势图 (无界面的 Agg 后端)。"""
+    import matplotlib
+    matplotlib.use('Agg')
+    data_manager = _open_store(args.store)
+    if data_manager is None:
+        return _error(f"店铺 {args.store} 不存在。")
+    df_calculated = data_manager.load_computed_ledger(store=args.store)
+    if len(df_calculated) < 2:
+        print("数据不足两天，无法生成趋势图。", file=sys.stderr)
+        return EXIT_NO_DATA
+
+    import reporter
+    for path in reporter.save_financial_trends(df_calculated, args.output_dir):
+        print(f"图表已保存到: {path}")
+    return EXIT_OK
+
+
+def cmd_export(args):
+    """导出账本 (含计算列) 为 CSV 或 JSON；不指定 --output 时写到标准输出。"""
+    data_manager = _open_store(args.store)
+    if data_manager is None:
+        return _error(f"店铺 {args.store} 不存在。")
+    if args.exact and args.as_of:
+        return _error("--exact 与 --as-of 不能同时使用。")
+    if args.as_of:
+        df_calculated = data_manager.compute_ledger_as_of(args.as_of, store=args.store)
+        if not df_calculated.empty:
+            in_range = df_calculated['Date'].between(args.start or '0001-01-01', args.end or '9999-12-31')
+            df_calculated = df_calculated[in_range]
+    elif args.exact:
+        import finance_calculator
+        df_calculated = finance_calculator.ledger_to_yuan(data_manager.compute_exact_ledger(store=args.store))
+        if not df_calculated.empty:
+            in_range = df_calculated['Date'].between(args.start or '0001-01-01', args.end or '9999-12-31')
+            df_calculated = df_calculated[in_range]
+    else:
+        df_calculated = data_manager.load_computed_ledger(start_date=args.start, end_date=args.end, store=args.store)
+    if df_calculated.empty:
+        print("所选范围内没有账本数据。", file=sys.stderr)
+        return EXIT_NO_DATA
+
+    output = args.output or sys.stdout
+    df_calculated['Date'] = df_calculated['Date'].dt.strftime('%Y-%m-%d')
+    if args.format == 'json':
+        df_calculated.to_json(output, orient='records', force_ascii=False, indent=2)
+    else:
+        df_calculated.to_csv(output, index=False)
+    if args.output:
+        print(f"已导出 {len(df_calculated)} 行到: {args.output}")
+    return EXIT_OK
+
+
+def cmd_snapshot_export(args):
+    """把主数据、提前回款和账本导出为列式快照 (Parquet 或内存映射的 NumPy 文件)。"""
+    data_manager = _open_store(args.store)
+    if data_manager is None:
+        return _error(f"店铺 {args.store} 不存在。")
+    import columnar_snapshot
+    try:
+        path = columnar_snapshot.export_snapshot(store=args.store, fmt=args.format, directory=args.output)
+    except (ImportError, RuntimeError, OSError) as e:
+        return _error(str(e))
+    manifest = columnar_snapshot.read_manifest(path)
+    rows = ', '.join(f"{table} {entry['rows']} 行" for table, entry in manifest['tables'].items())
+    print(f"已导出 {manifest['format']} 快照到: {path} ({rows})")
+    return EXIT_OK
+
+
+def cmd_snapshot_import(args):
+    """把快照中的主数据和提前回款导入一个还没有数据的店铺。"""
+    data_manager = _open_store(args.store)
+    if data_manager is None:
+        return _error(f"店铺 {args.store} 不存在。")
+    import columnar_snapshot
+    try:
+        columnar_snapshot.import_snapshot(args.path, store=args.store)
+    except (ImportError, ValueError, OSError) as e:
+        return _error(str(e))
+    return EXIT_OK
+
+
+def cmd_history(args):
+    """列出最近的写入操作 (新的在前)。"""
+    data_manager = _open_store(args.store)
+    if data_manager is None:
+        return _error(f"店铺 {args.store} 不存在。")
+    df_operations = data_manager.list_operations(limit=args.limit, store=args.store)
+    if df_operations.empty:
+        print("还没有任何修改记录。", file=sys.stderr)
+        return EXIT_NO_DATA
+    for op in df_operations.itertuples():
+        status = " (已撤销)" if op.undone else ""
+        print(f"#{op.op_id}\t{op.recorded_at}\t{op.description}\t{op.changed_rows} 行{status}")
+    return EXIT_OK
+
+
+def cmd_undo(args):
+    """撤销最近一次写入操作；没有可撤销的操作时退出码为 3。"""
+    data_manager = _open_store(args.store)
+    if data_manager is None:
+        return _error(f"店铺 {args.store} 不存在。")
+    if data_manager.undo_last_operation(store=args.store) is None:
+        return EXIT_NO_DATA
+    return EXIT_OK
+
+
+def cmd_serve(args):
+    """启动本地 JSON HTTP 接口 (阻塞直到 Ctrl+C)。"""
+    import api_server
+    api_server.serve(args.host, args.port)
+    return EXIT_OK
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="E-commerce 财务罗盘 (命令行版)。不带子命令时进入交互式菜单。")
+    parser.add_argument('--profile', action='store_true', help='输出各阶段的耗时、行数和缓存命中统计')
+
+    # 所有子命令共用的店铺参数
+    store_parent = argparse.ArgumentParser(add_help=False)
+    store_parent.add_argument('--store', help='店铺名称 (默认: 默认店铺)')
+
+    subparsers = parser.add_subparsers(dest='command', metavar='命令')
+
+    add = subparsers.add_parser('add', parents=[store_parent], help='录入一天的数据')
+    add.add_argument('date', type=_date, help='日期 (YYYY-MM-DD)')
+    add.add_argument('--orders', type=int, help='当日总订单数 (快速录入)')
+    add.add_argument('--cost', type=float, help='当日总成本 (快速录入)')
+    add.add_argument('--profit', type=float, help='当日总利润 (快速录入)')
+    add.add_argument('--order', nargs=2, type=float, action='append', metavar=('COST', 'PROFIT'),
+                     help='一笔订单的成本和利润，可重复 (逐单录入)')
+    add.add_argument('--orders-file', help='逐单明细文件，每行 "成本,利润" (可带表头)；- 表示从标准输入读取')
+    add.add_argument('--refunds', type=float, default=0.0, help='当日收到的退款金额')
+    add.add_argument('--other-income', type=float, default=0.0, help='当日其他入账金额')
+    add.add_argument('--notes', default='', help='备注')
+    add.add_argument('--overwrite', action='store_true', help='日期已存在时覆盖')
+    add.set_defaults(func=cmd_add)
+
+    add_payout = subparsers.add_parser('add-payout', parents=[store_parent], help='记录一笔提前回款')
+    add_payout.add_argument('date', type=_date, help='收款日期 (YYYY-MM-DD)')
+    add_payout.add_argument('amount', type=float, help='金额')
+    add_payout.add_argument('--origin', type=_date, help='对应订单的日期 (不指定时为来源未知)')
+    add_payout.set_defaults(func=cmd_add_payout)
+
+    report = subparsers.add_parser('report', parents=[store_parent], help='输出最新财务状况和增长预测')
+    report.add_argument('--json', action='store_true', help='以 JSON 输出')
+    report.set_defaults(func=cmd_report)
+
+    charts = subparsers.add_parser('charts', parents=[store_parent], help='生成并保存财务趋势图')
+    charts.add_argument('--output-dir', default='charts', help='图表保存目录 (默认: charts)')
+    charts.set_defaults(func=cmd_charts)
+
+    export = subparsers.add_parser('export', parents=[store_parent], help='导出账本')
+    export.add_argument('--output', help='输出文件 (默认: 标准输出)')
+    export.add_argument('--format', choices=['csv', 'json'], default='csv', help='输出格式 (默认: csv)')
+    export.add_argument('--start', type=_date, help='起始日期 (含)')
+    export.add_argument('--end', type=_date, help='结束日期 (含)')
+    export.add_argument('--exact', action='store_true', help='以整数分模式重新计算账本，金额精确到分')
+    export.add_argument('--as-of', help='按某一时刻 (YYYY-MM-DD 表示当天结束时，或 "YYYY-MM-DD HH:MM") 的数据重算账本')
+    export.set_defaults(func=cmd_export)
+
+    snapshot_export = subparsers.add_parser('snapshot-export', parents=[store_parent],
+                                            help='导出列式快照 (主数据、提前回款和账本)')
+    snapshot_export.add_argument('--format', choices=['parquet', 'npy'],
+                                 help='快照格式 (默认: 安装了 pyarrow 时为 parquet，否则为 npy)')
+    snapshot_export.add_argument('--output', help='快照目录 (默认: snapshots/<店铺>/<时间>，只保留最近几份)')
+    snapshot_export.set_defaults(func=cmd_snapshot_export)
+
+    snapshot_import = subparsers.add_parser('snapshot-import', parents=[store_parent],
+                                            help='把列式快照导入一个还没有数据的店铺')
+    snapshot_import.add_argument('path', help='快照目录')
+    snapshot_import.set_defaults(func=cmd_snapshot_import)
+
+    rollup = subparsers.add_parser('rollup', parents=[store_parent], help='按周/月/季度汇总账本')
+    rollup.add_argument('--period', choices=['week', 'month', 'quarter'], default='month', help='汇总周期 (默认: month)')
+    rollup.add_argument('--format', choices=['table', 'csv', 'json'], default='table', help='输出格式 (默认: table)')
+    rollup.add_argument('--start', type=_date, help='只输出包含此日期及之后的周期')
+    rollup.add_argument('--end', type=_date, help='只输出包含此日期及之前的周期')
+    rollup.set_defaults(func=cmd_rollup)
+
+    history = subparsers.add_parser('history', parents=[store_parent], help='查看最近的修改记录')
+    history.add_argument('--limit', type=int, default=20, help='显示的条数 (默认: 20)')
+    history.set_defaults(func=cmd_history)
+
+    undo = subparsers.add_parser('undo', parents=[store_parent], help='撤销最近一次修改')
+    undo.set_defaults(func=cmd_undo)
+
+    serve = subparsers.add_parser('serve', help='启动本地 JSON HTTP 接口')
+    serve.add_argument('--host', default='127.0.0.1', help='监听地址 (默认: 127.0.0.1)')
+    serve.add_argument('--port', type=int, default=8765, help='监听端口 (默认: 8765)')
+    serve.set_defaults(func=cmd_serve)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if args.command is None:
+        import menu
+        menu.main(profile=args.profile)
+        return EXIT_OK
+
+    if args.profile:
+        profiler.enable()
+    try:
+        return args.func(args)
+    except BrokenPipeError:
+        # 输出被管道截断 (如 export | head)：静默退出。把标准输出重定向到 devnull，
+        # 避免解释器退出时刷新缓冲区再次报错 (见 Python 文档 signal 一节的说明)
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+        return EXIT_OK
+    except Exception as e:
+        return _error(str(e))
+    finally:
+        if args.profile:
+            print(profiler.format_report(), file=sys.stderr)
 
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
@@ -0,0 +1,489 @@
+# menu.py
+# 交互式菜单 (不带子命令运行 main.py 时进入)
+
+import data_manager
+import finance_calculator
+import growth_predictor
+import reporter
+import importer
+import payout_schedule
+import profiler
+from datetime import datetime
+import pandas as pd
+import os
+
+# 当前操作的店铺，所有录入和报告都针对这个店铺
+current_store = data_manager.DEFAULT_STORE
+
+def display_main_menu():
+    """显示主菜单 (已恢复清晰的录入选项)"""
+    print("\n" + "="*20 + " E-commerce 财务罗盘 " + "="*20)
+    print(f"当前店铺: {current_store}")
+    print("核心操作:")
+    print("  1. 精细录入 (逐单输入)") # <--- 恢复
+    print("  2. 快速录入 (单日总数)") # <--- 恢复
+    print("  3. 管理提前回款记录")
+    print("---")
+    print("分析与报告:")
+    print("  4. 生成最新综合报告 (含增长预测)")
+    print("  5. 生成并保存财务图表")
+    print("---")
+    print("数据管理:")
+    print("  6. 删除一日主数据")
+    print("  7. 查看所有历史数据")
+    print("  13. 按周/月/季度汇总查看")
+    print("  8. 批量导入订单文件 (CSV/Excel)")
+    print("  12. 操作历史 / 撤销上一次修改")
+    print("---")
+    print("多店铺:")
+    print("  10. 切换/新建店铺")
+    print("  11. 全公司汇总报告")
+    print("---")
+    print("  9. 退出程序")
+    print("="*58)
+    return input("请输入选项 (1-13): ")
+
+def handle_generate_charts():
+    """处理生成并保存图表的流程。"""
+    print("\n--- 5. 生成并保存财务图表 ---")
+    df_calculated = data_manager.load_computed_ledger(store=current_store)
+    if df_calculated.empty:
+        print("\n数据库为空，无法生成图表。")
+        return
+    
+    # 调用 reporter 模块的函数来生成并保存图表
+    paths = reporter.save_financial_trends(df_calculated)
+    if not paths:
+        print("\n数据不足两天，无法生成趋势图。")
+        return
+    for path in paths:
+        print(f"图表已保存到: {path}")
+
+
+def get_date_input(prompt):
+    """一个通用的、带验证的日期输入函数。"""
+    while True:
+        date_str = input(prompt)
+        try:
+            datetime.strptime(date_str, '%Y-%m-%d')
+            return date_str
+        except ValueError:
+            print("日期格式错误，请输入YYYY-MM-DD 格式。")
+
+
+# --- 功能 1 & 2: 精细录入 & 快速录入 ---
+def get_order_lines():
+    """
+    读取精细录入的逐单明细：直接粘贴多行 (每行 "成本 利润"，可从表格复制)，输入空行结束；
+    或输入 @文件路径 读取 CSV 文件。所有行一次性校验和汇总，有无效行时要求重新输入。
+    :return: (订单数组, 订单数, 总成本, 总利润)
+    """
+    while True:
+        print("请粘贴或输入逐单明细，每行一笔: 成本 利润 (空格/逗号/Tab 分隔)，输入空行结束；")
+        first_line = input("或输入 @文件路径 从 CSV 文件读取: ").strip()
+        if first_line.startswith('@'):
+            try:
+                with open(first_line[1:].strip().strip('"'), encoding='utf-8-sig') as f:
+                    text = f.read()
+            except OSError as e:
+                print(f"无法读取文件: {e}")
+                continue
+        else:
+            lines = [first_line]
+            while lines[-1]:
+                lines.append(input().strip())
+            text = "\n".join(lines)
+
+        validated = importer.validate_orders(importer.parse_order_text(text))
+        if validated['invalid_rows']:
+            print(f"第 {', '.join(map(str, validated['invalid_rows']))} 行的成本或利润无效 (成本不能为负)，请重新输入。")
+            continue
+        print(f"已读取 {validated['count']} 笔订单。")
+        return validated['orders'], validated['count'], validated['total_cost'], validated['total_profit']
+
+def get_common_inputs(is_quick_mode):
+    """
+    获取两种录入模式的通用输入部分。
+    增加对退款金额和对应利润损失的估算。
+    """
+    date_str = get_date_input("请输入日期 (格式YYYY-MM-DD): ")
+
+    orders = None # 快速录入没有逐单明细
+    if is_quick_mode:
+        print("\n--- 2. 快速录入 (单日总数) ---")
+        order_count = int(input("当日总订单数: "))
+        total_cost = float(input("当日总成本: "))
+        total_profit = float(input("当日总利润: "))
+    else:
+        print("\n--- 1. 精细录入 (逐单) ---")
+        orders, order_count, total_cost, total_profit = get_order_lines()
+    
+    # 通用部分
+    refunds = float(input("当日收到的退款金额 (默认为0): ") or 0)
+    
+    # 根据 "策略三" 计算估算的利润损失
+    # 退款金额 * 平均利润率
+    estimated_profit_loss_from_refunds = refunds * finance_calculator.AVERAGE_PROFIT_MARGIN
+
+
+    other_income = float(input("当日其他店铺入账金额 (默认为0): ") or 0) 
+    notes = input("备注 (可留空): ")
+    
+    # 确认
+    print("\n--- 请确认输入 ---")
+    print(f"日期: {date_str}, 总订单数: {order_count}")
+    print(f"总成本: {total_cost:.2f}, 总利润: {total_profit:.2f}")
+    print(f"退款额: {refunds:.2f} (估算利润损失: {estimated_profit_loss_from_refunds:.2f})") # 打印估算利润损失
+    print(f"其他入账: {other_income:.2f}")
+    print(f"备注: {notes}")
+    confirm = input("以上信息是否正确? (y/n, 正确则保存): ")
+    if confirm.lower() == 'y':
+        return date_str, order_count, total_cost, total_profit, refunds, estimated_profit_loss_from_refunds, other_income, notes, orders, True
+    else:
+        print("已取消操作。")
+        return [None]*9 + [False]
+
+def handle_manage_early_payouts():
+    """提前回款管理的子菜单和逻辑分发"""
+    while True:
+        print("\n--- 管理提前回款 ---")
+        print("  a. 新增一条提前回款")
+        print("  b. 删除一条提前回款")
+        print("  c. 查看所有提前回款")
+        print("  d. 返回主菜单")
+        choice = input("请选择操作 (a-d): ").lower()
+        if choice == 'a': handle_add_early_payout()
+        elif choice == 'b': handle_delete_early_payout()
+        elif choice == 'c': handle_view_early_payouts()
+        elif choice == 'd': break
+        else: print("无效输入。")
+
+def handle_add_early_payout():
+    print("\n--- 新增提前回款 ---")
+    try:
+        payout_date = get_date_input("这笔钱是哪天收到的 (格式 YYYY-MM-DD): ")
+        original_date_str = input("这笔钱对应的是哪天订单的回款 (格式 YYYY-MM-DD，不知道请直接回车): ")
+        original_date = original_date_str if original_date_str else None
+        
+        if not original_date:
+            print("注意：未指定来源日期，此笔款项将只作为现金流入，但无法抵扣未来应收款，可能导致未来资金预测偏高。")
+
+        amount = float(input("提前收到的金额是多少: "))
+        
+        confirm_msg = f"确认在 {payout_date} 收到一笔来自 [{original_date or '未知来源'}] 的 {amount:.2f} 元回款吗? (y/n): "
+        if input(confirm_msg).lower() == 'y':
+            data_manager.save_early_payout(payout_date, original_date, amount, store=current_store)
+    except (ValueError, TypeError):
+        print("输入无效，金额必须是数字。")
+
+def handle_view_early_payouts():
+    print("\n--- 所有提前回款记录 ---")
+    df_early = data_manager.load_all_early_payouts(store=current_store)
+    if df_early.empty:
+        print("尚无提前回款记录。")
+    else:
+        df_display = df_early.copy()
+        df_display['Payout_Date'] = df_display['Payout_Date'].dt.strftime('%Y-%m-%d')
+        df_display['Original_Order_Date'] = df_display['Original_Order_Date'].dt.strftime('%Y-%m-%d').fillna('未知来源')
+        print(df_display.to_string(index=False))
+
+def handle_delete_early_payout():
+    handle_view_early_payouts()
+    df_early = data_manager.load_all_early_payouts(store=current_store)
+    if df_early.empty: return
+
+    try:
+        payout_id = int(input("\n请输入要删除记录的 payout_id: "))
+        if input(f"确认要删除ID为 {payout_id} 的记录吗？(y/n): ").lower() == 'y':
+            data_manager.delete_early_payout_by_id(payout_id, store=current_store)
+    except ValueError:
+        print("输入无效，ID必须是数字。")
+
+def handle_add_data(is_quick_mode):
+    """统一处理两种录入模式的流程。"""
+    try:
+        # --- 获取用户输入 ---
+        date, count, cost, profit, refunds, estimated_profit_loss, other_income, notes, orders, success = get_common_inputs(is_quick_mode)
+        if not success: 
+            return # 如果用户取消，直接返回
+
+        # --- 检查并确认覆盖 ---
+        if data_manager.check_date_exists(date, store=current_store):
+            overwrite = input(f"警告：日期 {date} 的数据已存在，是否要覆盖？ (y/n): ")
+            if overwrite.lower() != 'y':
+                print("操作已取消。")
+                return
+        
+        # --- 保存数据到数据库 ---
+        if orders is not None:
+            # 精细录入：保存逐单明细，当日汇总由数据库触发器维护
+            data_manager.save_orders(date, orders, refunds, estimated_profit_loss, other_income, notes, store=current_store)
+        else:
+            data_manager.save_daily_data(date, count, cost, profit, refunds, estimated_profit_loss, other_income, notes, store=current_store)
+
+    except (ValueError, TypeError):
+        # 这个 except 只捕获用户输入时的数字格式错误
+        print("\n[错误] 输入无效，订单数/成本/利润/退款等字段必须是数字。请重新操作。")
+    except Exception as e:
+        # 这个 except 捕获所有其他意外错误，特别是数据库错误
+        print(f"\n[严重错误] 程序在执行时遇到问题: {e}")
+        print("这很可能是由于数据库文件结构与当前代码不匹配导致的。")
+        print(">>> 解决方案：请务必退出程序，删除项目文件夹下的 'finance_compass.db' 文件，然后重新运行。")
+
+
+
+# --- 其他功能函数 ---
+def handle_delete():
+    print("\n--- 4. 删除一日主数据 ---")
+    date_str = get_date_input("请输入要删除数据的日期 (格式YYYY-MM-DD): ")
+    if data_manager.check_date_exists(date_str, store=current_store):
+        confirm = input(f"确认要删除 {date_str} 的所有主数据吗？(误删可在“操作历史”中撤销) (y/n): ")
+        if confirm.lower() == 'y':
+            data_manager.delete_data_by_date(date_str, store=current_store)
+    else:
+        print("该日期不存在，无法删除。")
+
+def handle_undo():
+    print("\n--- 操作历史 ---")
+    df_operations = data_manager.list_operations(limit=10, store=current_store)
+    if df_operations.empty:
+        print("还没有任何修改记录。")
+        return
+    for op in df_operations.itertuples():
+        status = " (已撤销)" if op.undone else ""
+        print(f"  #{op.op_id} {op.recorded_at}  {op.description}  [{op.changed_rows} 行]{status}")
+    last = data_manager.get_last_undoable_operation(store=current_store)
+    if last is None:
+        print("没有可以撤销的操作。")
+        return
+    if input(f"撤销最近一次修改“{last}”吗？(y/n): ").lower() == 'y':
+        data_manager.undo_last_operation(store=current_store)
+
+
+def handle_bulk_import():
+    print("\n--- 8. 批量导入订单文件 ---")
+    path = input("请输入订单导出文件路径 (CSV/Excel): ").strip().strip('"')
+    if not os.path.exists(path):
+        print("文件不存在。")
+        return
+
+    try:
+        columns = importer.read_header(path)
+        column_map = importer.detect_columns(columns)
+        print(f"文件列: {', '.join(map(str, columns))}")
+        labels = {'date': '订单日期', 'cost': '成本', 'profit': '利润', 'refund': '退款金额 (可选)'}
+        for field, label in labels.items():
+            detected = column_map.get(field)
+            answer = input(f"{label} 对应的列 [{detected or '未识别'}] (回车确认): ").strip()
+            if answer:
+                column_map[field] = answer
+
+        if input("同一日期已存在的数据将被覆盖订单数/成本/利润/退款，确认导入? (y/n): ").lower() != 'y':
+            print("已取消操作。")
+            return
+        result = importer.import_orders(path, column_map, store=current_store)
+    except (ValueError, KeyError, ImportError) as e:
+        print(f"导入失败: {e}")
+        return
+
+    if result['days'] == 0:
+        print("文件中没有可导入的订单。")
+        return
+    print(f"导入完成：{result['start_date'].strftime('%Y-%m-%d')} 至 {result['end_date'].strftime('%Y-%m-%d')}，"
+          f"共 {result['days']} 天、{result['orders']} 笔订单。")
+    if result['skipped_rows']:
+        print(f"有 {result['skipped_rows']} 行因日期无法识别而被跳过。")
+
+
+def handle_view_all():
+    print("\n--- 历史财务状况一览表 ---")
+    df_calculated = data_manager.load_computed_ledger(store=current_store)
+    if df_calculated.empty:
+        print("数据库中尚无主数据。")
+        return
+
+    # 显示列调整，加入 Estimated_Profit_Loss_From_Refunds
+    display_cols = ['Date', 'Daily_Order_Count', 'Total_Daily_Cost', 'Total_Daily_Profit', 
+                    'Refunds_Received_Today', 'Estimated_Profit_Loss_From_Refunds', # 显示利润损失
+                    'Other_Income_Today', 'daily_actual_inflow', 'daily_net_cash_flow', 'bank_balance', 'cumulative_profit'] # 显示累计利润
+    
+    df_display = df_calculated[display_cols].copy()
+    df_display['Date'] = df_display['Date'].dt.strftime('%Y-%m-%d')
+    currency_cols = [col for col in display_cols if col not in ['Date', 'Daily_Order_Count']]
+    for col in currency_cols:
+        df_display[col] = df_display[col].apply(lambda x: f"{x:,.2f}")
+    
+    pd.set_option('display.max_rows', None); pd.set_option('display.max_columns', None); pd.set_option('display.width', 1000)
+    print(df_display.to_string(index=False))
+
+
+def handle_view_rollups():
+    """按周/月/季度查看账本汇总 (直接读取增量维护的周期汇总表，不逐日相加)。"""
+    choice = input("汇总周期 (w: 周, m: 月, q: 季度) [m]: ").strip().lower() or 'm'
+    period = {'w': 'week', 'm': 'month', 'q': 'quarter'}.get(choice)
+    if period is None:
+        print("无效输入。")
+        return
+    df_rollups = data_manager.load_period_rollups(period, store=current_store)
+    if df_rollups.empty:
+        print("数据库中尚无主数据。")
+        return
+
+    print(f"\n--- 按{data_manager.ROLLUP_PERIOD_LABELS[period]}汇总 ---")
+    df_display = df_rollups.copy()
+    for col in ('period_start', 'last_date'):
+        df_display[col] = df_display[col].dt.strftime('%Y-%m-%d')
+    df_display['Daily_Order_Count'] = df_display['Daily_Order_Count'].map(lambda x: f"{x:,.0f}")
+    for col in data_manager.ROLLUP_SUM_COLS[1:] + data_manager.ROLLUP_END_COLS:
+        df_display[col] = df_display[col].map(lambda x: f"{x:,.2f}")
+    pd.set_option('display.max_rows', None); pd.set_option('display.max_columns', None); pd.set_option('display.width', 1000)
+    print(df_display.rename(columns=data_manager.ROLLUP_COLUMN_LABELS).to_string(index=False))
+
+
+def display_latest_report():
+    print("\n--- 最新综合报告 (含增长预测) ---")
+    # 最新一天的账本记录是一次索引查询，不需要重算
+    latest_data = data_manager.load_latest_ledger_entry(store=current_store)
+    if latest_data is None:
+        print("\n数据库为空，无报告可生成。")
+        return
+    
+    print("\n" + "="*20 + " 财务状况 " + "="*20)
+    print(f"数据截止日期: {latest_data['Date'].strftime('%Y-%m-%d')}")
+    print(f"当前银行总余额: {latest_data['bank_balance']:,.2f} 元")
+    print(f"当前累计总利润: {latest_data['cumulative_profit']:,.2f} 元")
+    
+    # --- 集成增长预测 ---
+    print("\n" + "="*20 + " 增长预测 " + "="*20)
+    # 调用预测模块
+    df_calculated = data_manager.load_computed_ledger(store=current_store)
+    kernel = data_manager.get_payout_kernel(current_store)
+    prediction = growth_predictor.analyze_growth(df_calculated, payout_schedule.max_delay(kernel))
+
+    if prediction["status"] == "ok":
+        print(f"当前模式稳定后，日均净现金流: {prediction['avg_daily_net_cash_flow']:+.2f} 元")
+        print(f"下一个增单目标: {prediction['target_order_count']} 单/天")
+        print(f"预计还需积累天数: {prediction['days_to_next_increment']:.1f} 天")
+        print(f"预计可在【{prediction['predicted_date_for_increment'].strftime('%Y-%m-%d')}】安全增单")
+    else:
+        # 打印 "calculating" 或 "warning" 状态信息
+        print(prediction["message"])
+
+    calendar = data_manager.get_business_calendar()
+    df_early = data_manager.load_all_early_payouts(store=current_store)
+    simulation = growth_predictor.simulate_growth(df_calculated, kernel, calendar=calendar,
+                                                  df_early_payouts=df_early)
+    if simulation["status"] == "ok":
+        print("\n" + "\n".join(growth_predictor.simulation_report_lines(simulation)))
+
+    plan = growth_predictor.plan_order_ramp_up(df_calculated, kernel, calendar=calendar,
+                                               df_early_payouts=df_early)
+    print("\n" + "\n".join(growth_predictor.plan_report_lines(plan)))
+        
+    print("\n" + "="*20 + " 截止日详情 " + "="*19)
+    print(f"订单: {latest_data['Daily_Order_Count']} 单, 总成本: {latest_data['Total_Daily_Cost']:.2f}, 总利润: {latest_data['Total_Daily_Profit']:.2f}")
+    print(f"退款: {latest_data['Refunds_Received_Today']:.2f} (利润损失估算: {latest_data['Estimated_Profit_Loss_From_Refunds']:.2f})")
+    print(f"其他入账: {latest_data['Other_Income_Today']:.2f}")
+    print(f"当日净现金流: {latest_data['daily_net_cash_flow']:+.2f}")
+    print("="*58)
+
+
+def handle_manage_stores():
+    """店铺管理：切换当前店铺、新建店铺、修改期初资金。"""
+    global current_store
+    print("\n--- 10. 切换/新建店铺 ---")
+    stores = data_manager.list_stores()
+    for i, store in enumerate(stores, start=1):
+        marker = " (当前)" if store == current_store else ""
+        print(f"  {i}. {store}{marker}")
+    print("  n. 新建店铺")
+    print("  c. 修改当前店铺的期初资金")
+    choice = input("请选择店铺编号或操作: ").strip().lower()
+
+    try:
+        if choice == 'n':
+            name = input("新店铺名称: ").strip()
+            initial_cash = float(input(f"期初资金 (默认为{finance_calculator.INITIAL_CASH:.0f}): ") or finance_calculator.INITIAL_CASH)
+            data_manager.create_store(name, initial_cash)
+            current_store = name
+        elif choice == 'c':
+            print(f"当前期初资金: {data_manager.get_store_initial_cash(current_store):,.2f} 元")
+            initial_cash = float(input("新的期初资金: "))
+            data_manager.set_store_initial_cash(initial_cash, current_store)
+        elif choice.isdigit() and 1 <= int(choice) <= len(stores):
+            current_store = stores[int(choice) - 1]
+            data_manager.init_db(current_store)
+            print(f"已切换到店铺: {current_store}")
+        else:
+            print("无效输入。")
+    except ValueError as e:
+        print(f"操作失败: {e}")
+
+
+def display_company_report():
+    """全公司汇总：各店铺账本在进程池中并行刷新，汇总账本由各店铺结果相加得到。"""
+    print("\n--- 11. 全公司汇总报告 ---")
+    stores = data_manager.list_stores()
+    data_manager.refresh_store_ledgers(stores)
+    df_total = data_manager.load_consolidated_ledger(stores=stores)
+    if df_total.empty:
+        print("\n所有店铺都还没有数据。")
+        return
+
+    ledgers = {store: data_manager.load_computed_ledger(store=store) for store in stores}
+    predictions = growth_predictor.analyze_growth_by_store(
+        ledgers, {store: payout_schedule.max_delay(data_manager.get_payout_kernel(store)) for store in stores})
+    print("\n" + "="*20 + " 各店铺 " + "="*20)
+    for store in stores:
+        df_store, prediction = ledgers[store], predictions[store]
+        if df_store.empty:
+            print(f"{store}: 尚无数据")
+            continue
+        latest = df_store.iloc[-1]
+        next_date = (prediction['predicted_date_for_increment'].strftime('%Y-%m-%d')
+                     if prediction['status'] == 'ok' else '暂无预测')
+        print(f"{store}: 截止 {latest['Date'].strftime('%Y-%m-%d')}, 余额 {latest['bank_balance']:,.2f} 元, "
+              f"累计利润 {latest['cumulative_profit']:,.2f} 元, 下一个增单日期 {next_date}")
+
+    latest_total = df_total.iloc[-1]
+    print("\n" + "="*20 + " 公司合计 " + "="*20)
+    print(f"数据截止日期: {latest_total['Date'].strftime('%Y-%m-%d')}")
+    print(f"银行总余额: {latest_total['bank_balance']:,.2f} 元")
+    print(f"累计总利润: {latest_total['cumulative_profit']:,.2f} 元")
+    print("="*58)
+
+
+def main(profile=False):
+    """
+    主函数 (已恢复清晰的选项分发)
+    :param profile: 为 True 时每次操作后输出各阶段的耗时、行数和缓存命中统计
+    """
+    data_manager.init_db(current_store)
+    
+    while True:
+        choice = display_main_menu()
+        if profile:
+            profiler.enable()
+        if choice == '1': handle_add_data(is_quick_mode=False) # <--- 明确调用精细模式
+        elif choice == '2': handle_add_data(is_quick_mode=True)  # <--- 明确调用快速模式
+        elif choice == '3': handle_manage_early_payouts()
+        elif choice == '4': display_latest_report()
+        elif choice == '5': handle_generate_charts()
+        elif choice == '6': handle_delete()
+        elif choice == '7': handle_view_all()
+        elif choice == '8': handle_bulk_import()
+        elif choice == '10': handle_manage_stores()
+        elif choice == '11': display_company_report()
+        elif choice == '12': handle_undo()
+        elif choice == '13': handle_view_rollups()
+        elif choice == '9':
+            print("感谢使用，程序退出。")
+            break
+        else:
+            print("无效输入。")
+        if profile:
+            print(profiler.format_report())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,154 @@
+# payout_schedule.py
+# 回款分布：每个销售渠道的订单不一定正好在固定天数后回款，而是按一个延迟分布分散到账。
+# 分布用“回款核”表示：kernel[k] 是订单金额在下单后第 k 天到账的比例 (各项非负、总和为 1)。
+# 每天的计划回款 = 每日应收款与回款核的卷积；各渠道按销售占比混合成一个核，卷积是线性的，所以结果与逐渠道计算再相加相同。
+
+import numpy as np
+
+# 分布类型 -> 显示名称
+KERNEL_KINDS = {'fixed': '固定天数', 'uniform': '均匀分布', 'normal': '正态分布', 'empirical': '经验分布'}
+# 参数格式说明 (界面提示用)
+KERNEL_PARAM_HINTS = {
+    'fixed': '天数，例如 15',
+    'uniform': '最早-最晚天数，例如 10-20',
+    'normal': '均值,标准差，例如 15,3',
+    'empirical': '天数:比例，逗号分隔，例如 12:0.2,15:0.5,20:0.3',
+}
+# 正态分布截断在均值 ± 这么多个标准差以内
+NORMAL_TAIL_SIGMAS = 4
+# 非零项不超过这个数时逐项平移相加 (O(n×非零项数))，否则用 FFT 卷积 (O(n log n))
+SPARSE_KERNEL_MAX_TERMS = 32
+
+
+def normalize_kernel(weights) -> np.ndarray:
+    """把非负权重归一化为回款核 (去掉末尾的 0)；权重为负或全为 0 时抛出 ValueError。"""
+    kernel = np.asarray(weights, dtype=float)
+    if kernel.ndim != 1 or len(kernel) == 0 or np.any(kernel < 0) or not np.isfinite(kernel).all():
+        raise ValueError("回款分布的权重必须是非负数。")
+    total = kernel.sum()
+    if total <= 0:
+        raise ValueError("回款分布的权重之和必须大于 0。")
+    return np.trim_zeros(kernel / total, 'b')
+
+
+def fixed_kernel(days: int) -> np.ndarray:
+    """全部金额在第 days 天到账 (即原来的固定回款周期)。"""
+    if days < 0:
+        raise ValueError("回款天数不能为负。")
+    kernel = np.zeros(int(days) + 1)
+    kernel[-1] = 1.0
+    return kernel
+
+
+def uniform_kernel(first_day: int, last_day: int) -> np.ndarray:
+    """金额平均分布在第 first_day 到第 last_day 天 (含两端)。"""
+    if first_day < 0 or last_day < first_day:
+        raise ValueError("均匀分布需要 0 <= 最早天数 <= 最晚天数。")
+    kernel = np.zeros(int(last_day) + 1)
+    kernel[int(first_day):] = 1.0
+    return normalize_kernel(kernel)
+
+
+def normal_kernel(mean: float, std: float) -> np.ndarray:
+    """离散化的正态分布 (按整数天取密度后归一化，截断在 0 天以后和 NORMAL_TAIL_SIGMAS 个标准差以内)。"""
+    if mean < 0 or std < 0:
+        raise ValueError("正态分布的均值和标准差不能为负。")
+    if std == 0:
+        return fixed_kernel(round(mean))
+    days = np.arange(int(np.ceil(mean + NORMAL_TAIL_SIGMAS * std)) + 1)
+    weights = np.exp(-0.5 * ((days - mean) / std) ** 2)
+    weights[days < mean - NORMAL_TAIL_SIGMAS * std] = 0.0
+    return normalize_kernel(weights)
+
+
+def empirical_kernel(delays, weights=None) -> np.ndarray:
+    """
+    由观测到的回款延迟构造经验分布。
+    :param delays: 每笔回款的延迟天数 (非负整数)。
+    :param weights: 每笔回款的金额或比例，缺省时每笔权重相同。
+    """
+    delays = np.asarray(delays, dtype=int)
+    if len(delays) == 0 or np.any(delays < 0):
+        raise ValueError("经验分布需要至少一个非负的延迟天数。")
+    return normalize_kernel(np.bincount(delays, weights=weights))
+
+
+def parse_kernel(kind: str, params: str) -> np.ndarray:
+    """按分布类型解析参数文本 (格式见 KERNEL_PARAM_HINTS)，返回回款核；格式错误时抛出 ValueError。"""
+    if kind not in KERNEL_KINDS:
+        raise ValueError(f"未知的回款分布类型: {kind}")
+    text = str(params).strip().replace('，', ',').replace('：', ':')
+    try:
+        if kind == 'fixed':
+            days = int(text)
+        elif kind == 'uniform':
+            first_day, last_day = (int(value) for value in text.split('-'))
+        elif kind == 'normal':
+            mean, std = (float(value) for value in text.split(','))
+        else:
+            pairs = [item.split(':') for item in text.split(',') if item.strip()]
+            delays, weights = [int(day) for day, _ in pairs], [float(weight) for _, weight in pairs]
+    except ValueError:
+        raise ValueError(f"{KERNEL_KINDS[kind]}的参数无效: {params} (应为 {KERNEL_PARAM_HINTS[kind]})。")
+
+    if kind == 'fixed':
+        return fixed_kernel(days)
+    if kind == 'uniform':
+        return uniform_kernel(first_day, last_day)
+    if kind == 'normal':
+        return normal_kernel(mean, std)
+    return empirical_kernel(delays, weights)
+
+
+def combine_channels(channels) -> np.ndarray:
+    """
+    把各渠道的回款核按销售占比混合成一个核。
+    :param channels: (占比, 回款核) 的列表；占比会被归一化。
+    """
+    channels = list(channels)
+    if not channels:
+        raise ValueError("至少需要一个回款渠道。")
+    shares = np.array([share for share, _ in channels], dtype=float)
+    if np.any(shares < 0) or shares.sum() <= 0:
+        raise ValueError("渠道占比必须是非负数，且总和大于 0。")
+    combined = np.zeros(max(len(kernel) for _, kernel in channels))
+    for share, kernel in channels:
+        combined[:len(kernel)] += share * np.asarray(kernel, dtype=float)
+    return normalize_kernel(combined)
+
+
+def max_delay(kernel) -> int:
+    """最晚的回款天数：计算某一天的计划回款需要往前看这么多天的应收款。"""
+    return len(kernel) - 1
+
+
+def first_delay(kernel) -> int:
+    """最早的回款天数：某天的应收款变化后，最早从这么多天后开始影响计划回款。"""
+    return int(np.flatnonzero(kernel)[0])
+
+
+def expected_inflows(receivable, kernel) -> np.ndarray:
+    """
+    每日应收款与回款核的 (因果) 卷积：inflow[t] = Σ_k kernel[k] × receivable[t - k] (沿最后一个轴，
+    可以是增长预测中多条模拟路径组成的矩阵)。
+    单点分布 (固定天数) 直接平移，结果与原来的 shift 完全相同，整数输入保持整数；
+    非零项较少时逐项平移相加，否则用 numpy 的 FFT 卷积，长历史和宽分布下都是 O(n log n)。
+    """
+    receivable = np.asarray(receivable)
+    n = receivable.shape[-1]
+    delays = np.flatnonzero(kernel)
+    if len(delays) == 1 and kernel[delays[0]] == 1.0:
+        inflow = np.zeros_like(receivable)
+        if delays[0] < n:
+            inflow[..., delays[0]:] = receivable[..., :n - delays[0]]
+        return inflow
+
+    receivable = receivable.astype(float)
+    if len(delays) <= SPARSE_KERNEL_MAX_TERMS:
+        inflow = np.zeros(receivable.shape)
+        for delay in delays[delays < n]:
+            inflow[..., delay:] += kernel[delay] * receivable[..., :n - delay]
+        return inflow
+
+    size = 1 << int(np.ceil(np.log2(n + len(kernel) - 1)))
+    return np.fft.irfft(np.fft.rfft(receivable, size, axis=-1) * np.fft.rfft(kernel, size), size, axis=-1)[..., :n]
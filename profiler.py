@@ -0,0 +1,162 @@
+# profiler.py
+# 轻量级的分阶段性能统计：各模块的关键函数用 @profiled 标记，调用耗时、返回行数、缓存命中等按线程记录。
+# 是否启用只看当前线程的状态：未启用的线程每次调用只多一次线程局部变量的读取，几乎没有开销。
+# Streamlit 的每次 rerun 在自己的线程里运行，并按该会话的开关重新启用或停用，会话之间互不影响。
+
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+_local = threading.local()
+
+
+class Recorder:
+    """一次统计周期 (一次 Streamlit rerun 或一次 CLI 操作) 内收集到的数据。"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.stages = {}    # 阶段 -> [调用次数, 总耗时(秒), 返回行数 (不返回表格的阶段为 None)]
+        self.counters = {}  # 计数器 -> 累计值
+        self.caches = {}    # 缓存 -> [查询次数, 未命中次数]
+
+    def add_stage(self, name, elapsed, rows):
+        stage = self.stages.setdefault(name, [0, 0.0, None])
+        stage[0] += 1
+        stage[1] += elapsed
+        if rows is not None:
+            stage[2] = (stage[2] or 0) + rows
+
+
+def enable():
+    """在当前线程启用统计 (并清空之前的数据)。"""
+    _local.recorder = Recorder()
+
+
+def disable():
+    """在当前线程停用统计。"""
+    _local.recorder = None
+
+
+def is_enabled() -> bool:
+    return getattr(_local, 'recorder', None) is not None
+
+
+def reset():
+    """清空当前线程已收集的数据 (未启用时不做任何事)。"""
+    if is_enabled():
+        _local.recorder = Recorder()
+
+
+def _row_count(result):
+    """DataFrame / ndarray 返回其行数，其他结果不计行数。"""
+    shape = getattr(result, 'shape', None)
+    return shape[0] if shape else None
+
+
+def profiled(name: str = None):
+    """
+    装饰器：启用统计时记录函数的调用次数、耗时和返回的行数。
+    嵌套调用的耗时是包含关系 (例如刷新账本的耗时包含其中 calculate_finances 的耗时)。
+    """
+    def decorator(func):
+        stage_name = name or f"{func.__module__}.{func.__name__}"
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            recorder = getattr(_local, 'recorder', None)
+            if recorder is None:
+                return func(*args, **kwargs)
+            start = time.perf_counter()
+            result = func(*args, **kwargs)
+            recorder.add_stage(stage_name, time.perf_counter() - start, _row_count(result))
+            return result
+        return wrapper
+    return decorator
+
+
+@contextmanager
+def stage(name: str):
+    """上下文管理器形式的计时，用于没有独立函数的代码段。"""
+    recorder = getattr(_local, 'recorder', None)
+    if recorder is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        recorder.add_stage(name, time.perf_counter() - start, None)
+
+
+def count(name: str, n: int = 1):
+    """累加一个计数器。"""
+    recorder = getattr(_local, 'recorder', None)
+    if recorder is not None:
+        recorder.counters[name] = recorder.counters.get(name, 0) + n
+
+
+def cache_lookup(name: str):
+    """记录一次缓存查询；命中数 = 查询次数 - 未命中次数。"""
+    recorder = getattr(_local, 'recorder', None)
+    if recorder is not None:
+        recorder.caches.setdefault(name, [0, 0])[0] += 1
+
+
+def cache_miss(name: str):
+    """记录一次缓存未命中 (在真正计算的分支里调用)。"""
+    recorder = getattr(_local, 'recorder', None)
+    if recorder is not None:
+        recorder.caches.setdefault(name, [0, 0])[1] += 1
+
+
+def elapsed() -> float:
+    """本统计周期开始至今的时间 (秒)；未启用时为 0。"""
+    recorder = getattr(_local, 'recorder', None)
+    return time.perf_counter() - recorder.started if recorder is not None else 0.0
+
+
+def stage_rows() -> list:
+    """各阶段的统计，按总耗时从高到低排列。"""
+    recorder = getattr(_local, 'recorder', None)
+    if recorder is None:
+        return []
+    rows = [{'阶段': name, '调用次数': calls, '总耗时(ms)': round(total * 1000, 2),
+             '平均耗时(ms)': round(total * 1000 / calls, 2), '返回行数': row_count}
+            for name, (calls, total, row_count) in recorder.stages.items()]
+    return sorted(rows, key=lambda row: row['总耗时(ms)'], reverse=True)
+
+
+def cache_rows() -> list:
+    """各缓存的查询次数、命中次数和命中率。"""
+    recorder = getattr(_local, 'recorder', None)
+    if recorder is None:
+        return []
+    rows = []
+    for name, (lookups, misses) in recorder.caches.items():
+        hits = max(lookups - misses, 0)
+        rows.append({'缓存': name, '查询次数': lookups, '命中': hits, '未命中': misses,
+                     '命中率': f"{hits / lookups:.0%}" if lookups else '-'})
+    return rows
+
+
+def counter_rows() -> list:
+    recorder = getattr(_local, 'recorder', None)
+    if recorder is None:
+        return []
+    return [{'计数器': name, '值': value} for name, value in recorder.counters.items()]
+
+
+def format_report() -> str:
+    """把当前统计整理成适合命令行输出的文本。"""
+    if not is_enabled():
+        return ""
+    lines = ["", "-" * 20 + f" 性能统计 (共 {elapsed() * 1000:.1f} ms) " + "-" * 20]
+    for row in stage_rows():
+        rows_text = f", {row['返回行数']} 行" if row['返回行数'] is not None else ""
+        lines.append(f"  {row['阶段']}: {row['调用次数']} 次, {row['总耗时(ms)']:.2f} ms{rows_text}")
+    for row in cache_rows():
+        lines.append(f"  缓存 {row['缓存']}: 命中 {row['命中']}/{row['查询次数']} ({row['命中率']})")
+    for row in counter_rows():
+        lines.append(f"  {row['计数器']}: {row['值']}")
+    return "\n".join(lines)
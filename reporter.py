@@ -1,13 +1,39 @@
 # reporter.py (已更新)
 
+import io
+import hashlib
+import threading
+from collections import OrderedDict
+import numpy as np
 import pandas as pd
 import matplotlib.pyplot as plt
 import matplotlib.dates as mdates
 import os
 
+import profiler
+
 
 # 定义图表保存的文件夹
-#CHARTS_DIR = 'charts'
+CHARTS_DIR = 'charts'
+
+# 每个序列最多绘制的点数，超过时按桶取最小/最大值降采样，渲染耗时与历史长度无关
+MAX_PLOT_POINTS = 1000
+# 数据点不多于此值时才绘制逐点标记
+MARKER_MAX_POINTS = 90
+# 渲染结果 (PNG字节) 的缓存条数
+CHART_CACHE_SIZE = 16
+TREND_COLUMNS = ['Date', 'bank_balance', 'daily_net_cash_flow', 'cumulative_profit']
+# 保存趋势图时使用的文件名 (与最初的命令行版本相同，依赖这些文件的脚本不需要修改)
+CHART_FILENAMES = {
+    '银行账户现金余额趋势': 'bank_balance_trend.png',
+    '每日净现金流': 'daily_net_cash_flow.png',
+    '累计总利润趋势': 'cumulative_profit_trend.png',
+}
+
+_font_ready = False
+# pyplot 的全局状态不是线程安全的，Streamlit 的多个会话在不同线程中渲染，需要串行化
+_render_lock = threading.Lock()
+_png_cache = OrderedDict()
 
 def set_chinese_font():
     """
@@ -39,6 +65,36 @@ def set_chinese_font():
             
     # 如果循环结束后仍然没有成功设置字体，可以在调用方 (app.py) 中给出警告
     # 这里函数本身不需要做任何事
+
+
+def _ensure_chinese_font():
+    """字体设置只需在进程内执行一次。"""
+    global _font_ready
+    if not _font_ready:
+        set_chinese_font()
+        _font_ready = True
+
+
+def downsample_minmax(dates, values, max_points: int = MAX_PLOT_POINTS) -> tuple:
+    """
+    按桶取最小/最大值对序列降采样：每个桶保留最小值和最大值两个点 (按时间顺序)，
+    峰值和谷值不会被平滑掉，输出点数不超过 max_points。
+    :return: (降采样后的日期数组, 数值数组, 每个桶包含的原始点数)
+    """
+    dates = np.asarray(dates)
+    values = np.asarray(values, dtype=float)
+    n = len(values)
+    if n <= max_points:
+        return dates, values, 1
+
+    bucket = -(-n // (max_points // 2))  # 向上取整
+    # 末尾用最后一个值补齐成整桶，重复值不影响桶内的最小/最大值
+    padded = np.pad(values, (0, -n % bucket), mode='edge').reshape(-1, bucket)
+    offsets = np.arange(padded.shape[0]) * bucket
+    idx_min = np.minimum(offsets + padded.argmin(axis=1), n - 1)
+    idx_max = np.minimum(offsets + padded.argmax(axis=1), n - 1)
+    idx = np.unique(np.concatenate([idx_min, idx_max]))
+    return dates[idx], values[idx], bucket
             
 
 '''
@@ -48,6 +104,7 @@ def ensure_charts_dir():
         os.makedirs(CHARTS_DIR)
 '''
 
+@profiler.profiled()
 def plot_financial_trends(df_calculated: pd.DataFrame) -> list:
     """
     生成所有核心财务趋势图表，并返回Matplotlib figure对象列表。
@@ -57,13 +114,15 @@ def plot_financial_trends(df_calculated: pd.DataFrame) -> list:
     if df_calculated.empty or len(df_calculated) < 2:
         return []
 
-    set_chinese_font()
+    _ensure_chinese_font()
     
     figs = []
+    marker = 'o' if len(df_calculated) <= MARKER_MAX_POINTS else None
 
     # --- 1. 银行账户现金余额趋势图 ---
+    dates, balance, _ = downsample_minmax(df_calculated['Date'], df_calculated['bank_balance'])
     fig1, ax1 = plt.subplots(figsize=(10, 5))
-    ax1.plot(df_calculated['Date'], df_calculated['bank_balance'], marker='o', linestyle='-', color='b')
+    ax1.plot(dates, balance, marker=marker, linestyle='-', color='b')
     ax1.set_title('银行账户现金余额趋势', fontsize=16)
     ax1.set_xlabel('日期', fontsize=12)
     ax1.set_ylabel('余额 (元)', fontsize=12)
@@ -72,9 +131,11 @@ def plot_financial_trends(df_calculated: pd.DataFrame) -> list:
     figs.append(('银行账户现金余额趋势', fig1))
 
     # --- 2. 每日净现金流图 ---
+    dates, net_flow, bucket = downsample_minmax(df_calculated['Date'], df_calculated['daily_net_cash_flow'])
     fig2, ax2 = plt.subplots(figsize=(10, 5))
-    colors = ['g' if x >= 0 else 'r' for x in df_calculated['daily_net_cash_flow']]
-    ax2.bar(df_calculated['Date'], df_calculated['daily_net_cash_flow'], color=colors)
+    colors = np.where(net_flow >= 0, 'g', 'r')
+    # 降采样后每个桶画两根柱子，柱宽按桶覆盖的天数放大，保持柱子铺满时间轴
+    ax2.bar(dates, net_flow, color=colors, width=0.8 * max(bucket / 2, 1))
     ax2.set_title('每日净现金流', fontsize=16)
     ax2.set_xlabel('日期', fontsize=12)
     ax2.set_ylabel('净现金流 (元)', fontsize=12)
@@ -83,8 +144,9 @@ def plot_financial_trends(df_calculated: pd.DataFrame) -> list:
     figs.append(('每日净现金流', fig2))
 
     # --- 3. 累计总利润趋势图 ---
+    dates, profit, _ = downsample_minmax(df_calculated['Date'], df_calculated['cumulative_profit'])
     fig3, ax3 = plt.subplots(figsize=(10, 5))
-    ax3.plot(df_calculated['Date'], df_calculated['cumulative_profit'], marker='o', linestyle='-', color='purple')
+    ax3.plot(dates, profit, marker=marker, linestyle='-', color='purple')
     ax3.set_title('累计总利润趋势', fontsize=16)
     ax3.set_xlabel('日期', fontsize=12)
     ax3.set_ylabel('累计利润 (元)', fontsize=12)
@@ -157,3 +219,88 @@ def plot_financial_trends(df_calculated: pd.DataFrame) -> list:
 
     print("\n所有图表生成完毕！")
     '''
+
+
+def _data_hash(df_calculated: pd.DataFrame) -> str:
+    """以图表用到的列的内容计算哈希，作为渲染缓存的键。"""
+    hashed = pd.util.hash_pandas_object(df_calculated[TREND_COLUMNS], index=False)
+    return hashlib.sha1(hashed.values.tobytes()).hexdigest()
+
+
+@profiler.profiled()
+def render_financial_trends_png(df_calculated: pd.DataFrame) -> list:
+    """
+    渲染核心财务趋势图并返回PNG字节，figure 在渲染后立即关闭。
+    结果按数据内容的哈希缓存，数据不变时不会重复渲染。
+    :return: 一个包含 (标题, PNG字节) 元组的列表。
+    """
+    if df_calculated.empty or len(df_calculated) < 2:
+        return []
+
+    key = _data_hash(df_calculated)
+    profiler.cache_lookup('趋势图PNG')
+    with _render_lock:
+        if key in _png_cache:
+            _png_cache.move_to_end(key)
+            return _png_cache[key]
+
+        profiler.cache_miss('趋势图PNG')
+
+        charts = []
+        for title, fig in plot_financial_trends(df_calculated):
+            try:
+                buffer = io.BytesIO()
+                fig.savefig(buffer, format='png', bbox_inches='tight')
+                charts.append((title, buffer.getvalue()))
+            finally:
+                plt.close(fig)
+
+        _png_cache[key] = charts
+        if len(_png_cache) > CHART_CACHE_SIZE:
+            _png_cache.popitem(last=False)
+        return charts
+
+
+@profiler.profiled()
+def save_financial_trends(df_calculated: pd.DataFrame, charts_dir: str = CHARTS_DIR) -> list:
+    """
+    把核心财务趋势图保存为PNG文件。
+    :return: 保存的文件路径列表。
+    """
+    os.makedirs(charts_dir, exist_ok=True)
+    paths = []
+    for title, image in render_financial_trends_png(df_calculated):
+        path = os.path.join(charts_dir, CHART_FILENAMES[title])
+        with open(path, 'wb') as f:
+            f.write(image)
+        paths.append(path)
+    return paths
+
+
+@profiler.profiled()
+def render_heatmap_png(values, x_values, y_values, x_label: str, y_label: str, title: str, reverse_colors: bool = False) -> bytes:
+    """
+    把二维网格结果渲染为热力图PNG (用于敏感性分析)，figure 在渲染后立即关闭。
+    同时包含正负值时 (例如余额) 额外画出 0 等值线，标出透支的边界。
+    :param values: 形状为 (len(y_values), len(x_values)) 的数组。
+    :param reverse_colors: 数值越小越好时 (例如所需天数) 反转配色。
+    """
+    values = np.asarray(values, dtype=float)
+    with _render_lock:
+        _ensure_chinese_font()
+        fig, ax = plt.subplots(figsize=(10, 7))
+        try:
+            mesh = ax.pcolormesh(x_values, y_values, values, shading='nearest',
+                                 cmap='RdYlGn_r' if reverse_colors else 'RdYlGn')
+            fig.colorbar(mesh, ax=ax)
+            finite = values[np.isfinite(values)]
+            if finite.size and finite.min() < 0 < finite.max() and len(x_values) > 1 and len(y_values) > 1:
+                ax.contour(x_values, y_values, values, levels=[0], colors='black', linewidths=1.2)
+            ax.set_title(title, fontsize=16)
+            ax.set_xlabel(x_label, fontsize=12)
+            ax.set_ylabel(y_label, fontsize=12)
+            buffer = io.BytesIO()
+            fig.savefig(buffer, format='png', bbox_inches='tight')
+            return buffer.getvalue()
+        finally:
+            plt.close(fig)
@@ -0,0 +1,117 @@
+# sensitivity_analyzer.py
+
+import numpy as np
+
+import finance_calculator
+import growth_predictor
+import profiler
+
+# 可以做敏感性分析的参数：键 -> (显示名称, 默认值)
+PARAMETERS = {
+    'payout_delay_days': ('回款周期 (天)', finance_calculator.PAYOUT_DELAY_DAYS),
+    'initial_cash': ('期初资金 (元)', finance_calculator.INITIAL_CASH),
+    'profit_margin': ('平均利润率 (退款利润损失估算)', finance_calculator.AVERAGE_PROFIT_MARGIN),
+    'increment_buffer': ('增单缓冲金 (元)', growth_predictor.INCREMENT_ORDER_BUFFER_PER_UNIT),
+}
+# 各参数默认的扫描范围
+DEFAULT_RANGES = {
+    'payout_delay_days': (1, 50),
+    'initial_cash': (0.0, 20000.0),
+    'profit_margin': (0.0, 0.6),
+    'increment_buffer': (300.0, 3000.0),
+}
+# 输出指标：键 -> 显示名称
+METRICS = {
+    'final_balance': '期末银行余额 (元)',
+    'min_balance': '最低银行余额 (元)',
+    'final_cumulative_profit': '期末累计利润 (元)',
+    'days_to_next_increment': '增单所需天数',
+}
+GRID_POINTS = 50
+
+
+@profiler.profiled()
+def prepare_inputs(df_daily, df_early_payouts) -> dict:
+    """
+    计算所有参数组合共用的中间结果 (只依赖数据，与参数无关)：
+    与回款周期无关的当日净现金流、应收款以及它们的累计和。数据不变时只需计算一次。
+    :return: 中间结果字典；没有数据时返回空字典。
+    """
+    df = finance_calculator.daily_aggregates(df_daily, df_early_payouts)
+    if df.empty:
+        return {}
+
+    cost = df['Total_Daily_Cost'].to_numpy(dtype=float)
+    profit = df['Total_Daily_Profit'].to_numpy(dtype=float)
+    refunds = df['Refunds_Received_Today'].to_numpy(dtype=float)
+    # 应收款：每天订单在回款周期之后应到账的金额 (已提前收回的部分除外)
+    receivable = cost + profit - df['Early_Payout_Deducted'].to_numpy(dtype=float)
+    # 当日净现金流中与回款周期无关的部分：提前回款 + 退款 + 其他入账 - 当日成本
+    other_net = (df['Early_Payout_Received'].to_numpy(dtype=float) + refunds
+                 + df['Other_Income_Today'].to_numpy(dtype=float) - cost)
+
+    # 累计和前面补一个 0：cum[k] 是前 k 天之和，方便按 t - 回款周期 直接取值
+    return {
+        'dates': df['Date'].to_numpy(),
+        'cum_other_net': np.concatenate([[0.0], np.cumsum(other_net)]),
+        'cum_receivable': np.concatenate([[0.0], np.cumsum(receivable)]),
+        'total_profit': profit.sum(),
+        'total_refunds': refunds.sum(),
+    }
+
+
+def _delay_profiles(inputs: dict, delays: np.ndarray) -> tuple:
+    """
+    对每个回款周期计算 (不含期初资金的) 最低余额、期末余额和稳定期日均净现金流。
+    余额 = 前 t+1 天的其他净现金流之和 + 前 t+1-D 天的应收款之和，两者都直接取自共用的累计和。
+    """
+    cum_other_net, cum_receivable = inputs['cum_other_net'], inputs['cum_receivable']
+    n_days = len(cum_other_net) - 1
+    t = np.arange(n_days)
+    balances = cum_other_net[None, 1:] + cum_receivable[np.clip(t[None, :] - delays[:, None] + 1, 0, None)]
+
+    # 稳定期 (第 D 天起) 的日均净现金流，与 growth_predictor.analyze_growth 的定义一致
+    stable_days = n_days - delays
+    clipped = np.clip(delays, 0, n_days)
+    stable_sum = (cum_other_net[n_days] - cum_other_net[clipped]) + cum_receivable[np.clip(stable_days, 0, None)]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        avg_net_flow = np.where(stable_days > 0, stable_sum / stable_days, np.nan)
+    return balances.min(axis=1), balances[:, -1], avg_net_flow
+
+
+def axis_values(parameter: str, low, high, points: int = GRID_POINTS) -> np.ndarray:
+    """生成一个参数的扫描取值；回款周期取整数并去重。"""
+    values = np.linspace(low, high, points)
+    if parameter == 'payout_delay_days':
+        return np.unique(values.round().astype(int))
+    return values
+
+
+@profiler.profiled()
+def sensitivity_grid(inputs: dict, x_param: str, x_values, y_param: str, y_values, fixed: dict = None) -> dict:
+    """
+    在 (y_param × x_param) 网格上一次性批量计算各项指标，其余参数取 fixed 中的值 (缺省为当前常量)。
+    只有回款周期需要重新组合累计和，且每个不同的回款周期只算一次；期初资金、利润率和缓冲金都只是广播运算。
+    :return: {指标: 形状为 (len(y_values), len(x_values)) 的数组}
+    """
+    values = {name: default for name, (_, default) in PARAMETERS.items()}
+    values.update(fixed or {})
+    grid_x, grid_y = np.meshgrid(np.asarray(x_values, dtype=float), np.asarray(y_values, dtype=float))
+    params = {name: np.full(grid_x.shape, value, dtype=float) for name, value in values.items()}
+    params[x_param], params[y_param] = grid_x, grid_y
+
+    delays = params['payout_delay_days'].round().astype(int)
+    unique_delays, inverse = np.unique(delays, return_inverse=True)
+    inverse = inverse.reshape(delays.shape)
+    min_balance, final_balance, avg_net_flow = _delay_profiles(inputs, unique_delays)
+
+    avg_net_flow = avg_net_flow[inverse]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        days_to_next_increment = np.where(avg_net_flow > 0, params['increment_buffer'] / avg_net_flow, np.nan)
+
+    return {
+        'final_balance': params['initial_cash'] + final_balance[inverse],
+        'min_balance': params['initial_cash'] + min_balance[inverse],
+        'final_cumulative_profit': inputs['total_profit'] - params['profit_margin'] * inputs['total_refunds'],
+        'days_to_next_increment': days_to_next_increment,
+    }
@@ -0,0 +1,16 @@
+# 测试共用的夹具。
+
+import pytest
+
+import data_manager
+
+
+@pytest.fixture
+def db_file(tmp_path, monkeypatch):
+    """把默认店铺的数据库 (以及同目录下的节假日文件和其他店铺) 指向临时目录，测试结束后关闭所有连接。"""
+    path = tmp_path / 'finance_test.db'
+    monkeypatch.setattr(data_manager, 'DB_FILE', str(path))
+    try:
+        yield path
+    finally:
+        data_manager.close_all_connections()
@@ -0,0 +1,97 @@
+# 本地 JSON 接口的端到端测试：在临时数据库上启动 make_server(port=0)，通过真实的 HTTP 请求检查
+# ETag / 304、并发读取和串行写入，以及写入参数的校验。
+
+import json
+import threading
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import api_server
+import data_manager
+
+
+@pytest.fixture
+def base_url(db_file):
+    api_server._ledger_cache.clear()
+    server = api_server.make_server(port=0)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield f"http://127.0.0.1:{server.server_address[1]}/api"
+    finally:
+        server.shutdown()
+        server.server_close()
+        thread.join()
+        api_server._ledger_cache.clear()
+
+
+def _request(url, method='GET', body=None, headers=None):
+    """发送请求，返回 (状态码, 响应头, 解析后的 JSON 或 None)；错误状态码也正常返回。"""
+    data = json.dumps(body).encode('utf-8') if body is not None else None
+    request = urllib.request.Request(url, data=data, method=method, headers=headers or {})
+    if data is not None:
+        request.add_header('Content-Type', 'application/json')
+    try:
+        with urllib.request.urlopen(request, timeout=30) as response:
+            status, response_headers, raw = response.status, response.headers, response.read()
+    except urllib.error.HTTPError as e:
+        status, response_headers, raw = e.code, e.headers, e.read()
+    return status, response_headers, json.loads(raw) if raw else None
+
+
+def _daily(date, order_count=10, total_cost=300.0, total_profit=80.0):
+    return {'date': date, 'order_count': order_count, 'total_cost': total_cost, 'total_profit': total_profit}
+
+
+def test_etag_returns_304_until_data_changes(base_url):
+    assert _request(f"{base_url}/daily", 'POST', _daily('2024-01-01'))[0] == 201
+
+    status, headers, payload = _request(f"{base_url}/ledger")
+    assert status == 200 and len(payload['rows']) == 1
+    etag = headers['ETag']
+
+    status, headers, payload = _request(f"{base_url}/ledger", headers={'If-None-Match': etag})
+    assert status == 304 and payload is None
+    assert headers['ETag'] == etag
+
+    assert _request(f"{base_url}/daily", 'POST', _daily('2024-01-02'))[0] == 201
+    status, headers, payload = _request(f"{base_url}/ledger", headers={'If-None-Match': etag})
+    assert status == 200 and len(payload['rows']) == 2
+    assert headers['ETag'] != etag
+
+
+def test_concurrent_reads_return_the_same_ledger(base_url):
+    for day in range(1, 21):
+        _request(f"{base_url}/daily", 'POST', _daily(f"2024-01-{day:02d}"))
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        results = list(pool.map(lambda _: _request(f"{base_url}/ledger"), range(32)))
+    assert {status for status, _, _ in results} == {200}
+    assert len({headers['ETag'] for _, headers, _ in results}) == 1
+    assert all(payload == results[0][2] for _, _, payload in results)
+    assert len(results[0][2]['rows']) == 20
+
+
+def test_concurrent_writes_are_serialized(base_url):
+    dates = [f"2024-02-{day:02d}" for day in range(1, 25)]
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        statuses = list(pool.map(lambda date: _request(f"{base_url}/daily", 'POST', _daily(date))[0], dates))
+    assert statuses == [201] * len(dates)
+
+    assert data_manager.get_data_versions()[data_manager.DAILY_TABLE] == len(dates)
+    _, _, payload = _request(f"{base_url}/ledger")
+    rows = payload['rows']
+    assert [row['Date'] for row in rows] == dates
+    # 每次写入都增量刷新了账本：最后一天的累计利润等于所有天的利润之和
+    assert rows[-1]['cumulative_profit'] == pytest.approx(80.0 * len(dates))
+
+
+@pytest.mark.parametrize('field, value', [('order_count', -1), ('total_cost', -0.01), ('total_profit', -5),
+                                         ('refunds', -1), ('other_income', -3)])
+def test_post_daily_rejects_negative_values(base_url, field, value):
+    status, _, payload = _request(f"{base_url}/daily", 'POST', {**_daily('2024-03-01'), field: value})
+    assert status == 400 and 'error' in payload
+    assert _request(f"{base_url}/daily")[2]['rows'] == []
@@ -0,0 +1,74 @@
+# 营业日历的测试：到期日落在周末或节假日的款项顺延到下一个营业日，与逐日循环的参考实现一致且总额不变。
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import business_calendar
+
+HOLIDAYS = """
+# 劳动节
+2024-05-01~2024-05-05
++2024-05-11          # 调休上班的周六
+2024-05-20
+"""
+
+
+def _settle_by_loop(due, first_due_date, first_day, length, calendar):
+    """参考实现：逐笔找到不早于到期日的第一个营业日。"""
+    settled = np.zeros(length, dtype=np.asarray(due).dtype)
+    for k, amount in enumerate(due):
+        date = pd.Timestamp(first_due_date) + pd.Timedelta(days=k)
+        while not calendar.is_business_day(date):
+            date += pd.Timedelta(days=1)
+        offset = (date - pd.Timestamp(first_day)).days
+        if 0 <= offset < length:
+            settled[offset] += amount
+    return settled
+
+
+@pytest.fixture
+def calendar():
+    return business_calendar.parse_calendar(HOLIDAYS)
+
+
+def test_parse_calendar(calendar):
+    assert not calendar.is_business_day('2024-05-01')
+    assert not calendar.is_business_day('2024-05-20')
+    assert not calendar.is_business_day('2024-05-12')
+    assert calendar.is_business_day('2024-05-11')
+    assert calendar.is_business_day('2024-05-06')
+    # 五一假期 (5 月 1 日至 5 日) 连着周末：5 月 6 日之前连续 5 天不结算
+    assert calendar.lead_days('2024-05-06') == 5
+    assert calendar.lead_days('2024-05-07') == 0
+    assert business_calendar.parse_calendar('weekend =\n').is_business_day('2024-05-12')
+    with pytest.raises(ValueError):
+        business_calendar.parse_calendar('2024-13-01\n')
+
+
+def test_settled_amounts_moves_holiday_amounts_to_next_business_day(calendar):
+    due = np.arange(1.0, 36.0)
+    settled = business_calendar.settled_amounts(due, '2024-04-25', '2024-04-25', 40, calendar)
+    np.testing.assert_array_equal(settled, _settle_by_loop(due, '2024-04-25', '2024-04-25', 40, calendar))
+    assert settled.sum() == due.sum()
+    # 4 月 27、28 日 (周末) 的到期款在 4 月 29 日到账，五一假期的到期款与 5 月 6 日当天的一起到账
+    assert settled[4] == due[2:5].sum()
+    assert settled[11] == due[6:12].sum()
+    assert settled[2:4].sum() == settled[6:11].sum() == 0
+
+
+@pytest.mark.parametrize('first_day, length', [('2024-04-20', 60), ('2024-05-03', 10), ('2024-05-06', 1)])
+def test_settled_amounts_clips_to_the_window(calendar, first_day, length):
+    due = np.arange(1, 36, dtype=np.int64) * 100
+    settled = business_calendar.settled_amounts(due, '2024-04-25', first_day, length, calendar)
+    assert settled.dtype == np.int64
+    np.testing.assert_array_equal(settled, _settle_by_loop(due, '2024-04-25', first_day, length, calendar))
+
+
+def test_settled_amounts_works_row_wise_on_matrices(calendar):
+    due = np.random.default_rng(22).uniform(0, 100, (5, 35))
+    settled = business_calendar.settled_amounts(due, '2024-04-25', '2024-04-25', 40, calendar)
+    for row, expected_due in zip(settled, due):
+        np.testing.assert_allclose(row, business_calendar.settled_amounts(expected_due, '2024-04-25', '2024-04-25', 40,
+                                                                          calendar))
+    np.testing.assert_allclose(settled.sum(axis=1), due.sum(axis=1))
@@ -0,0 +1,250 @@
+# 数据层的测试：每次写入后增量维护的物化账本必须与从原始数据全量重算的结果一致。
+
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import data_manager
+import finance_calculator
+import growth_predictor
+
+START = pd.Timestamp('2024-01-01')
+
+
+def _day(offset):
+    return (START + pd.Timedelta(days=int(offset))).strftime('%Y-%m-%d')
+
+
+def _full_recompute():
+    """从原始数据全量计算账本 (与物化账本使用相同的期初资金、回款分布和营业日历)。"""
+    return finance_calculator.calculate_finances(
+        data_manager.load_all_data(), data_manager.load_all_early_payouts(),
+        initial_cash=data_manager.get_store_initial_cash(), kernel=data_manager.get_payout_kernel(),
+        calendar=data_manager.get_business_calendar())
+
+
+def _assert_ledger_matches_full_recompute():
+    df_ledger = data_manager.load_computed_ledger()
+    expected = _full_recompute()
+    assert list(df_ledger['Date']) == list(expected['Date'])
+    np.testing.assert_allclose(df_ledger[finance_calculator.COMPUTED_COLS].to_numpy(float),
+                               expected[finance_calculator.COMPUTED_COLS].to_numpy(float), rtol=0, atol=1e-6)
+
+
+def _random_write(rng):
+    """随机做一次写入：保存或删除一天的主数据，新增或删除一笔提前回款。"""
+    kind = rng.integers(4)
+    if kind == 0:
+        data_manager.save_daily_data(_day(rng.integers(90)), int(rng.integers(0, 30)), round(rng.uniform(0, 900), 2),
+                                     round(rng.uniform(0, 250), 2), round(rng.uniform(0, 50), 2),
+                                     round(rng.uniform(0, 10), 2), round(rng.uniform(0, 20), 2), '')
+    elif kind == 1:
+        data_manager.delete_data_by_date(_day(rng.integers(90)))
+    elif kind == 2:
+        origin = int(rng.integers(90))
+        data_manager.save_early_payout(_day(origin + rng.integers(0, 10)), _day(origin) if rng.random() < 0.7 else None,
+                                       round(rng.uniform(1, 100), 2))
+    else:
+        payouts = data_manager.load_all_early_payouts()
+        if not payouts.empty:
+            data_manager.delete_early_payout_by_id(int(rng.choice(payouts['payout_id'])))
+
+
+@pytest.mark.parametrize('channels, holidays', [
+    ([], ''),
+    ([('平台A', 0.6, 'uniform', '4-12'), ('平台B', 0.4, 'normal', '9,2')], ''),
+    ([('平台A', 1.0, 'uniform', '4-12')], '2024-02-10~2024-02-17\n2024-04-04~2024-04-06\n'),
+], ids=['fixed', 'channels', 'channels-holidays'])
+def test_materialized_ledger_matches_full_recompute_after_random_writes(db_file, channels, holidays):
+    if holidays:
+        with open(data_manager.calendar_file(), 'w', encoding='utf-8') as f:
+            f.write(holidays)
+    data_manager.init_db()
+    if channels:
+        data_manager.set_payout_channels(channels)
+    rng = np.random.default_rng(len(channels) + len(holidays))
+    for day in range(0, 90, 3):
+        data_manager.save_daily_data(_day(day), 10, 300.0, 80.0, 0.0, 0.0, 0.0, '')
+    for _ in range(40):
+        _random_write(rng)
+        _assert_ledger_matches_full_recompute()
+
+    data_manager.set_store_initial_cash(12345.0)
+    _assert_ledger_matches_full_recompute()
+
+
+def _assert_daily_totals_match_orders():
+    """主数据表中逐单录入的日期，订单数/成本/利润与订单明细之和一致。"""
+    df_daily = data_manager.load_all_data().set_index('Date')
+    df_summary = data_manager.load_daily_order_summary().set_index('Date')
+    totals = df_daily.loc[df_summary.index]
+    np.testing.assert_array_equal(totals['Daily_Order_Count'], df_summary['Order_Count'])
+    np.testing.assert_allclose(totals['Total_Daily_Cost'], df_summary['Total_Cost'], rtol=0, atol=1e-9)
+    np.testing.assert_allclose(totals['Total_Daily_Profit'], df_summary['Total_Profit'], rtol=0, atol=1e-9)
+
+
+def test_order_triggers_keep_daily_totals_in_sync(db_file):
+    data_manager.init_db()
+    rng = np.random.default_rng(6)
+    for day in range(10):
+        orders = [tuple(rng.uniform(1, 100, 2).round(2)) for _ in range(rng.integers(1, 8))]
+        data_manager.save_orders(_day(day), orders, 5.0, 1.0, 2.0, '')
+    _assert_daily_totals_match_orders()
+    assert data_manager.load_all_data()['Refunds_Received_Today'].eq(5.0).all()
+
+    # 重新逐单录入一天：原有明细被替换，汇总随之更新
+    data_manager.save_orders(_day(3), [(10.0, 2.5), (20.0, 4.0)], 0.0, 0.0, 0.0, '')
+    day3 = data_manager.load_all_data().set_index('Date').loc[pd.Timestamp(_day(3))]
+    assert (day3['Daily_Order_Count'], day3['Total_Daily_Cost'], day3['Total_Daily_Profit']) == (2, 30.0, 6.5)
+
+    # 直接修改、移动和删除订单明细，触发器同样维护汇总 (移入的日期没有主数据时自动建行)
+    with data_manager.session() as conn:
+        first, second, third = [row[0] for row in conn.execute(
+            f"SELECT order_id FROM {data_manager.ORDERS_TABLE} ORDER BY order_id LIMIT 3")]
+        conn.execute(f"UPDATE {data_manager.ORDERS_TABLE} SET Cost = Cost + 7, Profit = Profit - 1 WHERE order_id = ?", (first,))
+        conn.execute(f"UPDATE {data_manager.ORDERS_TABLE} SET Order_Date = ? WHERE order_id = ?", (_day(20), second))
+        conn.execute(f"DELETE FROM {data_manager.ORDERS_TABLE} WHERE order_id = ?", (third,))
+    _assert_daily_totals_match_orders()
+    assert data_manager.load_all_data()['Date'].eq(pd.Timestamp(_day(20))).any()
+
+    # 快速录入覆盖一天：该日的明细被清除，汇总以录入的数字为准
+    data_manager.save_daily_data(_day(5), 3, 90.0, 30.0, 0.0, 0.0, 0.0, '')
+    assert data_manager.load_orders(_day(5)).empty
+    day5 = data_manager.load_all_data().set_index('Date').loc[pd.Timestamp(_day(5))]
+    assert (day5['Daily_Order_Count'], day5['Total_Daily_Cost'], day5['Total_Daily_Profit']) == (3, 90.0, 30.0)
+    _assert_daily_totals_match_orders()
+
+    data_manager.delete_data_by_date(_day(0))
+    assert data_manager.load_orders(_day(0)).empty
+    _assert_daily_totals_match_orders()
+
+
+PANDAS_PERIODS = {'week': 'W-SUN', 'month': 'M', 'quarter': 'Q'}
+
+
+def _assert_rollups_match_ledger(period):
+    """周期汇总等于对账本逐日数据按周期分组求和 (期末列取周期最后一天)。"""
+    df_ledger = data_manager.load_computed_ledger()
+    groups = df_ledger.groupby(df_ledger['Date'].dt.to_period(PANDAS_PERIODS[period]).dt.start_time)
+    expected = groups[data_manager.ROLLUP_SUM_COLS].sum()
+    expected[data_manager.ROLLUP_END_COLS] = groups[data_manager.ROLLUP_END_COLS].last()
+    df_rollups = data_manager.load_period_rollups(period).set_index('period_start')
+    assert list(df_rollups.index) == list(expected.index)
+    assert list(df_rollups['last_date']) == list(groups['Date'].max())
+    assert list(df_rollups['days']) == list(groups.size())
+    columns = data_manager.ROLLUP_SUM_COLS + data_manager.ROLLUP_END_COLS
+    np.testing.assert_allclose(df_rollups[columns].to_numpy(float), expected[columns].to_numpy(float), rtol=0, atol=1e-6)
+
+
+@pytest.mark.parametrize('period', list(data_manager.ROLLUP_PERIODS))
+def test_period_rollups_match_daily_sums(db_file, period):
+    data_manager.init_db()
+    rng = np.random.default_rng(25)
+    data_manager.save_daily_data_bulk([(_day(day), int(rng.integers(0, 30)), round(rng.uniform(0, 900), 2),
+                                        round(rng.uniform(0, 250), 2), round(rng.uniform(0, 20), 2), 1.0, '')
+                                       for day in range(200) if rng.random() < 0.8])
+    _assert_rollups_match_ledger(period)
+
+    # 修改中间的一天、删除最后一天、在末尾之后追加：受影响的周期都会重新汇总
+    data_manager.save_daily_data(_day(100), 50, 1500.0, 400.0, 0.0, 0.0, 30.0, '')
+    _assert_rollups_match_ledger(period)
+    data_manager.delete_data_by_date(data_manager.load_all_data()['Date'].max())
+    _assert_rollups_match_ledger(period)
+    data_manager.save_early_payout(_day(230), _day(190), 80.0)
+    _assert_rollups_match_ledger(period)
+
+    df_part = data_manager.load_period_rollups(period, start_date=_day(60), end_date=_day(120))
+    assert df_part['last_date'].min() >= pd.Timestamp(_day(60)) and df_part['period_start'].max() <= pd.Timestamp(_day(120))
+
+
+def test_bulk_save_is_one_operation_and_keeps_other_income(db_file):
+    data_manager.init_db()
+    assert data_manager.save_daily_data_bulk([]) == 0
+    data_manager.save_daily_data('2024-01-03', 1, 10.0, 2.0, 0.0, 0.0, 66.0, '保留')
+    data_manager.save_orders('2024-01-04', [(5.0, 1.0)], 0.0, 0.0, 0.0, '')
+    operations_before = len(data_manager.list_operations(limit=None))
+
+    rows = [(_day(day), day, 30.0 * day, 8.0 * day, 1.5, 0.3, '导入') for day in range(40)]
+    assert data_manager.save_daily_data_bulk(rows, batch_size=7) == len(rows)
+    assert len(data_manager.list_operations(limit=None)) == operations_before + 1
+    _assert_ledger_matches_full_recompute()
+
+    df_daily = data_manager.load_all_data().set_index('Date')
+    kept = df_daily.loc[pd.Timestamp('2024-01-03')]
+    assert (kept['Daily_Order_Count'], kept['Other_Income_Today'], kept['Notes']) == (2, 66.0, '保留')
+    assert data_manager.load_orders('2024-01-04').empty
+    assert df_daily.loc[pd.Timestamp('2024-01-04'), 'Daily_Order_Count'] == 3
+
+    # 整个导入作为一次操作撤销
+    data_manager.undo_last_operation()
+    assert list(data_manager.load_all_data()['Date']) == [pd.Timestamp('2024-01-03'), pd.Timestamp('2024-01-04')]
+    assert len(data_manager.load_orders('2024-01-04')) == 1
+    _assert_ledger_matches_full_recompute()
+
+
+def test_exact_ledger_matches_materialized_ledger_to_the_cent(db_file):
+    data_manager.init_db()
+    rng = np.random.default_rng(20)
+    for _ in range(60):
+        _random_write(rng)
+    df_exact = finance_calculator.ledger_to_yuan(data_manager.compute_exact_ledger())
+    df_ledger = data_manager.load_computed_ledger()
+    assert list(df_exact['Date']) == list(df_ledger['Date'])
+    for col in finance_calculator.COMPUTED_COLS:
+        np.testing.assert_array_equal(finance_calculator.to_cents(df_exact[col]), finance_calculator.to_cents(df_ledger[col]))
+
+
+@pytest.mark.parametrize('payout_delay_days', [0, 15, 40, 500])
+def test_stable_period_summary_matches_full_ledger_prediction(db_file, payout_delay_days):
+    data_manager.init_db()
+    data_manager.create_store('分店')
+    rng = np.random.default_rng(7)
+    data_manager.save_daily_data_bulk([(_day(day), 10, 300.0, round(rng.uniform(40, 120), 2), 0.0, 0.0, '')
+                                       for day in range(150)])
+    data_manager.save_daily_data_bulk([(_day(day), 5, 100.0, 40.0, 0.0, 0.0, '') for day in range(30, 200)], store='分店')
+
+    cases = [(data_manager.load_computed_ledger(store=store), data_manager.load_stable_period_summary(payout_delay_days, store))
+             for store in data_manager.list_stores()]
+    cases.append((data_manager.load_consolidated_ledger(),
+                  data_manager.load_consolidated_stable_period_summary(payout_delay_days)))
+    for df_ledger, summary in cases:
+        assert summary['ledger_start'] == df_ledger['Date'].iloc[0]
+        expected = growth_predictor.analyze_growth(df_ledger, payout_delay_days)
+        prediction = growth_predictor.predict_next_increment(summary['stable_days'], summary['stable_net_cash_flow'],
+                                                             df_ledger.iloc[-1])
+        assert prediction['status'] == expected['status']
+        if expected['status'] == 'ok':
+            assert prediction['days_to_next_increment'] == pytest.approx(expected['days_to_next_increment'])
+            assert prediction['predicted_date_for_increment'] == expected['predicted_date_for_increment']
+
+
+def test_import_tables_checks_emptiness_under_the_write_lock(db_file):
+    data_manager.init_db()
+    df_daily = pd.DataFrame({'Date': pd.to_datetime(['2024-01-01', '2024-01-02']), 'Daily_Order_Count': [1, 2],
+                             'Total_Daily_Cost': [10.0, 20.0], 'Total_Daily_Profit': [2.0, 4.0],
+                             'Refunds_Received_Today': 0.0, 'Estimated_Profit_Loss_From_Refunds': 0.0,
+                             'Other_Income_Today': 0.0, 'Notes': None})
+    df_early = data_manager.load_all_early_payouts()
+
+    # 另一个连接正在写入：导入等它提交后才检查，看到已有数据就拒绝，不会把两份数据混在一起
+    writer = sqlite3.connect(str(db_file))
+    writer.execute("BEGIN IMMEDIATE")
+    writer.execute(f"INSERT INTO {data_manager.DAILY_TABLE} (Date, Daily_Order_Count, Total_Daily_Cost, Total_Daily_Profit) "
+                   "VALUES ('2023-12-31', 1, 5.0, 1.0)")
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        result = pool.submit(data_manager.import_tables, df_daily, df_early)
+        time.sleep(0.3)
+        assert not result.done()
+        writer.commit()
+        writer.close()
+        with pytest.raises(ValueError):
+            result.result(timeout=30)
+    assert list(data_manager.load_all_data()['Date']) == [pd.Timestamp('2023-12-31')]
+
+    data_manager.delete_data_by_date('2023-12-31')
+    assert data_manager.import_tables(df_daily, df_early) == {data_manager.DAILY_TABLE: 2, data_manager.EARLY_PAYOUT_TABLE: 0}
+    _assert_ledger_matches_full_recompute()
@@ -0,0 +1,185 @@
+# 向量化引擎与逐日循环参考实现的差分测试：随机生成的历史 (含日期空缺、提前回款、当天回款、来源未知的回款) 上两者结果一致。
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import business_calendar
+import finance_calculator
+import payout_schedule
+
+TOLERANCE = 1e-9
+
+
+def _random_history(seed, days=120, payouts=25):
+    rng = np.random.default_rng(seed)
+    dates = pd.date_range('2024-01-01', periods=days)
+    dates = dates[rng.random(days) > 0.15]  # 随机留出没有录入的日子
+    df_daily = pd.DataFrame({
+        'Date': dates,
+        'Daily_Order_Count': rng.integers(0, 40, len(dates)),
+        'Total_Daily_Cost': rng.uniform(0, 800, len(dates)).round(2),
+        'Total_Daily_Profit': rng.uniform(0, 200, len(dates)).round(2),
+        'Refunds_Received_Today': np.where(rng.random(len(dates)) < 0.2, rng.uniform(0, 50, len(dates)).round(2), 0.0),
+        'Estimated_Profit_Loss_From_Refunds': np.where(rng.random(len(dates)) < 0.2, rng.uniform(0, 10, len(dates)).round(2), 0.0),
+        'Other_Income_Today': np.where(rng.random(len(dates)) < 0.1, rng.uniform(0, 100, len(dates)).round(2), 0.0),
+        'Notes': None,
+    })
+    origins = pd.Series(rng.choice(dates, payouts))
+    payout_dates = origins + pd.to_timedelta(rng.integers(0, 20, payouts), unit='D')
+    payout_dates.iloc[:3] = origins.iloc[:3]  # 当天回款
+    origins = origins.where(rng.random(payouts) > 0.2)  # 来源未知
+    df_early = pd.DataFrame({
+        'payout_id': np.arange(1, payouts + 1),
+        'Payout_Date': payout_dates,
+        'Original_Order_Date': origins,
+        'Amount': rng.uniform(1, 300, payouts).round(2),
+    })
+    return df_daily, df_early
+
+
+def _assert_engines_match(df_daily, df_early, initial_cash=finance_calculator.INITIAL_CASH):
+    vectorized = finance_calculator.calculate_finances(df_daily, df_early, initial_cash=initial_cash)
+    loop = finance_calculator.calculate_finances(df_daily, df_early, engine=finance_calculator.ENGINE_LOOP,
+                                                 initial_cash=initial_cash)
+    assert list(vectorized['Date']) == list(loop['Date'])
+    np.testing.assert_allclose(vectorized[finance_calculator.COMPUTED_COLS].to_numpy(float),
+                               loop[finance_calculator.COMPUTED_COLS].to_numpy(float), rtol=0, atol=TOLERANCE)
+
+
+@pytest.mark.parametrize('seed', range(8))
+def test_engines_match_on_random_history(seed):
+    _assert_engines_match(*_random_history(seed), initial_cash=1000.0 * seed)
+
+
+def test_engines_match_without_early_payouts():
+    df_daily, df_early = _random_history(42)
+    _assert_engines_match(df_daily, df_early.iloc[0:0])
+
+
+def test_engines_match_with_payouts_outside_daily_range():
+    df_daily, df_early = _random_history(7, days=30, payouts=4)
+    df_early.loc[0, 'Payout_Date'] = df_daily['Date'].max() + pd.Timedelta(days=10)
+    df_early.loc[1, ['Payout_Date', 'Original_Order_Date']] = df_daily['Date'].min() - pd.Timedelta(days=3)
+    _assert_engines_match(df_daily, df_early)
+
+
+def test_engines_on_empty_input():
+    df_daily, df_early = _random_history(0)
+    for engine in (finance_calculator.ENGINE_VECTORIZED, finance_calculator.ENGINE_LOOP):
+        assert finance_calculator.calculate_finances(df_daily.iloc[0:0], df_early.iloc[0:0], engine=engine).empty
+
+
+def test_unknown_engine_is_rejected():
+    df_daily, df_early = _random_history(0)
+    with pytest.raises(ValueError):
+        finance_calculator.calculate_finances(df_daily, df_early, engine='gpu')
+
+
+def _cents_ledger(df_daily, df_early, kernel):
+    return finance_calculator.calculate_finances_cents(finance_calculator.compact_daily(df_daily),
+                                                       finance_calculator.compact_early_payouts(df_early), kernel=kernel)
+
+
+def test_cents_mode_conserves_spread_payouts():
+    # 7.50 元的应收款在第 10~20 天均匀回款：每天的回款不是整分，但到期后回款总额必须正好是 750 分
+    df_daily, df_early = _random_history(0)
+    df_daily = df_daily.iloc[:2].copy()
+    df_daily[finance_calculator.FILL_COLS] = 0.0
+    df_daily['Date'] = pd.to_datetime(['2024-01-01', '2024-01-31'])
+    df_daily.loc[0, ['Total_Daily_Cost', 'Total_Daily_Profit']] = [5.0, 2.5]
+    df_cents = _cents_ledger(df_daily, df_early.iloc[0:0], payout_schedule.uniform_kernel(10, 20))
+    assert df_cents['daily_actual_inflow'].sum() == 750
+    assert (df_cents['daily_actual_inflow'] >= 0).all()
+
+
+@pytest.mark.parametrize('seed', range(4))
+def test_cents_ledger_tracks_float_ledger_with_spread_kernel(seed):
+    df_daily, df_early = _random_history(seed)
+    kernel = payout_schedule.combine_channels([(0.6, payout_schedule.uniform_kernel(5, 18)),
+                                              (0.4, payout_schedule.normal_kernel(12, 3))])
+    df_float = finance_calculator.calculate_finances(df_daily, df_early, kernel=kernel)
+    df_yuan = finance_calculator.ledger_to_yuan(_cents_ledger(df_daily, df_early, kernel))
+    # 累计回款逐日四舍五入到分：余额与浮点账本相差不超过半分
+    np.testing.assert_allclose(df_yuan['bank_balance'], df_float['bank_balance'], rtol=0, atol=0.005 + TOLERANCE)
+
+
+def _random_edit(rng, df_daily, df_early, kernel):
+    """对历史做一次随机修改 (改一天、删一天、加一笔或删一笔提前回款)，返回修改后的数据和最早受影响的日期。"""
+    kind = rng.integers(4)
+    if kind == 0:
+        row = rng.integers(len(df_daily))
+        df_daily = df_daily.copy()
+        df_daily.loc[df_daily.index[row], ['Total_Daily_Cost', 'Total_Daily_Profit']] = rng.uniform(0, 500, 2).round(2)
+        return df_daily, df_early, df_daily['Date'].iloc[row]
+    if kind == 1:
+        row = rng.integers(len(df_daily))
+        return df_daily.drop(df_daily.index[row]), df_early, df_daily['Date'].iloc[row]
+    if kind == 2 or df_early.empty:
+        origin = df_daily['Date'].iloc[rng.integers(len(df_daily))]
+        payout = {'payout_id': df_early['payout_id'].max() + 1 if not df_early.empty else 1,
+                  'Payout_Date': origin + pd.Timedelta(days=int(rng.integers(0, 10))),
+                  'Original_Order_Date': origin, 'Amount': round(rng.uniform(1, 100), 2)}
+        df_early = pd.concat([df_early, pd.DataFrame([payout])], ignore_index=True)
+    else:
+        row = rng.integers(len(df_early))
+        payout = df_early.iloc[row]
+        df_early = df_early.drop(df_early.index[row]).reset_index(drop=True)
+    changed = finance_calculator.payout_change_date(payout['Payout_Date'], payout['Original_Order_Date'], kernel)
+    return df_daily, df_early, changed
+
+
+@pytest.mark.parametrize('kernel', [None, payout_schedule.uniform_kernel(4, 12)], ids=['fixed', 'spread'])
+@pytest.mark.parametrize('seed', range(3))
+def test_recalculate_from_matches_full_recompute_after_random_edits(seed, kernel):
+    rng = np.random.default_rng(100 + seed)
+    df_daily, df_early = _random_history(seed)
+    df_calculated = finance_calculator.calculate_finances(df_daily, df_early, kernel=kernel)
+    for _ in range(15):
+        df_daily, df_early, changed = _random_edit(rng, df_daily, df_early, kernel)
+        df_calculated = finance_calculator.recalculate_from(df_calculated, df_daily, df_early, changed, kernel=kernel)
+        expected = finance_calculator.calculate_finances(df_daily, df_early, kernel=kernel)
+        assert list(df_calculated['Date']) == list(expected['Date'])
+        np.testing.assert_allclose(df_calculated[finance_calculator.COMPUTED_COLS].to_numpy(float),
+                                   expected[finance_calculator.COMPUTED_COLS].to_numpy(float), rtol=0, atol=1e-6)
+
+
+@pytest.mark.parametrize('seed', range(4))
+def test_shift_kernel_matches_loop_engine(seed):
+    df_daily, df_early = _random_history(seed)
+    loop = finance_calculator.calculate_finances(df_daily, df_early, engine=finance_calculator.ENGINE_LOOP)
+    kernel = payout_schedule.fixed_kernel(finance_calculator.PAYOUT_DELAY_DAYS)
+    vectorized = finance_calculator.calculate_finances(df_daily, df_early, kernel=kernel)
+    np.testing.assert_allclose(vectorized[finance_calculator.COMPUTED_COLS].to_numpy(float),
+                               loop[finance_calculator.COMPUTED_COLS].to_numpy(float), rtol=0, atol=TOLERANCE)
+
+
+@pytest.mark.parametrize('sparse_terms', [payout_schedule.SPARSE_KERNEL_MAX_TERMS, 0], ids=['sparse', 'fft'])
+@pytest.mark.parametrize('kernel', [
+    payout_schedule.fixed_kernel(15),
+    payout_schedule.uniform_kernel(3, 12),
+    payout_schedule.combine_channels([(0.7, payout_schedule.normal_kernel(14, 3)), (0.3, payout_schedule.fixed_kernel(5))]),
+], ids=['shift', 'uniform', 'mixed'])
+def test_expected_inflows_matches_direct_convolution(monkeypatch, kernel, sparse_terms):
+    monkeypatch.setattr(payout_schedule, 'SPARSE_KERNEL_MAX_TERMS', sparse_terms)
+    receivable = np.random.default_rng(21).uniform(0, 500, (3, 200))
+    inflows = payout_schedule.expected_inflows(receivable, kernel)
+    for row, inflow in zip(receivable, inflows):
+        np.testing.assert_allclose(inflow, np.convolve(row, kernel)[:len(row)], rtol=0, atol=1e-9)
+        np.testing.assert_allclose(payout_schedule.expected_inflows(row, kernel), inflow, rtol=0, atol=1e-9)
+
+
+@pytest.mark.parametrize('with_calendar', [False, True], ids=['no-calendar', 'calendar'])
+@pytest.mark.parametrize('seed', range(4))
+def test_cents_ledger_equals_float_ledger_with_fixed_kernel(seed, with_calendar):
+    df_daily, df_early = _random_history(seed, days=400, payouts=60)
+    calendar = business_calendar.parse_calendar('2024-02-10~2024-02-17\n2024-10-01~2024-10-07\n') if with_calendar else None
+    df_float = finance_calculator.calculate_finances(df_daily, df_early, initial_cash=1234.56, calendar=calendar)
+    df_cents = finance_calculator.calculate_finances_cents(finance_calculator.compact_daily(df_daily),
+                                                           finance_calculator.compact_early_payouts(df_early),
+                                                           initial_cash=1234.56, calendar=calendar)
+    assert list(df_cents['Date']) == list(df_float['Date'])
+    for col in finance_calculator.COMPUTED_COLS:
+        assert df_cents[col].dtype == np.int64
+        # 固定回款周期下整数分账本是精确值，浮点账本四舍五入到分后与它逐日完全相同
+        np.testing.assert_array_equal(df_cents[col].to_numpy(), finance_calculator.to_cents(df_float[col]))
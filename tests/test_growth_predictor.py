@@ -0,0 +1,125 @@
+# 增长预测的测试：固定随机种子时模拟和增单计划可以复现，预测的余额与把未来的日子写进账本后算出的余额一致
+# (回款分布、营业日历和提前回款的处理都与 calculate_finances 相同，已提前收回的应收款不会再次到账)。
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import business_calendar
+import finance_calculator
+import growth_predictor
+import payout_schedule
+
+KERNEL = payout_schedule.combine_channels([(0.6, payout_schedule.uniform_kernel(3, 12)),
+                                           (0.4, payout_schedule.normal_kernel(16, 2))])
+CALENDAR = business_calendar.parse_calendar('2024-05-01~2024-05-05\n2024-06-10\n')
+
+
+def _history(days=120, orders=10, cost=30.0, profit=8.0, vary=False):
+    """截至 2024-04-29 的历史；vary=True 时每天的单量随机，否则每天相同。"""
+    dates = pd.date_range(end='2024-04-29', periods=days)
+    counts = np.random.default_rng(11).integers(5, 15, days) if vary else np.full(days, orders)
+    df_daily = pd.DataFrame({
+        'Date': dates, 'Daily_Order_Count': counts,
+        'Total_Daily_Cost': counts * cost, 'Total_Daily_Profit': counts * profit,
+        'Refunds_Received_Today': 0.0, 'Estimated_Profit_Loss_From_Refunds': 0.0, 'Other_Income_Today': 0.0, 'Notes': None,
+    })
+    # 最近几天的订单有一部分已经提前回款 (其中一笔来源未知)
+    df_early = pd.DataFrame({
+        'payout_id': [1, 2, 3, 4],
+        'Payout_Date': pd.to_datetime(['2024-04-20', '2024-04-26', '2024-04-28', '2024-04-29']),
+        'Original_Order_Date': pd.to_datetime(['2024-04-18', '2024-04-25', '2024-04-28', None]),
+        'Amount': [150.0, 200.0, 80.0, 60.0],
+    })
+    return df_daily, df_early
+
+
+def _extended_balances(df_daily, df_early, future_counts, cost, profit, calendar,
+                       initial_cash=finance_calculator.INITIAL_CASH):
+    """把未来每天的单量写进主数据后重新计算账本，返回未来这些天的银行余额。"""
+    future_dates = pd.date_range(df_daily['Date'].max() + pd.Timedelta(days=1), periods=len(future_counts))
+    df_future = pd.DataFrame({
+        'Date': future_dates, 'Daily_Order_Count': future_counts,
+        'Total_Daily_Cost': future_counts * cost, 'Total_Daily_Profit': future_counts * profit,
+        'Refunds_Received_Today': 0.0, 'Estimated_Profit_Loss_From_Refunds': 0.0, 'Other_Income_Today': 0.0, 'Notes': None,
+    })
+    df_ledger = finance_calculator.calculate_finances(pd.concat([df_daily, df_future], ignore_index=True), df_early,
+                                                      initial_cash=initial_cash, kernel=KERNEL, calendar=calendar)
+    return df_ledger.set_index('Date').loc[future_dates, 'bank_balance'].to_numpy()
+
+
+def _assert_same_result(first, second):
+    assert first.keys() == second.keys()
+    for key, value in first.items():
+        if isinstance(value, pd.DataFrame):
+            pd.testing.assert_frame_equal(value, second[key])
+        else:
+            assert value == second[key]
+
+
+@pytest.mark.parametrize('calendar', [None, CALENDAR], ids=['no-calendar', 'calendar'])
+def test_simulation_is_deterministic_for_a_fixed_seed(calendar):
+    df_daily, df_early = _history(vary=True)
+    df_ledger = finance_calculator.calculate_finances(df_daily, df_early, kernel=KERNEL, calendar=calendar)
+    runs = [growth_predictor.simulate_growth(df_ledger, KERNEL, n_paths=500, horizon_days=90, seed=7, calendar=calendar,
+                                             df_early_payouts=df_early) for _ in range(2)]
+    assert runs[0]['status'] == 'ok'
+    _assert_same_result(*runs)
+    other = growth_predictor.simulate_growth(df_ledger, KERNEL, n_paths=500, horizon_days=90, seed=8, calendar=calendar,
+                                             df_early_payouts=df_early)
+    assert not other['balance_percentiles'].equals(runs[0]['balance_percentiles'])
+
+
+@pytest.mark.parametrize('calendar', [None, CALENDAR], ids=['no-calendar', 'calendar'])
+def test_simulation_of_a_steady_history_matches_the_extended_ledger(calendar):
+    # 稳定期每天都相同时，所有路径都是同一条，且与把同样的日子写进账本的结果一致
+    df_daily, df_early = _history()
+    df_ledger = finance_calculator.calculate_finances(df_daily, df_early, kernel=KERNEL, calendar=calendar)
+    result = growth_predictor.simulate_growth(df_ledger, KERNEL, n_paths=20, horizon_days=60, seed=1, calendar=calendar,
+                                              df_early_payouts=df_early)
+    expected = _extended_balances(df_daily, df_early, np.full(60, 10), 30.0, 8.0, calendar)
+    for column in ('P10', 'P50', 'P90'):
+        np.testing.assert_allclose(result['balance_percentiles'][column], expected, rtol=0, atol=1e-6)
+
+
+@pytest.mark.parametrize('calendar', [None, CALENDAR], ids=['no-calendar', 'calendar'])
+def test_ramp_up_plan_is_deterministic_and_matches_the_extended_ledger(calendar):
+    df_daily, df_early = _history(orders=4)
+    df_ledger = finance_calculator.calculate_finances(df_daily, df_early, kernel=KERNEL, initial_cash=0.0, calendar=calendar)
+    plans = [growth_predictor.plan_order_ramp_up(df_ledger, KERNEL, months=3, min_balance=500.0, calendar=calendar,
+                                                 df_early_payouts=df_early) for _ in range(2)]
+    plan = plans[0]
+    assert plan['status'] == 'ok' and plan['final_order_count'] > plan['start_order_count']
+    _assert_same_result(*plans)
+
+    projection = plan['projection']
+    expected = _extended_balances(df_daily, df_early, projection['Daily_Order_Count'].to_numpy(),
+                                  plan['per_order_cost'], plan['per_order_profit'], calendar, initial_cash=0.0)
+    np.testing.assert_allclose(projection['bank_balance'], expected, rtol=0, atol=1e-6)
+    assert projection['bank_balance'].min() >= 500.0 - 1e-6
+
+
+def test_fixed_delay_can_be_given_as_days():
+    df_daily, df_early = _history()
+    df_ledger = finance_calculator.calculate_finances(df_daily, df_early)
+    by_days = growth_predictor.plan_order_ramp_up(df_ledger, finance_calculator.PAYOUT_DELAY_DAYS, df_early_payouts=df_early)
+    by_kernel = growth_predictor.plan_order_ramp_up(df_ledger, payout_schedule.fixed_kernel(finance_calculator.PAYOUT_DELAY_DAYS),
+                                                    df_early_payouts=df_early)
+    _assert_same_result(by_days, by_kernel)
+
+
+def test_forecasts_on_a_recent_window_keep_the_stable_period_cutoff():
+    df_daily, df_early = _history()
+    df_ledger = finance_calculator.calculate_finances(df_daily, df_early, kernel=KERNEL, calendar=CALENDAR)
+    ledger_start = df_ledger['Date'].iloc[0]
+    # 稳定期每天都相同，只用最近 60 天的账本也得到同样的计划和模拟
+    df_window = df_ledger.iloc[-60:]
+    options = {'calendar': CALENDAR, 'df_early_payouts': df_early}
+    _assert_same_result(growth_predictor.plan_order_ramp_up(df_window, KERNEL, ledger_start=ledger_start, **options),
+                        growth_predictor.plan_order_ramp_up(df_ledger, KERNEL, **options))
+    _assert_same_result(growth_predictor.simulate_growth(df_window, KERNEL, n_paths=50, seed=3, ledger_start=ledger_start,
+                                                         **options),
+                        growth_predictor.simulate_growth(df_ledger, KERNEL, n_paths=50, seed=3, **options))
+    # 窗口从账本首日开始时，稳定期仍然从最晚回款天数之后算起
+    assert growth_predictor.plan_order_ramp_up(df_ledger.iloc[:10], KERNEL, ledger_start=ledger_start,
+                                               **options)['status'] == 'calculating'
@@ -0,0 +1,90 @@
+# 操作日志的测试：逐步撤销和按历史时点回放都必须还原到当时的数据和账本。
+
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import data_manager
+import finance_calculator
+import journal
+
+
+class _FakeClock:
+    """代替 journal 中的 datetime：每次取当前时间都前进一分钟，让每个操作有不同的登记时间。"""
+
+    def __init__(self, start):
+        self.current = start
+
+    def now(self):
+        self.current += timedelta(minutes=1)
+        return self.current
+
+
+def _state():
+    """店铺当前的原始数据、期初资金和物化账本。"""
+    return (data_manager.load_all_data(), data_manager.load_all_early_payouts(), data_manager.load_orders(),
+            data_manager.get_store_initial_cash(), data_manager.load_computed_ledger())
+
+
+def _assert_same_state(actual, expected):
+    for actual_part, expected_part in zip(actual, expected):
+        if isinstance(expected_part, pd.DataFrame):
+            pd.testing.assert_frame_equal(actual_part.reset_index(drop=True), expected_part.reset_index(drop=True),
+                                          check_dtype=False)
+        else:
+            assert actual_part == expected_part
+
+
+def _assert_ledger_matches(df_ledger, expected):
+    assert list(df_ledger['Date']) == list(expected['Date'])
+    np.testing.assert_allclose(df_ledger[finance_calculator.COMPUTED_COLS].to_numpy(float),
+                               expected[finance_calculator.COMPUTED_COLS].to_numpy(float), rtol=0, atol=1e-6)
+
+
+def _operations():
+    """一串不同类型的写入操作。"""
+    return [
+        lambda: data_manager.save_daily_data('2024-01-01', 10, 300.0, 80.0, 0.0, 0.0, 0.0, '第一天'),
+        lambda: data_manager.save_daily_data_bulk([(f"2024-01-{day:02d}", day, 30.0 * day, 8.0 * day, 1.0, 0.2, '')
+                                                   for day in range(2, 25)]),
+        lambda: data_manager.save_orders('2024-01-05', [(12.0, 3.0), (40.0, 9.5)], 2.0, 0.5, 1.0, '逐单'),
+        lambda: data_manager.save_early_payout('2024-01-08', '2024-01-03', 50.0),
+        lambda: data_manager.save_daily_data('2024-01-03', 4, 100.0, 20.0, 0.0, 0.0, 15.0, '修改'),
+        lambda: data_manager.set_store_initial_cash(5000.0),
+        lambda: data_manager.delete_data_by_date('2024-01-01'),
+        lambda: data_manager.delete_early_payout_by_id(1),
+        lambda: data_manager.set_payout_channels([('平台A', 1.0, 'uniform', '3-9')]),
+        lambda: data_manager.save_daily_data('2024-02-01', 30, 900.0, 200.0, 0.0, 0.0, 0.0, ''),
+    ]
+
+
+@pytest.mark.parametrize('snapshot_interval', [journal.SNAPSHOT_INTERVAL, 3])
+def test_undo_and_as_of_replay_restore_earlier_state(db_file, monkeypatch, snapshot_interval):
+    clock = _FakeClock(datetime(2024, 6, 1, 9, 0, 0))
+    monkeypatch.setattr(journal, 'datetime', clock)
+    monkeypatch.setattr(journal, 'SNAPSHOT_INTERVAL', snapshot_interval)
+    data_manager.init_db()
+
+    states, times = [_state()], [clock.current]
+    for operation in _operations():
+        operation()
+        states.append(_state())
+        times.append(clock.current)
+
+    # 按历史时点回放：每个操作之后的时刻都得到当时的主数据和账本
+    for (df_daily, *_, df_ledger), as_of in zip(states[1:], times[1:]):
+        as_of = as_of.strftime(journal.TIMESTAMP_FORMAT)
+        pd.testing.assert_frame_equal(data_manager.load_data_as_of(as_of), df_daily, check_dtype=False)
+        _assert_ledger_matches(data_manager.compute_ledger_as_of(as_of), df_ledger)
+    assert data_manager.compute_ledger_as_of(times[0].strftime(journal.TIMESTAMP_FORMAT)).empty
+
+    # 逐步撤销：每次撤销都回到上一个操作之后的状态，账本与当时一致
+    for expected in reversed(states[:-1]):
+        assert data_manager.undo_last_operation() is not None
+        _assert_same_state(_state(), expected)
+    assert data_manager.undo_last_operation() is None
+
+    # 撤销本身也记入日志：回放到撤销之前的时刻仍然得到完整的数据
+    _assert_ledger_matches(data_manager.compute_ledger_as_of(times[-1].strftime(journal.TIMESTAMP_FORMAT)), states[-1][-1])
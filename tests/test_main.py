@@ -0,0 +1,58 @@
+# 命令行的测试：录入命令与本地接口使用同一套数值校验，无效数据不能写入数据库。
+
+import os
+import subprocess
+import sys
+
+import pytest
+
+import data_manager
+import main
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.mark.parametrize('argv', [
+    ['--orders', '-1', '--cost', '10', '--profit', '5'],
+    ['--orders', '2', '--cost', '-10', '--profit', '5'],
+    ['--orders', '2', '--cost', '10', '--profit', '-5'],
+    ['--orders', '2', '--cost', '10', '--profit', '5', '--refunds', '-1'],
+    ['--orders', '2', '--cost', '10', '--profit', '5', '--other-income', '-1'],
+    ['--orders', '2', '--cost', 'nan', '--profit', '5'],
+    ['--order', '-10', '5'],
+    ['--order', '10', '5', '--refunds', '-1'],
+])
+def test_add_rejects_invalid_values(db_file, capsys, argv):
+    assert main.main(['add', '2024-03-01', *argv]) == main.EXIT_ERROR
+    assert capsys.readouterr().err.startswith('错误:')
+    assert data_manager.load_all_data().empty
+
+
+def test_add_allows_loss_orders(db_file):
+    assert main.main(['add', '2024-03-01', '--order', '10', '5', '--order', '8', '-2']) == main.EXIT_OK
+    row = data_manager.load_all_data().iloc[0]
+    assert (row['Daily_Order_Count'], row['Total_Daily_Cost'], row['Total_Daily_Profit']) == (2, 18.0, 3.0)
+
+
+@pytest.mark.parametrize('amount', ['0', '-50', 'inf'])
+def test_add_payout_rejects_non_positive_amount(db_file, capsys, amount):
+    assert main.main(['add-payout', '2024-03-01', amount]) == main.EXIT_ERROR
+    assert '金额必须大于 0' in capsys.readouterr().err
+    assert data_manager.load_all_early_payouts().empty
+
+
+def test_closed_pipe_exits_quietly(tmp_path):
+    # 模拟 export | head：读端读到第一行就关闭，命令应静默退出而不是打印 "Broken pipe" 错误
+    script = ("import main\n"
+              "def endless_export(args):\n"
+              "    while True:\n"
+              "        print('2024-01-01,3,30.0,10.0')\n"
+              "main.cmd_export = endless_export\n"
+              "raise SystemExit(main.main(['export']))\n")
+    proc = subprocess.Popen([sys.executable, '-c', script], cwd=tmp_path, env={**os.environ, 'PYTHONPATH': ROOT},
+                            stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    assert proc.stdout.readline() == b'2024-01-01,3,30.0,10.0\n'
+    proc.stdout.close()
+    assert proc.wait(timeout=30) == main.EXIT_OK
+    assert proc.stderr.read() == b''
+    proc.stderr.close()
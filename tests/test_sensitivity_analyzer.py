@@ -0,0 +1,79 @@
+# 敏感性分析的测试：批量计算的网格与逐点用账本引擎和 analyze_growth 重新计算的结果一致。
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import finance_calculator
+import growth_predictor
+import payout_schedule
+import sensitivity_analyzer
+
+
+def _history(seed, days=90, payouts=12):
+    rng = np.random.default_rng(seed)
+    dates = pd.date_range('2024-03-01', periods=days)
+    dates = dates[rng.random(days) > 0.1]
+    df_daily = pd.DataFrame({
+        'Date': dates,
+        'Daily_Order_Count': rng.integers(0, 30, len(dates)),
+        'Total_Daily_Cost': rng.uniform(100, 600, len(dates)).round(2),
+        'Total_Daily_Profit': rng.uniform(50, 250, len(dates)).round(2),
+        'Refunds_Received_Today': np.where(rng.random(len(dates)) < 0.3, rng.uniform(0, 80, len(dates)).round(2), 0.0),
+        'Estimated_Profit_Loss_From_Refunds': 0.0,
+        'Other_Income_Today': np.where(rng.random(len(dates)) < 0.1, rng.uniform(0, 100, len(dates)).round(2), 0.0),
+        'Notes': None,
+    })
+    origins = pd.Series(rng.choice(dates, payouts))
+    df_early = pd.DataFrame({
+        'payout_id': np.arange(1, payouts + 1),
+        'Payout_Date': origins + pd.to_timedelta(rng.integers(0, 10, payouts), unit='D'),
+        'Original_Order_Date': origins.where(rng.random(payouts) > 0.25),
+        'Amount': rng.uniform(10, 200, payouts).round(2),
+    })
+    return df_daily, df_early
+
+
+def _brute_force(df_daily, df_early, params, monkeypatch):
+    """按一组参数直接计算账本和增长预测，得到各项指标。"""
+    delay = int(round(params['payout_delay_days']))
+    df_daily = df_daily.assign(Estimated_Profit_Loss_From_Refunds=params['profit_margin'] * df_daily['Refunds_Received_Today'])
+    df_ledger = finance_calculator.calculate_finances(df_daily, df_early, initial_cash=params['initial_cash'],
+                                                      kernel=payout_schedule.fixed_kernel(delay))
+    monkeypatch.setattr(growth_predictor, 'INCREMENT_ORDER_BUFFER_PER_UNIT', params['increment_buffer'])
+    prediction = growth_predictor.analyze_growth(df_ledger, delay)
+    return {
+        'final_balance': df_ledger['bank_balance'].iloc[-1],
+        'min_balance': df_ledger['bank_balance'].min(),
+        'final_cumulative_profit': df_ledger['cumulative_profit'].iloc[-1],
+        'days_to_next_increment': prediction['days_to_next_increment'] if prediction['status'] == 'ok' else np.nan,
+    }
+
+
+@pytest.mark.parametrize('x_param, x_values, y_param, y_values', [
+    ('payout_delay_days', [0, 1, 7, 15, 33, 95], 'initial_cash', [0.0, 5000.0]),
+    ('profit_margin', [0.0, 0.25, 0.6], 'payout_delay_days', [3, 20, 60]),
+    ('increment_buffer', [300.0, 900.0], 'payout_delay_days', [10, 45]),
+])
+@pytest.mark.parametrize('seed', range(2))
+def test_grid_matches_brute_force(monkeypatch, seed, x_param, x_values, y_param, y_values):
+    df_daily, df_early = _history(seed)
+    fixed = {'initial_cash': 2500.0, 'profit_margin': 0.3, 'increment_buffer': 1200.0, 'payout_delay_days': 12}
+    grid = sensitivity_analyzer.sensitivity_grid(sensitivity_analyzer.prepare_inputs(df_daily, df_early),
+                                                 x_param, x_values, y_param, y_values, fixed)
+    for i, y in enumerate(y_values):
+        for j, x in enumerate(x_values):
+            expected = _brute_force(df_daily, df_early, {**fixed, x_param: x, y_param: y}, monkeypatch)
+            for metric in sensitivity_analyzer.METRICS:
+                np.testing.assert_allclose(grid[metric][i, j], expected[metric], rtol=1e-9, atol=1e-6,
+                                           err_msg=f"{metric} at {x_param}={x}, {y_param}={y}")
+
+
+def test_axis_values_rounds_payout_delays():
+    assert list(sensitivity_analyzer.axis_values('payout_delay_days', 1, 5, 9)) == [1, 2, 3, 4, 5]
+    assert len(sensitivity_analyzer.axis_values('initial_cash', 0.0, 100.0, 7)) == 7
+
+
+def test_prepare_inputs_without_data():
+    df_daily, df_early = _history(0)
+    assert sensitivity_analyzer.prepare_inputs(df_daily.iloc[0:0], df_early.iloc[0:0]) == {}